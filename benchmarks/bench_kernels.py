@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmarks of the aggregation and change metric kernels.
+
+Every function of :mod:`mynbou.aggregation` is run on lists of 1 to 10^6 integers, floats and floats with NaN values,
+the Fraction based aggregations in both precision modes. The change metrics hassan, moser and dambros are run on every
+combination of number of files, changes per file and window sizes.
+
+For every case the time per call, the throughput (values or changes per second) and the peak memory allocated during one call (tracemalloc) are reported.
+Kernels whose single call takes longer than --max-seconds are not run for larger sizes.
+
+The results can be stored with --output. With --baseline the results are compared to stored results of a previous version,
+every case which is slower or allocates more than --threshold times the baseline is reported and the exit code is 1.
+
+Usage: python -m benchmarks.bench_kernels [--max-exponent 6] [--output results.json] [--baseline results.json --threshold 1.5]
+"""
+
+import sys
+import json
+import math
+import random
+import timeit
+import argparse
+import platform
+import functools
+import tracemalloc
+
+from mynbou import aggregation
+from mynbou.metrics.change import hassan, moser, dambros
+from mynbou.checkpoint import code_version
+
+
+def _batch(values, list_size=10):
+    """aggregate_batch on the values split into lists of list_size values."""
+    offsets = list(range(0, len(values), list_size)) + [len(values)]
+    return aggregation.aggregate_batch(values, offsets)
+
+
+def _aggregation_kernels():
+    kernels = [('msum', aggregation.msum), ('exact_sum', aggregation.exact_sum)]
+    for name in ['mean', 'median', 'stddev', 'cov', 'gini', 'hoover', 'atkinson', 'shannon_entropy', 'generalized_entropy', 'theil', 'aggregate_all']:
+        func = getattr(aggregation, name)
+        kernels.append((name, func))
+        if name in ['hoover', 'shannon_entropy', 'generalized_entropy', 'theil', 'aggregate_all']:
+            kernels.append((name + '_fast', functools.partial(func, precision='fast')))
+    kernels.append(('aggregate_batch', _batch))
+    return kernels
+
+
+def _values(kind, size, rnd):
+    if kind == 'int':
+        return [rnd.randint(0, 1000) for _ in range(size)]
+    values = [rnd.expovariate(0.01) for _ in range(size)]
+    if kind == 'nan':
+        for i in range(0, size, 100):
+            values[i] = math.nan
+    return values
+
+
+def _instances(files, events, rnd):
+    """Change lists of the files, every file has the given number of changes within the last 6 months."""
+    instances = {}
+    for f in range(files):
+        days = sorted(rnd.randint(0, 180) for _ in range(events))
+        instances['F{}.java'.format(f)] = {'days_from_release': days, 'ages': [180 - d for d in days], 'age': 400,
+                                           'lines_added': [rnd.randint(0, 50) for _ in range(events)], 'lines_deleted': [rnd.randint(0, 30) for _ in range(events)],
+                                           'changesets': [rnd.randint(1, 20) for _ in range(events)], 'revisions': ['r{}'.format(rnd.randint(0, files * events)) for _ in range(events)],
+                                           'authors': ['a{}'.format(rnd.randint(0, 20)) for _ in range(events)], 'commit_messages': [rnd.choice(['fix bug', 'refactor', 'add feature']) for _ in range(events)]}
+    return instances
+
+
+def _deltas(instances, samples, rnd):
+    """D'Ambros delta matrix with the given number of samples per file, -1 marks files missing in a sample."""
+    metrics = ['wmc', 'dit', 'rfc', 'noc', 'cbo', 'lcom5', 'nii', 'noi', 'tna', 'tnpa', 'tloc', 'tnm', 'tnlpm']
+    return {m: {file: [rnd.choice([-1, 0, 0, rnd.randint(1, 10)]) for _ in range(samples)] for file in instances.keys()} for m in metrics}
+
+
+def measure(func, count, repeat, min_time):
+    """Time per call (best of the repetitions) and peak allocated memory of one call.
+
+    :param func: function without arguments
+    :param int count: number of processed values per call, for the throughput
+    :param int repeat: number of repetitions
+    :param float min_time: minimal time of a repetition, the function is called as often as needed
+    :rtype: dict
+    """
+    timer = timeit.Timer(func)
+    first = timer.timeit(number=1)
+
+    tracemalloc.start()
+    func()
+    alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    number = max(1, int(min_time / first)) if first else 1000
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {'seconds': seconds, 'throughput': count / seconds if seconds else float('inf'), 'alloc_peak_kb': alloc / 1024}
+
+
+def _run(results, kernel, case, count, func, args):
+    if args.only and args.only not in kernel:
+        return None
+    result = dict(kernel=kernel, case=case, **measure(func, count, args.repeat, args.min_time))
+    results.append(result)
+    print('{:<26} {:<28} {:>13.3e}s {:>13.3e}/s {:>12.1f}KB'.format(kernel, case, result['seconds'], result['throughput'], result['alloc_peak_kb']))
+    sys.stdout.flush()
+    return result
+
+
+def run(args):
+    """Run every kernel.
+
+    :rtype: list
+    """
+    results = []
+    print('{:<26} {:<28} {:>14} {:>15} {:>14}'.format('kernel', 'case', 'time', 'throughput', 'allocated'))
+
+    for kind in ['int', 'float', 'nan']:
+        # every case has its own seed so that the inputs do not depend on the other cases
+        inputs = {size: _values(kind, size, random.Random('{}-{}-{}'.format(args.seed, kind, size))) for size in [10 ** e for e in range(args.max_exponent + 1)]}
+        for kernel, func in _aggregation_kernels():
+            for size, values in sorted(inputs.items()):
+                result = _run(results, kernel, '{} n={}'.format(kind, size), size, functools.partial(func, values), args)
+                if result is not None and result['seconds'] > args.max_seconds:
+                    break
+
+    windows = [[int(size) for size in w.split(',')] for w in args.windows.split(';')]
+    for files in [int(f) for f in args.files.split(',')]:
+        for events in [int(e) for e in args.events.split(',')]:
+            rnd = random.Random('{}-{}-{}'.format(args.seed, files, events))
+            instances = _instances(files, events, rnd)
+            for window in windows:
+                window_size_days = window if len(window) > 1 else window[0]
+                _run(results, 'hassan', 'files={} events={} windows={}'.format(files, events, len(window)), files * events, functools.partial(hassan, instances, window_size_days), args)
+            _run(results, 'moser', 'files={} events={}'.format(files, events), files * events, functools.partial(moser, instances), args)
+            _run(results, 'dambros', 'files={} samples={}'.format(files, events), files * events, functools.partial(dambros, instances, _deltas(instances, events, rnd)), args)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Cases which are slower or allocate more than threshold times the baseline.
+
+    Allocations below 64KB are not compared as they are dominated by noise.
+
+    :param list results: current results
+    :param list baseline: results of the baseline
+    :param float threshold: allowed factor
+    :rtype: list
+    :returns: list of tuples (kernel, case, measurement, baseline value, current value)
+    """
+    old = {(result['kernel'], result['case']): result for result in baseline}
+    ret = []
+    for result in results:
+        before = old.get((result['kernel'], result['case']))
+        if before is None:
+            continue
+        if result['seconds'] > threshold * before['seconds']:
+            ret.append((result['kernel'], result['case'], 'seconds', before['seconds'], result['seconds']))
+        if max(result['alloc_peak_kb'], before['alloc_peak_kb']) >= 64 and result['alloc_peak_kb'] > threshold * before['alloc_peak_kb']:
+            ret.append((result['kernel'], result['case'], 'alloc_peak_kb', before['alloc_peak_kb'], result['alloc_peak_kb']))
+    return ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the aggregation and change metric kernels.')
+    parser.add_argument('--max-exponent', type=int, default=6, help='largest list size for the aggregations as power of 10, default 6')
+    parser.add_argument('--max-seconds', type=float, default=1.0, help='larger sizes of a kernel are skipped once a call takes longer, default 1.0')
+    parser.add_argument('--files', default='10,100,1000', help='comma separated numbers of files for the change metrics, default 10,100,1000')
+    parser.add_argument('--events', default='10,100', help='comma separated numbers of changes per file for the change metrics, default 10,100')
+    parser.add_argument('--windows', default='14;7,14,30,90', help='semicolon separated window size lists for hassan, default 14;7,14,30,90')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing repetitions, the minimum is reported, default 3')
+    parser.add_argument('--min-time', type=float, default=0.05, help='minimal time of a timing repetition in seconds, default 0.05')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the inputs, default 1')
+    parser.add_argument('--only', default=None, help='only run kernels whose name contains this string')
+    parser.add_argument('--output', default=None, help='file for the results as JSON')
+    parser.add_argument('--baseline', default=None, help='results of a previous version, regressions are reported and the exit code is 1')
+    parser.add_argument('--threshold', type=float, default=1.5, help='allowed factor of time and allocations compared to the baseline, default 1.5')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': code_version(), 'python': platform.python_version(), 'parameters': vars(args), 'results': results}, f, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            found = regressions(results, json.load(f)['results'], args.threshold)
+        for kernel, case, measurement, before, after in found:
+            print('REGRESSION {} {} {}: {:.3e} -> {:.3e} ({:.2f}x)'.format(kernel, case, measurement, before, after, after / before))
+        if found:
+            sys.exit(1)
+        print('no regressions above {:.2f}x'.format(args.threshold))
+
+
+if __name__ == '__main__':
+    main()
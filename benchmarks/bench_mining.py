@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""End-to-end benchmark of the Mynbou stages on synthetic projects of growing size.
+
+For every number of commits a synthetic project is generated (see :mod:`benchmarks.synthetic`) and a release is mined with an active
+:class:`mynbou.instrumentation.Report`, the wall time, CPU time and MongoDB queries of every stage are stored as JSON.
+A result file of another version can be given to print the change of every stage.
+
+By default the projects are generated in mongomock, a MongoDB server can be used with --host (the database is dropped before every size).
+
+Usage: python -m benchmarks.bench_mining [--sizes 100,200,400] [--output results.json] [--compare baseline.json]
+"""
+
+import sys
+import json
+import argparse
+import platform
+
+import mongoengine
+
+from mynbou import instrumentation
+from mynbou.core import Mynbou
+from mynbou.checkpoint import code_version
+
+from benchmarks.synthetic import generate_project
+
+
+def _connect(host, size):
+    database = 'mynbou_bench_{}'.format(size)
+    mongoengine.connection.disconnect()
+    mongoengine.connect(database, host=host)
+    mongoengine.connection.get_db().client.drop_database(database)
+
+
+def _stages(report):
+    """Measurements per stage path, stages which are run more than once are summed."""
+    ret = {}
+    for entry in report.stages:
+        stage = ret.setdefault(entry['path'], {'wall_time': 0.0, 'cpu_time': 0.0, 'queries': 0, 'documents': 0})
+        stage['wall_time'] += entry['wall_time']
+        stage['cpu_time'] += entry['cpu_time']
+        stage['queries'] += sum(m['queries'] for m in entry['mongo'].values())
+        stage['documents'] += sum(m['documents'] for m in entry['mongo'].values())
+    return ret
+
+
+def run(size, args):
+    """Generate the project for the number of commits and mine its release, the best run of the repetitions is kept per stage.
+
+    :rtype: dict
+    """
+    _connect(args.host, size)
+    project = generate_project(commits=size, merge_rate=args.merge_rate, files=max(1, int(size * args.files_per_commit)), rename_rate=args.rename_rate,
+                               issues=max(1, int(size * args.issues_per_commit)), inducing_rate=args.inducing_rate, seed=args.seed)
+
+    best = None
+    for _ in range(args.repeat):
+        report = instrumentation.Report().start()
+        try:
+            with instrumentation.stage('total'):
+                m = Mynbou(project['vcs'], project['project_name'], project['release_hash'])
+                instances, _ = m.release(args.type)
+        finally:
+            report.stop()
+
+        stages = _stages(report)
+        if best is None:
+            best = stages
+        else:
+            for path, stage in stages.items():
+                if stage['wall_time'] < best[path]['wall_time']:
+                    best[path] = stage
+
+    return {'commits': size, 'counts': project['counts'], 'instances': len(instances), 'stages': best}
+
+
+def compare(results, baseline):
+    """Print the wall time of every stage of both versions and the ratio (new / old)."""
+    old = {result['commits']: result for result in baseline['results']}
+    print('comparing version {} with {}'.format(results['version'][:12], baseline['version'][:12]))
+    print('{:>8} {:<50} {:>11} {:>11} {:>7}'.format('commits', 'stage', 'old', 'new', 'ratio'))
+    for result in results['results']:
+        if result['commits'] not in old:
+            continue
+        for path, stage in sorted(result['stages'].items()):
+            if path not in old[result['commits']]['stages']:
+                continue
+            before = old[result['commits']]['stages'][path]['wall_time']
+            ratio = stage['wall_time'] / before if before else float('inf')
+            print('{:>8} {:<50} {:>10.4f}s {:>10.4f}s {:>6.2f}x'.format(result['commits'], path, before, stage['wall_time'], ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Mynbou stages on synthetic projects.')
+    parser.add_argument('--sizes', default='100,200,400', help='comma separated numbers of commits before the release, default 100,200,400')
+    parser.add_argument('--files-per-commit', type=float, default=0.25, help='number of files relative to the number of commits, default 0.25')
+    parser.add_argument('--issues-per-commit', type=float, default=0.1, help='number of bug issues relative to the number of commits, default 0.1')
+    parser.add_argument('--merge-rate', type=float, default=0.1, help='probability of branches and merges, default 0.1')
+    parser.add_argument('--rename-rate', type=float, default=0.05, help='probability that a commit renames a file, default 0.05')
+    parser.add_argument('--inducing-rate', type=float, default=0.5, help='probability that a bug fix has a bug-inducing change, default 0.5')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the generator, default 1')
+    parser.add_argument('--type', default='False', help='type of bug-fixing commits (False, JL+R, SZZ), default False')
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs per size, the fastest run is reported per stage, default 1')
+    parser.add_argument('--host', default='mongomock://localhost', help='MongoDB host, default mongomock://localhost')
+    parser.add_argument('--output', default=None, help='file for the results as JSON')
+    parser.add_argument('--compare', default=None, help='results of another version to compare with')
+    args = parser.parse_args()
+
+    # queries can only be counted with a real MongoDB server
+    if not args.host.startswith('mongomock://'):
+        instrumentation.register_command_counter()
+
+    results = {'version': code_version(), 'python': platform.python_version(), 'parameters': vars(args), 'results': []}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        result = run(size, args)
+        results['results'].append(result)
+        print('{:>8} commits {:>6} instances {:>10.4f}s'.format(size, result['instances'], result['stages']['total']['wall_time']))
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the exact summation kernels.
+
+Compares :func:`mynbou.aggregation.msum` with :func:`mynbou.aggregation.exact_sum` on lists and NumPy arrays from 10 to 10^6 elements.
+For every size the results of both kernels are checked against the exact rational sum and the runtime and speedup are printed.
+
+Usage: python -m benchmarks.bench_summation [--max-exponent 6] [--repeat 3]
+"""
+
+import argparse
+import random
+import timeit
+from fractions import Fraction
+
+import numpy as np
+
+from mynbou.aggregation import msum, exact_sum
+
+
+def _inputs(size, rnd):
+    """Value lists similar to what the aggregations see: counts, sorted metric values and mixed magnitudes."""
+    yield 'ints', [rnd.randint(0, 1000) for _ in range(size)]
+    yield 'sorted floats', sorted(rnd.expovariate(0.01) for _ in range(size))
+    yield 'mixed floats', [rnd.random() * 10 ** rnd.randint(-10, 10) * rnd.choice([1, -1]) for _ in range(size)]
+
+
+def _time(func, values, repeat):
+    number = max(1, 10000 // len(values))
+    return min(timeit.repeat(lambda: func(values), number=number, repeat=repeat)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark msum against exact_sum.')
+    parser.add_argument('--max-exponent', type=int, default=6, help='largest list size as power of 10, default 6')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing repetitions, the minimum is reported, default 3')
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    print('{:>8} {:>14} {:>6} {:>12} {:>12} {:>12} {:>9} {:>9}'.format('size', 'input', 'equal', 'msum', 'exact_sum', 'ndarray', 'speedup', 'ndarray'))
+    for exponent in range(1, args.max_exponent + 1):
+        size = 10 ** exponent
+        for name, values in _inputs(size, rnd):
+            array = np.asarray(values, dtype=np.float64)
+            exact = float(sum(map(Fraction, values), Fraction(0)))
+            result = exact_sum(values)
+            equal = result == msum(values) and result == exact_sum(array) and result == exact
+
+            t_msum = _time(msum, values, args.repeat)
+            t_exact = _time(exact_sum, values, args.repeat)
+            t_array = _time(exact_sum, array, args.repeat)
+            print('{:>8} {:>14} {:>6} {:>11.6f}s {:>11.6f}s {:>11.6f}s {:>8.1f}x {:>8.1f}x'.format(size, name, str(equal), t_msum, t_exact, t_array, t_msum / t_exact, t_msum / t_array))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the commit graph traversals on graphs of different shapes and sizes.
+
+The graphs are generated with :mod:`benchmarks.dags`. For every shape and number of commits the following traversals are measured:
+ - bfs_paths: :meth:`mynbou.path.OntdekBaan._bfs_paths` backward from the head
+ - origin_paths: :meth:`mynbou.path.Volg._origin_paths`, i.e., every path from the head back to the root
+ - current_files: :meth:`mynbou.path.Volg.calc_current_files` from a commit at 80% of the history (the release) to the head (a bug fix),
+   the renames of every commit are cached beforehand so that no database is needed
+
+For every traversal the time, the number of paths, the number of nodes in all paths (for current_files the number of shortest paths and their length)
+and the peak allocated memory (tracemalloc) are reported.
+Traversals which take longer than --max-seconds are not run for larger sizes of the same shape,
+current_files is not run if it would enumerate more than --max-paths shortest paths.
+
+Usage: python -m benchmarks.bench_traversal [--sizes 100,1000,10000] [--shapes linear,feature_branches,octopus,release_branches] [--output results.json]
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import tracemalloc
+from types import SimpleNamespace
+
+import networkx as nx
+
+from mynbou.path import OntdekBaan, Volg
+from mynbou.checkpoint import code_version
+
+from benchmarks.dags import SHAPES, generate_dag
+
+
+def _volg():
+    """Volg without database access, only the traversal methods are used."""
+    v = Volg.__new__(Volg)
+    v._vcs = SimpleNamespace(id=None)
+    return v
+
+
+def bfs_paths(graph, head, max_paths):
+    o = OntdekBaan(graph)
+
+    def summary(paths):
+        return len(paths), sum(len(path) for path in paths.values())
+    return lambda: o._bfs_paths(head, o._graph.predecessors, None), summary
+
+
+def origin_paths(graph, head, max_paths):
+    v = _volg()
+
+    def summary(paths):
+        return len(paths), sum(len(path) for path in paths)
+    return lambda: v._origin_paths(graph, head), summary
+
+
+def current_files(graph, head, max_paths):
+    # the release is the commit at 80% of the main branch, the main branch follows the first parents from the head
+    main = [head]
+    for parent in iter(lambda: next(iter(graph.predecessors(main[-1])), None), None):
+        main.append(parent)
+    release = main[len(main) // 5]
+
+    v = _volg()
+    rename_cache = {node: ([], []) for node in graph.nodes()}
+    undirected = graph.to_undirected(as_view=True)
+
+    # calc_current_files keeps every shortest path between release and bug fix in memory, their number grows exponentially with the merges
+    num_paths = sum(1 for _ in itertools.islice(nx.all_shortest_paths(undirected, release, head), max_paths + 1))
+    if num_paths > max_paths:
+        return None
+
+    def summary(result):
+        return num_paths, len(nx.shortest_path(undirected, release, head))
+    return lambda: v.calc_current_files(SimpleNamespace(revision_hash=head), SimpleNamespace(revision_hash=release), graph, undirected, rename_cache, {'A.java'}), summary
+
+
+# traversals, every function prepares the traversal of the graph and returns it together with a function which summarizes its result as number of paths and nodes,
+# None if the traversal would enumerate more than max_paths paths
+TRAVERSALS = [('bfs_paths', bfs_paths), ('origin_paths', origin_paths), ('current_files', current_files)]
+
+
+def measure(prepare, graph, head, max_paths):
+    """Time, number of paths and nodes and peak allocated memory of the traversal, the time is measured without tracemalloc.
+
+    :rtype: dict
+    :returns: the measurements or None if the traversal is not run because it would enumerate more than max_paths paths
+    """
+    prepared = prepare(graph, head, max_paths)
+    if prepared is None:
+        return None
+    func, summary = prepared
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    paths, nodes = summary(result)
+
+    tracemalloc.start()
+    func()
+    alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'paths': paths, 'nodes': nodes, 'alloc_peak_kb': alloc / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the commit graph traversals on different DAG shapes.')
+    parser.add_argument('--sizes', default='100,1000,10000', help='comma separated numbers of commits, default 100,1000,10000')
+    parser.add_argument('--shapes', default=','.join(SHAPES), help='comma separated shapes, default {}'.format(','.join(SHAPES)))
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='larger sizes of a traversal and shape are skipped once it takes longer, default 10')
+    parser.add_argument('--max-paths', type=int, default=100000, help='traversals which would enumerate more paths are skipped, default 100000')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the graphs, default 1')
+    parser.add_argument('--output', default=None, help='file for the results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    print('{:<17} {:>7} {:>7} {:<14} {:>11} {:>9} {:>10} {:>12}'.format('shape', 'commits', 'merges', 'traversal', 'time', 'paths', 'nodes', 'allocated'))
+    for shape in args.shapes.split(','):
+        skipped = set()
+        for size in [int(size) for size in args.sizes.split(',')]:
+            graph, head = generate_dag(shape, size, args.seed)
+            merges = sum(1 for node in graph if graph.in_degree(node) > 1)
+            for name, func in TRAVERSALS:
+                if name in skipped:
+                    continue
+                measurements = measure(func, graph, head, args.max_paths)
+                if measurements is None:
+                    print('{:<17} {:>7} {:>7} {:<14} more than {} paths, skipped'.format(shape, len(graph), merges, name, args.max_paths))
+                    skipped.add(name)
+                    continue
+                result = dict(shape=shape, commits=len(graph), merges=merges, traversal=name, **measurements)
+                results.append(result)
+                print('{:<17} {:>7} {:>7} {:<14} {:>10.4f}s {:>9} {:>10} {:>10.1f}KB'.format(shape, len(graph), merges, name, result['seconds'], result['paths'], result['nodes'], result['alloc_peak_kb']))
+                sys.stdout.flush()
+                if result['seconds'] > args.max_seconds:
+                    skipped.add(name)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': code_version(), 'parameters': vars(args), 'results': results}, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generator for commit graphs of typical shapes.
+
+The graphs have the same structure as the graph of :meth:`mynbou.core.Mynbou.load_graph`, i.e., a networkx DiGraph with revision hashes as nodes and edges from parent to child.
+Every graph has a single root and a single head, the commits are named c0, c1, ... in the order they are created.
+
+The shapes are:
+ - linear: every commit has one parent
+ - feature_branches: short feature branches fork from the main branch and are merged back with a merge commit
+ - octopus: several feature branches are merged at once with one merge commit with more than two parents
+ - release_branches: long-lived release branches receive fixes which are regularly merged forward into the main branch
+"""
+
+import random
+
+import networkx as nx
+
+
+SHAPES = ['linear', 'feature_branches', 'octopus', 'release_branches']
+
+
+class _Builder(object):
+
+    def __init__(self):
+        self.graph = nx.DiGraph()
+
+    def commit(self, *parents):
+        node = 'c{}'.format(len(self.graph))
+        self.graph.add_node(node)
+        for parent in parents:
+            self.graph.add_edge(parent, node)
+        return node
+
+
+def generate_dag(shape, commits, seed=1, branch_length=5, branch_rate=0.2, octopus_size=4, release_every=200, merge_every=10):
+    """Generate a commit graph of the given shape.
+
+    :param str shape: one of :data:`SHAPES`
+    :param int commits: approximate number of commits, the graph is grown until it has at least this many commits
+    :param int seed: seed of the random generator
+    :param int branch_length: maximum number of commits of a feature branch
+    :param float branch_rate: probability that a commit on the main branch starts a feature branch
+    :param int octopus_size: number of feature branches of an octopus merge
+    :param int release_every: number of commits on the main branch between two release branches
+    :param int merge_every: number of commits on a release branch after which it is merged into the main branch
+    :rtype: tuple
+    :returns: the graph and its head
+    """
+    if shape not in SHAPES:
+        raise Exception('Unknown DAG shape {}'.format(shape))
+
+    rnd = random.Random(seed)
+    b = _Builder()
+    head = b.commit()
+
+    def feature(base):
+        tip = base
+        for _ in range(rnd.randint(1, branch_length)):
+            tip = b.commit(tip)
+        return tip
+
+    releases = []
+    main_commits = 0
+    while len(b.graph) < commits:
+        if shape == 'linear':
+            head = b.commit(head)
+
+        elif shape == 'feature_branches':
+            base = head
+            head = b.commit(head)
+            if rnd.random() < branch_rate:
+                head = b.commit(head, feature(base))
+
+        elif shape == 'octopus':
+            base = head
+            head = b.commit(head)
+            if rnd.random() < branch_rate:
+                tips = [feature(base) for _ in range(octopus_size)]
+                head = b.commit(head, *tips)
+
+        elif shape == 'release_branches':
+            head = b.commit(head)
+            main_commits += 1
+            if main_commits % release_every == 0:
+                releases.append([head, 0])
+
+            # fixes on the release branches are merged forward
+            for release in releases:
+                if rnd.random() < branch_rate:
+                    release[0] = b.commit(release[0])
+                    release[1] += 1
+                    if release[1] % merge_every == 0:
+                        head = b.commit(head, release[0])
+
+    # a single head, open branches are merged
+    open_tips = [node for node in b.graph if b.graph.out_degree(node) == 0 and node != head]
+    if open_tips:
+        head = b.commit(head, *open_tips)
+    return b.graph, head
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Generator for synthetic SmartSHARK project databases.
+
+The generated project has the documents Mynbou reads for a release: a commit DAG with branches and merges, files with additions,
+modifications and renames, hunks, refactorings, change type classifications, linked issues, code entity states with metrics
+for the release (and periodically for earlier commits for the D'Ambros samples), package metrics and bug-fixing commits after
+the release with bug-inducing links to earlier file actions.
+
+The documents are written with the current mongoengine connection, e.g., mongomock for tests or a MongoDB server for benchmarks.
+The same seed and parameters always produce the same commits, files, issues and links (only the ObjectIds differ).
+"""
+
+import math
+import random
+import hashlib
+import datetime
+
+from pycoshark.mongomodels import People, Project, VCSSystem, IssueSystem, Issue, Commit, File, FileAction, Hunk, Refactoring, CodeEntityState, CodeGroupState, CommitChanges
+from bson.objectid import ObjectId
+
+from mynbou.constants import JAVA_NODE_TYPES, PMD_RMATCH, CHANGE_TYPES, REFACTORING_TYPES
+
+
+# metrics of the code entity states, the values are drawn at random
+FILE_METRICS = ['LOC', 'LLOC', 'McCC', 'CLOC', 'PDA', 'PUA']
+CLASS_METRICS = ['WMC', 'DIT', 'RFC', 'NOC', 'CBO', 'LCOM5', 'NII', 'NOI', 'TNA', 'TNPA', 'TLOC', 'TNM', 'TNLPM', 'TNLA', 'TNPM', 'TNLM', 'LOC', 'NL']
+PACKAGE_METRICS = ['LOC', 'LLOC', 'NPKG', 'NCL', 'NIN', 'TNM']
+
+# number of documents per bulk insert
+BATCH_SIZE = 10000
+
+
+def generate_project(name='synthetic', commits=200, merge_rate=0.1, files=50, rename_rate=0.05, hunks=3, refactoring_rate=0.1, issues=20, inducing_rate=0.5, states_every=10, seed=1, releases=1):
+    """Generate a synthetic project and write it to the database.
+
+    The commits before the release span one year, every branch is merged before the release so that every earlier commit is an ancestor of the release.
+    With multiple releases the commits are split evenly between them, every release is an ancestor of the next release.
+    The bug-fixing commits for the issues follow the release within six months.
+
+    :param str name: name of the project
+    :param int commits: number of commits before the release, including merge commits
+    :param float merge_rate: probability that a commit creates a new branch and probability that a commit merges two branches
+    :param int files: number of java files which are added during the first third of the commits
+    :param float rename_rate: probability that a commit renames a file
+    :param int hunks: average number of hunks per file action
+    :param float refactoring_rate: probability that a commit contains a refactoring
+    :param int issues: number of bug issues, every issue is fixed by one commit after the release
+    :param float inducing_rate: probability that a file action of a bug fix has a bug-inducing file action before the release
+    :param int states_every: every n-th commit has code entity states with class metrics (D'Ambros samples), the release always has them
+    :param int seed: seed of the random generator
+    :param int releases: number of releases, the bug-fixing commits follow the last release
+    :rtype: dict
+    :returns: project_name, vcs, release_hash (the last release), release_hashes and the number of generated documents per collection (counts)
+    """
+    return SyntheticProject(name, commits, merge_rate, files, rename_rate, hunks, refactoring_rate, issues, inducing_rate, states_every, seed, releases).generate()
+
+
+class SyntheticProject(object):
+    """Builds the documents of a synthetic project in memory and inserts them in bulk, see :func:`generate_project`."""
+
+    def __init__(self, name, commits, merge_rate, files, rename_rate, hunks, refactoring_rate, issues, inducing_rate, states_every, seed, releases=1):
+        self.name = name
+        self.num_commits = commits
+        self.merge_rate = merge_rate
+        self.num_files = files
+        self.rename_rate = rename_rate
+        self.hunks = hunks
+        self.refactoring_rate = refactoring_rate
+        self.num_issues = issues
+        self.inducing_rate = inducing_rate
+        self.states_every = states_every
+        self.seed = seed
+        self.num_releases = releases
+
+        self._rnd = random.Random(seed)
+        self._docs = {model: [] for model in [Commit, File, FileAction, Hunk, Refactoring, CodeEntityState, CodeGroupState, CommitChanges, Issue]}
+
+        # live file path -> File
+        self._files = {}
+        self._created_files = 0
+        self._renames = 0
+
+        # File id -> list of file actions before the release, candidates for bug-inducing links
+        self._file_actions = {}
+
+    def _revision_hash(self, num):
+        return hashlib.sha1('{}-{}-{}'.format(self.name, self.seed, num).encode('utf-8')).hexdigest()
+
+    def _add(self, model, **kwargs):
+        doc = model(id=ObjectId(), **kwargs)
+        self._docs[model].append(doc)
+        return doc
+
+    def _new_file(self, path):
+        f = self._add(File, vcs_system_id=self.vcs.id, path=path)
+        self._files[path] = f
+        return f
+
+    def _class_name(self, path):
+        """Fully qualified class name of a file, e.g., src/main/java/org/synthetic/p1/C2.java -> org.synthetic.p1.C2"""
+        return path[len('src/main/java/'):-len('.java')].replace('/', '.')
+
+    def _commit(self, num, parents, date, linked_issue_ids=None, labels=None, **kwargs):
+        return self._add(Commit, vcs_system_id=self.vcs.id, revision_hash=self._revision_hash(num), parents=[p.revision_hash for p in parents],
+                         author_id=self._rnd.choice(self.people).id, author_date=date, committer_date=date, message='commit {}'.format(num),
+                         linked_issue_ids=linked_issue_ids or [], labels=labels or {}, code_entity_states=[], **kwargs)
+
+    def _file_action(self, commit, f, mode, old_file=None, before_release=True):
+        fa = self._add(FileAction, file_id=f.id, commit_id=commit.id, mode=mode, lines_added=self._rnd.randint(0, 50), lines_deleted=0 if mode == 'A' else self._rnd.randint(0, 30),
+                       old_file_id=old_file.id if old_file is not None else None, induces=[])
+        for i in range(self._rnd.randint(1, 2 * self.hunks - 1)):
+            self._add(Hunk, file_action_id=fa.id, new_start=i * 10 + 1, new_lines=3, old_start=i * 10 + 1, old_lines=2, content='-a\n+b\n+c\n')
+        if before_release:
+            self._file_actions.setdefault(f.id, []).append(fa)
+        return fa
+
+    def _class_states(self, commit):
+        """Class states with metrics for every live file."""
+        for path, f in sorted(self._files.items()):
+            ces = self._add(CodeEntityState, s_key='{}{}'.format(commit.revision_hash, path), long_name=self._class_name(path), commit_id=commit.id, file_id=f.id, ce_type='class',
+                            metrics={m: self._rnd.randint(0, 40) for m in CLASS_METRICS})
+            commit.code_entity_states.append(ces.id)
+
+    def _change(self, num, parent, date):
+        """A commit which adds, modifies and renames files."""
+        linked = [self._rnd.choice(self.issues).id] if self.issues and self._rnd.random() < 0.2 else []
+        c = self._commit(num, [parent] if parent is not None else [], date, linked)
+        changed = []
+
+        # every file is added in the first third of the commits
+        target = min(self.num_files, int(math.ceil(self.num_files * (num + 1) / max(1.0, self.num_commits / 3.0))))
+        while self._created_files < target:
+            f = self._new_file('src/main/java/org/synthetic/p{}/C{}.java'.format(self._created_files % 10, self._created_files))
+            self._created_files += 1
+            self._file_action(c, f, 'A')
+            changed.append(f)
+
+        existing = sorted(p for p in self._files.keys() if self._files[p] not in changed)
+        for path in self._rnd.sample(existing, min(len(existing), self._rnd.randint(1, 3))):
+            self._file_action(c, self._files[path], 'M')
+            changed.append(self._files[path])
+
+        if existing and self._rnd.random() < self.rename_rate:
+            old_path = self._rnd.choice(existing)
+            old_file = self._files.pop(old_path)
+            self._renames += 1
+            new_file = self._new_file(old_path.replace('.java', 'R{}.java'.format(self._renames)))
+            self._file_action(c, new_file, 'R', old_file)
+            changed.append(new_file)
+
+        live = [f for f in changed if self._files.get(f.path) is f]
+        if live and self._rnd.random() < self.refactoring_rate:
+            f = self._rnd.choice(live)
+            ces = self._add(CodeEntityState, s_key='{}{}ref'.format(c.revision_hash, f.path), long_name=self._class_name(f.path), commit_id=c.id, file_id=f.id, ce_type='class', metrics={})
+            self._add(Refactoring, commit_id=c.id, type=self._rnd.choice(sorted(REFACTORING_TYPES)), ce_state={'ce_after': ces.id}, detection_tool='synthetic')
+
+        if parent is not None and self._rnd.random() < 0.5:
+            classification = {str(f.id): {t: self._rnd.randint(0, 3) for t in CHANGE_TYPES} for f in changed}
+            self._add(CommitChanges, old_commit_id=parent.id, new_commit_id=c.id, classification=classification)
+        return c
+
+    def _release_states(self, release):
+        """File, class and package states of the release."""
+        pmd = sorted(PMD_RMATCH.keys())
+        packages = set()
+        for path, f in sorted(self._files.items()):
+            metrics = {m: self._rnd.randint(0, 500) for m in FILE_METRICS}
+            metrics.update({t: self._rnd.randint(0, 20) for t in JAVA_NODE_TYPES[:20]})
+            metrics['node_count'] = sum(metrics[t] for t in JAVA_NODE_TYPES[:20])
+            linter = [{'l_ty': self._rnd.choice(pmd), 'ln': self._rnd.randint(1, 100)} for _ in range(self._rnd.randint(0, 4))]
+            ces = self._add(CodeEntityState, s_key='{}{}file'.format(release.revision_hash, path), long_name=path, commit_id=release.id, file_id=f.id, ce_type='file',
+                            metrics=metrics, imports=['java.util.List', 'java.io.File'][:self._rnd.randint(0, 2)], linter=linter)
+            release.code_entity_states.append(ces.id)
+            packages.add('.'.join(self._class_name(path).split('.')[:-1]))
+
+            for i in range(self._rnd.randint(1, 3)):
+                ces = self._add(CodeEntityState, s_key='{}{}m{}'.format(release.revision_hash, path, i), long_name='{}.m{}()'.format(self._class_name(path), i), commit_id=release.id, file_id=f.id,
+                                ce_type='method', metrics={'McCC': self._rnd.randint(1, 10), 'NL': self._rnd.randint(0, 4), 'LOC': self._rnd.randint(1, 60)})
+                release.code_entity_states.append(ces.id)
+        self._class_states(release)
+
+        for package in sorted(packages):
+            self._add(CodeGroupState, s_key='{}{}'.format(release.revision_hash, package), long_name=package, commit_id=release.id, cg_type='package',
+                      metrics={m: self._rnd.randint(0, 1000) for m in PACKAGE_METRICS})
+
+    def _release(self, heads, num, start, step):
+        """Merge every branch and add the release after the commit num.
+
+        :rtype: tuple
+        :returns: the release and its number
+        """
+        while len(heads) > 1:
+            num += 1
+            heads[0] = self._commit(num, [heads[0], heads.pop()], start + step * num)
+
+        num += 1
+        release = self._change(num, heads[0], start + step * num)
+        self._release_states(release)
+        heads[:] = [release]
+        return release, num
+
+    def _bug_fix(self, num, parent, date, issue):
+        """A bug-fixing commit after the release which links its file actions to bug-inducing file actions before the release."""
+        issue_ids = [issue.id]
+        c = self._commit(num, [parent], date, issue_ids, labels={'validated_bugfix': True, 'issueonly_bugfix': True, 'adjustedszz_bugfix': True},
+                         fixed_issue_ids=issue_ids, szz_issue_ids=issue_ids)
+        for path in self._rnd.sample(sorted(self._files.keys()), min(len(self._files), self._rnd.randint(1, 2))):
+            f = self._files[path]
+            fa = self._file_action(c, f, 'M', before_release=False)
+            if self._rnd.random() < self.inducing_rate and self._file_actions.get(f.id):
+                inducing = self._rnd.choice(self._file_actions[f.id])
+                for label in ['JLMIV+R', 'JL+R']:
+                    inducing.induces.append({'change_file_action_id': fa.id, 'label': label, 'szz_type': 'inducing'})
+        return c
+
+    def generate(self):
+        """Build and insert every document.
+
+        :rtype: dict
+        """
+        rnd = self._rnd
+        self.people = [People(name='author{}'.format(i), email='author{}@{}'.format(i, self.name)).save() for i in range(5)]
+        project = Project(name=self.name).save()
+        self.vcs = VCSSystem(project_id=project.id, url='https://synthetic/{}'.format(self.name), repository_type='git').save()
+        issue_system = IssueSystem(project_id=project.id, url='https://synthetic/{}/issues'.format(self.name)).save()
+
+        start = datetime.datetime(2018, 1, 1)
+        step = datetime.timedelta(days=365) / max(1, self.num_commits)
+
+        self.issues = []
+        for i in range(self.num_issues):
+            self.issues.append(self._add(Issue, issue_system_id=issue_system.id, external_id='SYN-{}'.format(i + 1), issue_type='Bug', issue_type_verified='bug', resolution='Fixed', status='Closed',
+                                         priority=rnd.choice(['Major', 'Minor', 'Critical', 'Blocker', 'Trivial']), created_at=start + datetime.timedelta(days=rnd.randint(0, 365))))
+
+        # the commits after which a release other than the last one follows
+        boundaries = {self.num_commits * (i + 1) // self.num_releases - 1 for i in range(self.num_releases - 1)}
+        release_hashes = []
+
+        heads = []
+        offset = 0
+        for i in range(self.num_commits):
+            num = i + offset
+            date = start + step * num
+            if len(heads) > 1 and rnd.random() < self.merge_rate:
+                first, second = rnd.sample(range(len(heads)), 2)
+                c = self._commit(num, [heads[first], heads[second]], date)
+                heads[first] = c
+                del heads[second]
+            else:
+                if heads and rnd.random() < self.merge_rate:
+                    heads.append(rnd.choice(heads))
+                index = rnd.randrange(len(heads)) if heads else None
+                parent = heads[index] if heads else None
+                c = self._change(num, parent, date)
+                if index is None:
+                    heads.append(c)
+                else:
+                    heads[index] = c
+            if self.states_every and num % self.states_every == 0 and num > 0:
+                self._class_states(c)
+            if i in boundaries:
+                release, last = self._release(heads, num, start, step)
+                release_hashes.append(release.revision_hash)
+                offset += last - num
+
+        release, num = self._release(heads, num, start, step)
+        release_hashes.append(release.revision_hash)
+
+        parent = release
+        days = 180.0 / (self.num_issues + 1)
+        for i, issue in enumerate(self.issues):
+            num += 1
+            parent = self._bug_fix(num, parent, release.committer_date + datetime.timedelta(days=days * (i + 1)), issue)
+
+        counts = {}
+        for model, docs in self._docs.items():
+            for i in range(0, len(docs), BATCH_SIZE):
+                model.objects.insert(docs[i:i + BATCH_SIZE], load_bulk=False)
+            counts[model._get_collection_name()] = len(docs)
+
+        return {'project_name': self.name, 'vcs': self.vcs, 'release_hash': release.revision_hash, 'release_hashes': release_hashes, 'counts': counts}
@@ -1,17 +1,41 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-"""
+r"""
 This module contains functions for calculation of aggregations for lists of values.
 
 The calculations here are verbatim taken from Zhang et al. :cite:`zhang`.
+
+The Fraction based aggregations (:func:`hoover`, :func:`shannon_entropy`, :func:`generalized_entropy` and :func:`theil`) support two precision modes.
+The default 'exact' mode uses rational arithmetic and :func:`exact_sum` for reproducible results.
+The 'fast' mode calculates every term with floats and sums the terms with :func:`math.fsum` which is correctly rounded,
+the only error therefore comes from the rounding of the individual terms, i.e., :math:`|fast - exact| \leq` :data:`FAST_ERROR_BOUND` :math:`\cdot \sum_i |t_i|`
+where :math:`t_i` are the summed terms of the aggregation including its constant factor and the parts of differences are added as absolute values
+(for hoover :math:`\frac{1}{2}|\frac{m_i}{\sum_m}| + \frac{1}{2N}`, for shannon_entropy :math:`|\frac{freq(m_i)}{N^2}\ln\frac{freq(m_i)}{N}|`).
 """
 
 
+import sys
 import math
 import statistics
+import collections
 from fractions import Fraction
 
+import numpy as np
+
+
+# available precision modes of the Fraction based aggregations
+PRECISIONS = ['exact', 'fast']
+
+# upper bound for the error of the fast precision mode relative to the sum of the absolute terms,
+# every term has at most three rounding errors and the final result one more
+FAST_ERROR_BOUND = 4 * sys.float_info.epsilon
+
+
+def _check_precision(precision):
+    if precision not in PRECISIONS:
+        raise Exception('Unknown precision {}, use one of {}'.format(precision, ', '.join(PRECISIONS)))
+
 
 def msum(iterable):
     """Full precision summation using multiple floats for intermediate values.
@@ -40,6 +64,43 @@ def msum(iterable):
     return sum(partials, 0.0)
 
 
+# integers up to this magnitude are converted to floats without rounding
+MAX_EXACT_INT = 2 ** 53
+
+
+def exact_sum(values):
+    """Full precision summation of the given values.
+
+    This is a drop-in replacement for :func:`msum` which uses :func:`math.fsum` (the same partials algorithm implemented in C) where its semantics match,
+    i.e., for floats, integers up to :data:`MAX_EXACT_INT` and finite results. The result is correctly rounded and does not depend on the order of the values.
+    NumPy arrays are converted to Python floats in a single call and checked for non finite values vectorized.
+    Everything else (e.g., Fractions, large integers, infinite values) is summed with :func:`msum`.
+
+    :param values: iterable or NumPy array of values
+    :rtype: float
+    """
+    if isinstance(values, np.ndarray):
+        if values.dtype.kind == 'f' and np.isfinite(values).all():
+            return math.fsum(values.tolist())
+        values = values.tolist()
+    else:
+        values = list(values)
+
+    for v in values:
+        if not (type(v) is float or (type(v) is int and -MAX_EXACT_INT <= v <= MAX_EXACT_INT)):
+            return msum(values)
+
+    try:
+        ret = math.fsum(values)
+    except (ValueError, OverflowError):
+        return msum(values)
+
+    # msum yields NaN for most infinite sums
+    if math.isinf(ret):
+        return msum(values)
+    return ret
+
+
 def mean(values):
     r"""Arithmetic mean value of the given values.
 
@@ -48,7 +109,7 @@ def mean(values):
         \mu_m = \frac{1}{N}\sum_{i=1}^N m_i
 
     """
-    return mean(values)
+    return statistics.mean(values)
 
 
 def median(values):
@@ -83,7 +144,7 @@ def stddev(values):
     m = statistics.mean(values)
     n = [math.pow(v - m, 2) for v in values]
 
-    return math.sqrt(msum(n) / N)
+    return math.sqrt(exact_sum(n) / N)
 
 
 def cov(values):
@@ -118,27 +179,34 @@ def gini(values):
     second = []
     for i, v in enumerate(values):
         second.append(v * (i + 1))  # +1 because enumerate starts from 0 and the formula starts from 1
-    second = msum(second) - (len(values) + 1) * msum(values)
+    second = exact_sum(second) - (len(values) + 1) * exact_sum(values)
 
     return first * second
 
 
-def hoover(values):
+def hoover(values, precision='exact'):
     r"""Hoover index of the given values.
 
     .. math::
 
         \text{Hoover}_m = \frac{1}{2}\sum_{i=i}^N|\frac{m_i}{\textstyle \sum_m} - \frac{1}{N}|
 
+    :param str precision: 'exact' or 'fast', see :data:`PRECISIONS`
     """
+    _check_precision(precision)
     values = sorted(values)
 
-    if sum(values) == 0 or math.isnan(msum(values)):
+    if sum(values) == 0 or math.isnan(exact_sum(values)):
         return 0
 
+    if precision == 'fast':
+        total = math.fsum(values)
+        return 0.5 * math.fsum([abs(v / total - 1 / len(values)) for v in values])
+
     # no fraction here as sum(values) could also be a fraction
-    s = [abs(Fraction(v / msum(values)) - Fraction(1, len(values))) for v in values]  # seems more exact than passing the div
-    return 0.5 * msum(s)
+    total = exact_sum(values)
+    s = [abs(Fraction(v / total) - Fraction(1, len(values))) for v in values]  # seems more exact than passing the div
+    return 0.5 * exact_sum(s)
 
 
 def atkinson(values):
@@ -159,19 +227,21 @@ def atkinson(values):
     for value in values:
         if value > 0:
             inner.append(math.sqrt(value))
-    inner = msum(inner) / len(values)
+    inner = exact_sum(inner) / len(values)
     s = math.pow(inner, 2)
     return 1 - (s / mean)
 
 
-def shannon_entropy(values):
+def shannon_entropy(values, precision='exact'):
     r"""Shannon's entropy of the given values.
 
     .. math::
 
         E_m = -\frac{1}{N}\sum_{i=1}^N\lbrack\frac{freq(m_i)}{N} * \ln\frac{freq(m_i)}{N}\rbrack
 
+    :param str precision: 'exact' or 'fast', see :data:`PRECISIONS`
     """
+    _check_precision(precision)
     values = sorted(values)
     N = len(values)
 
@@ -183,6 +253,9 @@ def shannon_entropy(values):
             freq[value] = 0
         freq[value] += 1
 
+    if precision == 'fast':
+        return -(1 / N) * math.fsum([f * (f / N) * math.log(f / N) for f in freq.values()])
+
     res = []
     for value in values:
         fn = Fraction(freq[value], N)
@@ -190,17 +263,19 @@ def shannon_entropy(values):
 
         res.append(fn * lfn)
 
-    return -(1 / N) * msum(res)
+    return -(1 / N) * exact_sum(res)
 
 
-def generalized_entropy(values):
+def generalized_entropy(values, precision='exact'):
     r"""Generalized entropy of the given values.
 
     .. math::
 
         \text{GE}_m = -\frac{1}{N\alpha (1-\alpha)}\sum_{i=1}^N\lbrack(\frac{m_i}{\mu_m})^\alpha - 1\rbrack, \alpha=0.5
 
+    :param str precision: 'exact' or 'fast', see :data:`PRECISIONS`
     """
+    _check_precision(precision)
     alpha = 0.5
     values = sorted(values)
     N = len(values)
@@ -214,6 +289,8 @@ def generalized_entropy(values):
     for value in values:
         if math.isnan(value) or math.isnan(mean):
             continue
+        elif precision == 'fast' and int(value) == value and math.floor(mean) > 0:
+            res.append(math.pow(int(value) / math.floor(mean), alpha) - 1)
         elif int(value) == value and math.floor(mean) > 0:
             try:
                 vm = Fraction(int(value), math.floor(mean))
@@ -226,17 +303,21 @@ def generalized_entropy(values):
             if vm > 0:
                 res.append(math.pow(vm, alpha) - 1)
 
-    return prefix * msum(res)
+    if precision == 'fast':
+        return prefix * math.fsum(res)
+    return prefix * exact_sum(res)
 
 
-def theil(values):
+def theil(values, precision='exact'):
     r"""Theil index of the given values.
 
     .. math::
 
         \text{Theil}_m = \frac{1}{N} \sum_{i=1}^N \lbrack \frac{m_i}{\mu_m} * \ln(\frac{m_i}{\mu_m})\rbrack
 
+    :param str precision: 'exact' or 'fast', see :data:`PRECISIONS`
     """
+    _check_precision(precision)
     values = sorted(values)
     N = len(values)
     mean = statistics.mean(values)
@@ -246,10 +327,292 @@ def theil(values):
         vm = 0
         if math.isnan(value) or math.isnan(mean):
             continue
+        elif precision == 'fast' and int(value) == value and math.floor(mean) > 0:
+            vm = int(value) / math.floor(mean)
         elif int(value) == value and math.floor(mean) > 0:
             vm = Fraction(int(value), math.floor(mean))
         elif mean > 0:
             vm = value / mean
         if vm > 0:
             res.append(vm * math.log(vm))
-    return msum(res) / N
+    if precision == 'fast':
+        return math.fsum(res) / N
+    return exact_sum(res) / N
+
+
+# names of all aggregations, also used as suffixes for the aggregated metric names
+AGGREGATIONS = ['sum', 'min', 'max', 'avg', 'median', 'stdev', 'coefficient_of_variation', 'gini', 'hoover', 'atkinson', 'shannon_entropy', 'generalized_entropy', 'theil']
+
+
+def aggregate_all(values, precision='exact'):
+    """All aggregations of the given values at once.
+
+    The values are only sorted once and sum, mean and frequency tables are shared between the aggregations.
+    The results are the same as calling every aggregation function on its own.
+
+    :param list values: list of values
+    :param str precision: precision mode of the Fraction based aggregations, 'exact' or 'fast', see :data:`PRECISIONS`
+    :rtype: dict
+    :returns: dict with the names of :data:`AGGREGATIONS` as keys and the aggregated values
+    """
+    _check_precision(precision)
+
+    ret = {k: 0 for k in AGGREGATIONS}
+    if not values:
+        return ret
+
+    ret.update(_aggregate_ordered(values))
+    ret.update(_aggregate_sorted(sorted(values), len(values) * ret['sum'] != 0, precision))
+    return ret
+
+
+def _aggregate_ordered(values):
+    """Aggregations which depend on the original order of the values.
+
+    sum, min and max are calculated in the original order as these are not the same for unsorted floats or NaN values.
+    """
+    total = sum(values)
+    return {'sum': total, 'min': min(values), 'max': max(values), 'avg': total / len(values)}
+
+
+def _aggregate_sorted(values, nonzero_total, precision):
+    """Aggregations which only depend on the sorted values.
+
+    :param list values: sorted list of values
+    :param bool nonzero_total: if N times the sum of the values in the original order is not 0 (gini)
+    :param str precision: precision mode of the Fraction based aggregations
+    """
+    fast = precision == 'fast'
+    summation = math.fsum if fast else exact_sum
+
+    ret = {k: 0 for k in AGGREGATIONS[4:]}
+    N = len(values)
+    sorted_total = sum(values)
+    exact_total = exact_sum(values)
+    mean = statistics.mean(values)
+    floor_mean = None if math.isnan(mean) else math.floor(mean)
+
+    ret['median'] = median(values)
+
+    # stddev and coefficient of variation
+    ret['stdev'] = math.sqrt(exact_sum([math.pow(v - mean, 2) for v in values]) / N)
+    if mean > 0:
+        ret['coefficient_of_variation'] = ret['stdev'] / mean
+
+    # gini
+    if nonzero_total:
+        second = exact_sum([v * (i + 1) for i, v in enumerate(values)]) - (N + 1) * exact_total
+        ret['gini'] = (2 / (N * sorted_total)) * second
+
+    # hoover, the fractions are summed exactly (this is what exact_sum does with fractions)
+    if not (sorted_total == 0 or math.isnan(exact_total)) and fast:
+        fast_total = math.fsum(values)
+        ret['hoover'] = 0.5 * math.fsum([abs(v / fast_total - 1 / N) for v in values])
+    elif not (sorted_total == 0 or math.isnan(exact_total)):
+        ret['hoover'] = 0.5 * float(sum((abs(Fraction(v / exact_total) - Fraction(1, N)) for v in values), Fraction(0)))
+
+    # atkinson
+    if mean != 0:
+        inner = exact_sum([math.sqrt(v) for v in values if v > 0]) / N
+        ret['atkinson'] = 1 - (math.pow(inner, 2) / mean)
+
+    # shannon entropy, the frequency table is only computed once and the term is calculated once per distinct value
+    if any(math.isnan(v) for v in values):
+        ret['shannon_entropy'] = math.nan
+    elif fast:
+        ret['shannon_entropy'] = -(1 / N) * math.fsum([f * (f / N) * math.log(f / N) for f in collections.Counter(values).values()])
+    else:
+        terms = {}
+        for value, freq in collections.Counter(values).items():
+            terms[value] = Fraction(freq, N) * math.log(Fraction(freq, N))
+        ret['shannon_entropy'] = -(1 / N) * exact_sum([terms[v] for v in values])
+
+    # generalized entropy
+    alpha = 0.5
+    if mean != 0:
+        res = []
+        for value in values:
+            if math.isnan(value) or math.isnan(mean):
+                continue
+            elif int(value) == value and floor_mean > 0:
+                res.append(math.pow(int(value) / floor_mean if fast else Fraction(int(value), floor_mean), alpha) - 1)
+            elif value / mean > 0:
+                res.append(math.pow(value / mean, alpha) - 1)
+        ret['generalized_entropy'] = (-1 / (N * alpha * (1 - alpha))) * summation(res)
+
+    # theil index
+    res = []
+    for value in values:
+        if math.isnan(value) or math.isnan(mean):
+            continue
+        elif int(value) == value and floor_mean > 0:
+            vm = int(value) / floor_mean if fast else Fraction(int(value), floor_mean)
+        elif mean > 0:
+            vm = value / mean
+        else:
+            continue
+        if vm > 0:
+            res.append(vm * math.log(vm))
+    ret['theil'] = summation(res) / N
+    return ret
+
+
+class AggregationMemo(object):
+    """Bounded LRU memo in front of :func:`aggregate_all`.
+
+    Many files have identical small value lists (e.g., [1] or [0, 0]) for which every aggregation would be calculated again.
+    The memo is keyed by the sorted values together with their types, e.g., 0 and 0.0 are different keys as they produce different output.
+    Only the aggregations of the sorted values are cached, sum, min, max and avg depend on the original order and are always calculated.
+    Lists containing negative zero are not cached as -0.0 and 0.0 can not be distinguished by the key.
+
+    :param int maxsize: maximum number of cached value lists, the least recently used entry is evicted first
+    :param str precision: precision mode of the Fraction based aggregations, see :data:`PRECISIONS`
+    """
+
+    def __init__(self, maxsize=100000, precision='exact'):
+        _check_precision(precision)
+        self.maxsize = maxsize
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+
+    def aggregate(self, values):
+        """All aggregations of the given values, same result as :func:`aggregate_all`.
+
+        :param list values: list of values
+        :rtype: dict
+        """
+        ret = {k: 0 for k in AGGREGATIONS}
+        if not values:
+            return ret
+
+        ret.update(_aggregate_ordered(values))
+        nonzero_total = len(values) * ret['sum'] != 0
+        values = sorted(values)
+
+        if 0 in values and any(math.copysign(1, v) < 0 for v in values if v == 0):
+            self.misses += 1
+            ret.update(_aggregate_sorted(values, nonzero_total, self.precision))
+            return ret
+
+        key = (tuple(values), tuple(map(type, values)), nonzero_total)
+        try:
+            cached = self._cache[key]
+            self._cache.move_to_end(key)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            cached = _aggregate_sorted(values, nonzero_total, self.precision)
+            self._cache[key] = cached
+            if len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        ret.update(cached)
+        return ret
+
+    def stats(self):
+        """Hit and miss statistics of the memo.
+
+        :rtype: dict
+        :returns: dict with hits, misses, hit_rate, size and maxsize
+        """
+        calls = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / calls if calls else 0, 'size': len(self._cache), 'maxsize': self.maxsize}
+
+
+def aggregate_batch(values, offsets):
+    """All aggregations for many lists of values at once.
+
+    The lists are given as a ragged array, i.e., all values concatenated and the offsets of every list,
+    the values of list i are values[offsets[i]:offsets[i + 1]].
+    Every aggregation is computed on the complete array with NumPy.
+    In contrast to :func:`aggregate_all` this uses plain float arithmetic, the results are therefore only equal within floating point precision.
+    Lists which contain NaN values are aggregated with :func:`aggregate_all` because min, max and the sorting depend on the position of the NaN values there.
+    Empty lists yield 0 for every aggregation.
+
+    :param values: array of all values
+    :param offsets: array of offsets with one more element than there are lists
+    :rtype: dict
+    :returns: dict with the names of :data:`AGGREGATIONS` as keys and arrays with the aggregated value of every list
+    """
+    values = np.asarray(values, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    num = len(counts)
+    seg = np.repeat(np.arange(num), counts)
+
+    ret = {k: np.zeros(num) for k in AGGREGATIONS}
+    nonempty = counts > 0
+    if not nonempty.any():
+        return ret
+
+    # sort within every list, NaN values are sorted to the end of their list
+    unsorted = values
+    order = np.lexsort((values, seg))
+    values = values[order]
+    starts = offsets[:-1][nonempty]
+    n = counts[nonempty].astype(np.float64)
+    has_nan = np.logical_or.reduceat(np.isnan(values), starts)
+
+    def segment_sum(x):
+        return np.add.reduceat(x, starts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = segment_sum(values)
+        mean = total / n
+        rank = np.arange(len(values)) - offsets[seg] + 1
+        mean_v = np.repeat(mean, counts[nonempty])
+        total_v = np.repeat(total, counts[nonempty])
+        n_v = np.repeat(n, counts[nonempty])
+
+        res = {}
+        res['sum'] = total
+        res['min'] = values[starts]
+        res['max'] = values[offsets[1:][nonempty] - 1]
+        res['avg'] = mean
+
+        lower = values[starts + (counts[nonempty] - 1) // 2]
+        upper = values[starts + counts[nonempty] // 2]
+        res['median'] = np.where(counts[nonempty] % 2 == 0, 0.5 * (lower + upper), upper)
+
+        res['stdev'] = np.sqrt(segment_sum((values - mean_v) ** 2) / n)
+        res['coefficient_of_variation'] = np.where(mean > 0, res['stdev'] / mean, 0)
+
+        gini = (2 / (n * total)) * (segment_sum(values * rank) - (n + 1) * total)
+        res['gini'] = np.where(n * total == 0, 0, gini)
+
+        hoover = 0.5 * segment_sum(np.abs(values / total_v - 1 / n_v))
+        res['hoover'] = np.where(total == 0, 0, hoover)
+
+        inner = segment_sum(np.where(values > 0, np.sqrt(np.where(values > 0, values, 0)), 0)) / n
+        res['atkinson'] = np.where(mean == 0, 0, 1 - inner ** 2 / mean)
+
+        # frequency of every distinct value per list, every occurence adds its term
+        new_run = np.ones(len(values), dtype=bool)
+        new_run[1:] = (values[1:] != values[:-1]) | (seg[1:] != seg[:-1])
+        run_id = np.cumsum(new_run) - 1
+        freq = np.bincount(run_id)[run_id] / n_v
+        res['shannon_entropy'] = -(1 / n) * segment_sum(freq * np.log(freq))
+
+        # the ratio to the mean uses the floored mean for integer values as in generalized_entropy and theil
+        floor_mean_v = np.floor(mean_v)
+        is_int = (np.floor(values) == values) & (floor_mean_v > 0)
+        vm = np.where(is_int, values / floor_mean_v, values / mean_v)
+        valid = ~np.isnan(values) & ~np.isnan(mean_v)
+
+        alpha = 0.5
+        ge_terms = np.where(valid & (is_int | (vm > 0)), np.sqrt(np.where(vm > 0, vm, 0)) - 1, 0)
+        res['generalized_entropy'] = np.where(mean == 0, 0, (-1 / (n * alpha * (1 - alpha))) * segment_sum(ge_terms))
+
+        vm_theil = np.where(is_int | (mean_v > 0), vm, 0)
+        theil_terms = np.where(valid & (vm_theil > 0), vm_theil * np.log(np.where(vm_theil > 0, vm_theil, 1)), 0)
+        res['theil'] = segment_sum(theil_terms) / n
+
+    for k, v in res.items():
+        ret[k][nonempty] = v
+
+    for i in np.flatnonzero(nonempty)[has_nan]:
+        for k, v in aggregate_all(unsorted[offsets[i]:offsets[i + 1]].tolist()).items():
+            ret[k][i] = v
+    return ret
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides stage checkpoints which allow resuming an interrupted run of Mynbou.
+
+Every completed stage of a release (e.g., graph, change metrics, issues) is written to a local directory.
+The checkpoints are keyed by the VCS system, the release hash, the parameters of the release (e.g., type) and the version of the code,
+a rerun with the same key loads the completed stages and continues with the first stage that is missing.
+"""
+
+import os
+import gzip
+import json
+import pickle
+import hashlib
+
+
+def code_version():
+    """Hash of the source code of mynbou, checkpoints written by a different version of the code are not used.
+
+    :rtype: str
+    """
+    h = hashlib.sha1()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, filename)
+            h.update(os.path.relpath(path, root).encode('utf-8'))
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+class Checkpoints(object):
+    """Stage checkpoints for one key.
+
+    The checkpoints are stored in a subdirectory of the given directory which is named after the hash of the key,
+    it also contains the key as key.json for reference.
+
+    :param str directory: base directory of the checkpoints
+    :param dict key: JSON serializable key, e.g., VCS id, release hash and type, the code version is added
+    """
+
+    def __init__(self, directory, key):
+        self.key = dict(key, code_version=code_version())
+        digest = hashlib.sha1(json.dumps(self.key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.path = os.path.join(directory, digest)
+
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'key.json'), 'w') as f:
+            json.dump(self.key, f, sort_keys=True, indent=4, default=str)
+
+    def _filename(self, stage):
+        return os.path.join(self.path, '{}.pickle.gz'.format(stage))
+
+    def completed(self, stage):
+        """Return True if a checkpoint exists for the stage.
+
+        :param str stage: name of the stage
+        :rtype: bool
+        """
+        return os.path.exists(self._filename(stage))
+
+    def load(self, stage):
+        """Load the result of the stage.
+
+        :param str stage: name of the stage
+        """
+        with gzip.open(self._filename(stage), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, stage, data):
+        """Save the result of the stage.
+
+        The file is written under a temporary name first so that an interrupted write does not leave a broken checkpoint.
+
+        :param str stage: name of the stage
+        :param data: result of the stage, has to be picklable
+        """
+        tmp = self._filename(stage) + '.tmp'
+        with gzip.open(tmp, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._filename(stage))
@@ -8,57 +8,81 @@ import networkx as nx
 from dateutil.relativedelta import relativedelta
 
 from mynbou.path import Volg
-from mynbou.metrics.change import moser, hassan, dambros
-from pycoshark.mongomodels import Commit, CodeEntityState, File, CodeGroupState
+from mynbou.checkpoint import Checkpoints
+from mynbou.repository import MongoRepository, chunked
+from mynbou import instrumentation
+from mynbou.metrics.change import moser, hassan, dambros, window_sizes
 
 from mynbou.constants import *
 
 
+# number of files whose code entity states are loaded at once for the static source code metrics
+FILE_BATCH_SIZE = 1000
+
+
 class Mynbou(object):
     """Core Mynbou functionality.
 
     This class wraps graph construction, Volg, the change metrics implementations and metrics collection.
     """
 
-    def __init__(self, vcs, project_name, release_hash):
+    def __init__(self, vcs, project_name, release_hash, checkpoint_dir=None, repository=None):
+        """
+        :param str checkpoint_dir: directory for stage checkpoints, a rerun with the same directory resumes after the last completed stage
+        :param Repository repository: data access for the VCS system, defaults to the MongoDB (see :mod:`mynbou.repository`)
+        """
         self._log = logging.getLogger(self.__class__.__name__)
 
         self.project_name = project_name
         self.vcs = vcs
         self.release_hash = release_hash
+        self.checkpoint_dir = checkpoint_dir
+        self.repository = repository if repository is not None else MongoRepository(vcs)
+
+        if self.repository.releases is not None and release_hash not in self.repository.releases:
+            raise Exception('Release {} is not contained in the repository, it has data for {}'.format(release_hash, ', '.join(self.repository.releases)))
 
         self.files = []
         self.graph = None
 
+        # code entity states and packages of the release for the static source code metrics, see _prefetch_file_states
+        self._file_states = None
+
         self.load_graph()
 
-    def release(self, limit_type):
+    def release(self, limit_type, window_size_days=14, accumulate=False, state=None):
         """Provide a full release for the project and release hash Mynbou was initialized with.
 
         This provides every change metric, release metrics and bug fixes.
+
+        :param str limit_type: which bug-fixing commits are considered (False, JL+R, SZZ)
+        :param window_size_days: window size in days for Hassan and D'Ambros metrics or a list of window sizes, a list suffixes the metric names with the window size
+        :param bool accumulate: use running change metrics instead of keeping every author, revision, commit message and changed lines per file
+        :param VolgState state: intermediate per commit data of previous releases, it is updated with the commits of this release
         """
-        self._log.info('starting change metrics')
-        v = Volg(self.graph, self.vcs, self.release_hash)
-        change_metrics = v.change_metrics()
-        self._log.info('finished change metrics')
+        checkpoints = self._checkpoints(type=limit_type, window_size_days=window_size_days, accumulate=accumulate)
 
+        # files and other data used throughout the mining are loaded at once
+        with instrumentation.stage('warm_up'):
+            self.repository.warm_up()
 
-        if limit_type == 'False':
-            self._log.info('loading issues')
-            issues = v.issues()
-            self._log.info('finished issue loading')
-        elif limit_type == 'JL+R':
-            self._log.info('loading issues for 6 months after relase')
-            issues = v.issues_six_months_szzr()
-            self._log.info('finished issue loading')
-        elif limit_type == 'SZZ':
-            self._log.info('loading issues for 6 months after relase')
-            issues = v.issues_six_months_szz()
-            self._log.info('finished issue loading')
-        else:
-            raise Exception('Unknown type {}'.format(limit_type))
+        def volg():
+            self._log.info('starting change metrics')
+            v = Volg(self.graph, self.vcs, self.release_hash, window_size_days, accumulate, state, self.repository)
+            v.change_metrics()
+            self._log.info('finished change metrics')
+            return v
 
-        dambros_deltas = v.dambros_deltas()
+        # the stages of Volg update the state, they are not restored from checkpoints if there is a state
+        # because the state would then miss the commits and the first occurences of this release
+        restore = state is None
+
+        # Volg is kept together with the change metrics as the following stages need it
+        v = self._stage(checkpoints, 'change_metrics', volg, restore)
+        v._repository = self.repository
+        change_metrics = v._change_metrics
+
+        issues = self._stage(checkpoints, 'issues', lambda: self._issues(v, limit_type), restore)
 
         # D'Ambros debugging only
         # with open('dambros_test.json', 'w') as f:
@@ -74,17 +98,31 @@ class Mynbou(object):
             if file in issues.keys():
                 release[file]['bug_fixes'] = issues[file]
 
-        hassan_metrics = hassan(release)
-        moser_metrics = moser(release)
-        dambros_metrics = dambros(release, dambros_deltas)
+        with instrumentation.stage('hassan_moser'):
+            if accumulate:
+                hassan_metrics = v.accumulator.hassan(window_size_days)
+                moser_metrics = v.accumulator.moser({file: metrics['age'] for file, metrics in release.items()})
+            else:
+                hassan_metrics = hassan(release, window_size_days)
+                moser_metrics = moser(release)
+
+        def dambros_stage():
+            dambros_metrics = {file: {} for file in release.keys()}
+            for size, suffix in window_sizes(window_size_days):
+                for file, metrics in dambros(release, v.dambros_deltas(size)).items():
+                    dambros_metrics[file].update(**{k + suffix: value for k, value in metrics.items()})
+            return dambros_metrics
+
+        dambros_metrics = self._stage(checkpoints, 'dambros', dambros_stage, restore)
+
+        # fetch additional release centric metrics
+        file_metrics = self._stage(checkpoints, 'file_metrics', lambda: self._files_metrics(list(change_metrics.keys()), self.release_hash))
 
         for file in change_metrics.keys():
             release[file].update(**hassan_metrics[file])
             release[file].update(**moser_metrics[file])
             release[file].update(**dambros_metrics[file])
-
-            # fetch additional release centric metrics
-            release[file].update(**self._file_metrics(file, self.release_hash))
+            release[file].update(**file_metrics[file])
 
         # meta information about the mined release and its path, including which commits are included
         change_path_commits = set()
@@ -98,25 +136,119 @@ class Mynbou(object):
                                'release_date': str(v._release_date),
                                }
 
+        if self.repository.file_cache is not None:
+            stats = self.repository.file_cache.stats()
+            self._log.info('file cache: {} hits, {} misses, hit rate {:.2%}, {} of {} files'.format(stats['hits'], stats['misses'], stats['hit_rate'], stats['size'], stats['maxsize']))
+
         return release, release_information
 
+    def _checkpoints(self, **key):
+        """Checkpoints for the given release parameters, None if no checkpoint directory is used."""
+        if self.checkpoint_dir is None:
+            return None
+        return Checkpoints(self.checkpoint_dir, dict(key, vcs_id=self.vcs.id, release_hash=self.release_hash))
+
+    def _stage(self, checkpoints, name, func, restore=True):
+        """Run a stage of the release or load its result if the stage was already completed in a previous run.
+
+        :param bool restore: load the result of a completed stage, otherwise the stage is run again and its checkpoint is replaced
+        """
+        with instrumentation.stage(name) as entry:
+            if checkpoints is not None and checkpoints.completed(name):
+                if restore:
+                    self._log.info('loading completed stage {} from checkpoint'.format(name))
+                    if entry is not None:
+                        entry['checkpoint'] = True
+                    return checkpoints.load(name)
+                self._log.info('running completed stage {} again to update the state'.format(name))
+
+            ret = func()
+            if checkpoints is not None:
+                checkpoints.save(name, ret)
+            return ret
+
+    def _issues(self, v, limit_type):
+        """Load the bug fixes of the release files for the type of bug-fixing commits."""
+        if limit_type == 'False':
+            self._log.info('loading issues')
+            with instrumentation.stage('issues_jlmiv'):
+                issues = v.issues()
+            self._log.info('finished issue loading')
+        elif limit_type == 'JL+R':
+            self._log.info('loading issues for 6 months after relase')
+            with instrumentation.stage('issues_six_months_szzr'):
+                issues = v.issues_six_months_szzr()
+            self._log.info('finished issue loading')
+        elif limit_type == 'SZZ':
+            self._log.info('loading issues for 6 months after relase')
+            with instrumentation.stage('issues_six_months_szz'):
+                issues = v.issues_six_months_szz()
+            self._log.info('finished issue loading')
+        else:
+            raise Exception('Unknown type {}'.format(limit_type))
+        return issues
+
     def load_graph(self):
         """Load NetworkX digraph structure from commits of this VCS."""
+        self.graph = self._stage(self._checkpoints(), 'graph', self._build_graph)
+
+    def _build_graph(self):
         g = nx.DiGraph()
+        commits = list(self.repository.commits())
+
         # first we add all nodes to the graph
-        for c in Commit.objects.only('id', 'revision_hash').timeout(False).filter(vcs_system_id=self.vcs.id):
+        for c in commits:
             g.add_node(c.revision_hash)
 
         # after that we draw all edges
-        for c in Commit.objects.only('id', 'parents', 'revision_hash').timeout(False).filter(vcs_system_id=self.vcs.id):
+        for c in commits:
             for p in c.parents:
-                try:
-                    p1 = Commit.objects.only('id', 'revision_hash').timeout(False).get(vcs_system_id=self.vcs.id, revision_hash=p)
-                    g.add_edge(p1.revision_hash, c.revision_hash)
-                except Commit.DoesNotExist:
+                if p in g:
+                    g.add_edge(p, c.revision_hash)
+                else:
                     print("parent of a commit is missing (commit id: {} - revision_hash: {})".format(c.id, p))
-                    pass
-        self.graph = g
+        return g
+
+    def _prefetch_file_states(self, revision_hash, filenames):
+        """Load the files, their code entity states and the classes and packages of the commit for :meth:`_file_metrics`.
+
+        The classes and packages of the commit are loaded once, the code entity states for every batch of files.
+        """
+        if self._file_states is None or self._file_states['revision_hash'] != revision_hash:
+            c = self.repository.commit(revision_hash)
+
+            # classes by their package name with their position in the natural order
+            classes = {}
+            for pos, ces in enumerate(self.repository.entity_states_for_commit(c, ce_types=['class', 'interface', 'enum'])):
+                package_name = '.'.join(ces.long_name.split('.')[0:-1])
+                if package_name not in classes.keys():
+                    classes[package_name] = []
+                classes[package_name].append((pos, ces))
+
+            self._file_states = {'revision_hash': revision_hash, 'commit': c, 'classes': classes, 'packages': self.repository.package_states_for_commit(c.id), 'files': {}, 'states': {}}
+
+        files = {filename: [] for filename in filenames}
+        for f in self.repository.files_by_paths(filenames):
+            files[f.path].append(f)
+
+        states = {}
+        for ces in self.repository.entity_states_for_commit(self._file_states['commit'], file_ids=[f.id for fs in files.values() for f in fs]):
+            if ces.file_id not in states.keys():
+                states[ces.file_id] = []
+            states[ces.file_id].append(ces)
+
+        self._file_states['files'] = files
+        self._file_states['states'] = states
+
+    def _files_metrics(self, filenames, revision_hash):
+        """Return static source code metrics for the given files and commit, the code entity states are loaded in batches of FILE_BATCH_SIZE files."""
+        ret = {}
+        for batch in chunked(filenames, FILE_BATCH_SIZE):
+            self._prefetch_file_states(revision_hash, batch)
+            for filename in batch:
+                ret[filename] = self._file_metrics(filename, revision_hash)
+        self._file_states = None
+        return ret
 
     def _package_metrics(self, commit, ces_file):
         """Return package metrics from given CodeEntityState of type file.
@@ -126,20 +258,27 @@ class Mynbou(object):
         """
         metrics = {}
         class_name = ces_file.long_name.split('/')[-1].split('.')[0]
-        for ces_class in CodeEntityState.objects.filter(id__in=commit.code_entity_states, long_name__contains=class_name, ce_type__in=['class', 'interface', 'enum']):
-            package_name = '.'.join(ces_class.long_name.split('.')[0:-1])
 
-            # check if package from class is the end of our file_path, if not skip to the next class contained in our file
-            path = '.'.join(ces_file.long_name.split('/')[0:-1])
-            if not path.endswith(package_name):
+        # the package of the class has to be the end of our file path, we only look at classes in these packages
+        path = '.'.join(ces_file.long_name.split('/')[0:-1])
+        candidates = []
+        for i in range(len(path)):
+            candidates += self._file_states['classes'].get(path[i:], [])
+
+        for pos, ces_class in sorted(candidates, key=lambda candidate: candidate[0]):
+            if class_name not in ces_class.long_name:
                 continue
+            package_name = '.'.join(ces_class.long_name.split('.')[0:-1])
 
             # check if class actually has a package
             if not package_name:
                 continue
 
             # fetch package for our package_name, throw error if not exactly one is found
-            cgs = CodeGroupState.objects.get(commit_id=commit.id, cg_type='package', long_name=package_name)
+            packages = self._file_states['packages'].get(package_name, [])
+            if len(packages) != 1:
+                raise Exception('{} packages {} in commit {}'.format(len(packages), package_name, commit.revision_hash))
+            cgs = packages[0]
             for k, v in cgs.metrics.items():
                 if k in IGNORE_PACKAGE_METRICS:
                     continue
@@ -152,12 +291,18 @@ class Mynbou(object):
 
     def _file_metrics(self, filename, commit):
         """Return static source code metrics for the given file and commit (usually the release)."""
-        c = Commit.objects.get(revision_hash=commit, vcs_system_id=self.vcs.id)
-        f = File.objects.get(vcs_system_id=c.vcs_system_id, path=filename)
+        if self._file_states is None or self._file_states['revision_hash'] != commit or filename not in self._file_states['files'].keys():
+            self._prefetch_file_states(commit, [filename])
+        c = self._file_states['commit']
+
+        files = self._file_states['files'][filename]
+        if len(files) != 1:
+            raise Exception('{} files with path {}'.format(len(files), filename))
+        f = files[0]
 
         ret = {}
         file = False
-        for m in CodeEntityState.objects.filter(id__in=c.code_entity_states, file_id=f.id):
+        for m in self._file_states['states'].get(f.id, []):
 
             if m.ce_type == 'file':
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides per stage instrumentation of a mining run.
+
+Stages are marked with the :func:`stage` context manager, e.g., graph loading, change paths, change metrics, issues and the writing of the outputs.
+If a :class:`Report` is active every stage records its wall time, CPU time, the increase of the peak resident set size
+and the number of MongoDB queries and returned documents per collection, otherwise the stages do nothing.
+Stages can be nested, the measurements of a stage include its nested stages.
+Other recorders of stages, e.g., the :class:`mynbou.profiling.Profiler`, can be activated with :func:`activate` in the same way.
+
+The MongoDB queries are counted by a pymongo command listener which has to be registered before the connection is created, see :func:`register_command_counter`.
+"""
+
+import time
+import json
+import resource
+import threading
+import contextlib
+
+from pymongo import monitoring
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands and returned documents per collection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {}
+        self.queries = {}
+        self.documents = {}
+
+    def started(self, event):
+        command = event.command
+        if event.command_name == 'getMore':
+            collection = command.get('collection')
+        else:
+            collection = command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command_name
+
+        with self._lock:
+            self._collections[event.request_id] = collection
+            self.queries[collection] = self.queries.get(collection, 0) + 1
+
+    def succeeded(self, event):
+        with self._lock:
+            collection = self._collections.pop(event.request_id, event.command_name)
+
+            reply = event.reply
+            num = 0
+            if 'cursor' in reply:
+                num = len(reply['cursor'].get('firstBatch', reply['cursor'].get('nextBatch', [])))
+            elif event.command_name == 'count':
+                num = reply.get('n', 0)
+            self.documents[collection] = self.documents.get(collection, 0) + num
+
+    def failed(self, event):
+        with self._lock:
+            self._collections.pop(event.request_id, None)
+
+    def snapshot(self):
+        """Current counts per collection.
+
+        :rtype: dict
+        :returns: collection -> (queries, documents)
+        """
+        with self._lock:
+            return {collection: (self.queries.get(collection, 0), self.documents.get(collection, 0)) for collection in self.queries.keys()}
+
+
+# command counter used by every report, None until it is registered
+_command_counter = None
+
+# currently active recorders of stages, e.g., reports
+_recorders = []
+
+
+def register_command_counter():
+    """Register the command counter with pymongo, this only affects connections which are created afterwards.
+
+    :rtype: CommandCounter
+    """
+    global _command_counter
+    if _command_counter is None:
+        _command_counter = CommandCounter()
+        monitoring.register(_command_counter)
+    return _command_counter
+
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Report(object):
+    """Measurements of all stages of a run."""
+
+    def __init__(self):
+        self.stages = []
+        self._stack = []
+
+    def start(self):
+        """Activate this report, all following stages are recorded in it."""
+        activate(self)
+        return self
+
+    def stop(self):
+        """Deactivate this report."""
+        deactivate(self)
+
+    @contextlib.contextmanager
+    def stage(self, name, info=None):
+        """Record the stage, the entry is added when the stage starts so that the stages are ordered by their start.
+
+        :param str name: name of the stage
+        :param dict info: additional information about the stage which is added to the entry when the stage ends
+        """
+        entry = {'name': name, 'path': '/'.join([s['name'] for s in self._stack] + [name]), 'depth': len(self._stack)}
+        self.stages.append(entry)
+        self._stack.append(entry)
+
+        mongo_before = _command_counter.snapshot() if _command_counter is not None else {}
+        rss_before = _peak_rss_kb()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['wall_time'] = time.perf_counter() - wall_before
+            entry['cpu_time'] = time.process_time() - cpu_before
+            entry['peak_rss_kb'] = _peak_rss_kb()
+            entry['peak_rss_delta_kb'] = entry['peak_rss_kb'] - rss_before
+
+            mongo = {}
+            if _command_counter is not None:
+                for collection, (queries, documents) in _command_counter.snapshot().items():
+                    queries_before, documents_before = mongo_before.get(collection, (0, 0))
+                    if queries > queries_before:
+                        mongo[collection] = {'queries': queries - queries_before, 'documents': documents - documents_before}
+            entry['mongo'] = mongo
+            if info:
+                entry.update(info)
+            self._stack.pop()
+
+    def save(self, filename):
+        """Write the report as JSON file.
+
+        :param str filename: name of the file
+        """
+        with open(filename, 'w') as f:
+            json.dump({'stages': self.stages}, f, indent=4)
+
+
+def activate(recorder):
+    """Activate a recorder of stages, it has to provide a stage(name, info) context manager.
+
+    :param recorder: recorder, e.g., a :class:`Report`
+    """
+    if recorder not in _recorders:
+        _recorders.append(recorder)
+
+
+def deactivate(recorder):
+    """Deactivate a recorder of stages.
+
+    :param recorder: recorder, e.g., a :class:`Report`
+    """
+    if recorder in _recorders:
+        _recorders.remove(recorder)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Mark a stage of the run, it is recorded by every active recorder.
+
+    Yields None if no recorder is active, otherwise a dict for additional information about the stage (e.g., that it was loaded from a checkpoint).
+
+    :param str name: name of the stage
+    """
+    if not _recorders:
+        yield None
+        return
+
+    info = {}
+    with contextlib.ExitStack() as stack:
+        for recorder in list(_recorders):
+            stack.enter_context(recorder.stage(name, info))
+        yield info
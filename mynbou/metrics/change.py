@@ -7,188 +7,233 @@ This module contains functions for calculation of change metrics.
 For now this contains change metrics as as proposed by Moser et al. :cite:`moser`, Hassan :cite:`hassan` and the extensions proposed by D'Ambros et al. :cite:`dambros`.
 """
 
+import re
 import math
-from mynbou.aggregation import msum
+from itertools import chain
 
+import numpy as np
 
-def hassan(instances, window_size_days=14, phi1=1, phi2=1, phi3=1):
-    """Calculate Hassan complexity of change metrics with the additon from D'Ambros.
-
-    The addition includes not only if the file has changed
-    but also the number of lines (added + deleted).
-    Requires the following lists in the dict: lines_added, lines_deleted, days_from_release (list of days before release where the file changed).
-
-    :param dict instances: dict with structure {'filepath': {'lines_added': [1,2], ...}}.
-    :param int window_size_days: window size in days
-    :param float phi1: decay factor
-    :param float phi2: decay factor
-    :param float phi3: decay factor
-    :rtype: dict
-    :returns: dict with key filepath and values change metrics
-    """
-    rel = {}
+from mynbou.aggregation import exact_sum
 
-    # sum of changed lines and max age for temporal slicing
-    max_age = 0
-    all_changed_lines = 0
-    days = {}
 
-    n = instances.keys()  # all files in the system
-    n_bar = set()  # all files changed in the current period (e.g., 6 months not window_size!)
-    for file, metrics in instances.items():
+def _change_events(instances):
+    """Flatten the change lists of every file into columnar arrays of change events.
 
-        # this creates basically a lookup table of day -> list of files
-        for day in set(metrics['days_from_release']):
-            if day not in days.keys():
-                days[day] = []
-            days[day].append(file)
-            n_bar.add(file)
+    Requires the following lists in the dict: lines_added, lines_deleted, days_from_release.
 
-        # find max age used for the range calculation later
-        # ages can be empty if the file was never changed in our current mining path
-        if metrics['days_from_release'] and max(metrics['days_from_release']) > max_age:
-            max_age = max(metrics['days_from_release'])
-        # find all changed lines over the complete release
-        all_changed_lines += sum(metrics['lines_added']) + sum(metrics['lines_deleted'])
-
-    n_bar = len(n_bar)  # we just need the number of files changed in the change path
-
-    # 1. create a range of days with window_size_days 14 (2 weeks)
-    # if our date range is not exactly divisible by 14 we do not use the surplus days at the beginning because the days at
-    # the end of the date range are probably more important (closer to release == 0)
-    start = 0
-    end = max_age + (max_age % window_size_days)
-    a = list(reversed(range(start, end, window_size_days)))
+    :param dict instances: dict with structure {'filepath': {'lines_added': [1,2], ...}}.
+    :rtype: tuple
+    :returns: tuple of (file index per event, days from release per event, changed lines per event, number of files changed at all)
+    """
+    files = list(instances.values())
+    counts = [len(metrics['days_from_release']) for metrics in files]
+    num_events = sum(counts)
 
-    # weighted history of complexity metric per file
-    whcm = {}
+    file_idx = np.repeat(np.arange(len(files)), counts)
+    days = np.fromiter(chain.from_iterable(metrics['days_from_release'] for metrics in files), dtype=np.int64, count=num_events)
+    lines_added = np.fromiter(chain.from_iterable(metrics['lines_added'] for metrics in files), dtype=np.int64, count=num_events)
+    lines_deleted = np.fromiter(chain.from_iterable(metrics['lines_deleted'] for metrics in files), dtype=np.int64, count=num_events)
 
-    # for the history of complexity metric and the version with decay calculation
-    # we could in theory also use the weighted variant for these but for now we are using the unweighted version as in D'Ambros et al.
-    hcm = {}
-
-    # list of weeks per file, this is just for debugging purposes
-    weeks_list = {}
+    # number of files changed in the complete period (e.g., 6 months not window_size!)
+    n_bar = sum(1 for count in counts if count > 0)
 
-    # 2. find all changes for this daterange (1 week) zip(a[:-1], a[1:]) == (0,7) (7,14) ...
-    # we switch this around as we may have decaying factors so first is oldest instead of most recent (therefore a[1:], a[:-1])
-    for i, j in zip(a[1:], a[:-1]):
+    return file_idx, days, lines_added + lines_deleted, n_bar
 
-        # find every file that has changed in the date range
-        files = {}
 
-        # all lines changed in the daterange
-        all_changed_lines = 0
+def _group_sum(values, groups, num_groups):
+    """Full precision sum of values for every group, groups without values are 0."""
+    ret = np.zeros(num_groups)
+    if not len(values):
+        return ret
 
-        # we need this for the weighting part
-        all_changed_files = 0
+    order = np.argsort(groups, kind='stable')
+    uniq, starts = np.unique(groups[order], return_index=True)
+    for group, chunk in zip(uniq, np.split(values[order], starts[1:])):
+        ret[group] = exact_sum(chunk)
+    return ret
 
-        # for each day of the week (range(0,7) == [0,1,2,3,4,5,6])
-        for day in range(i, j):
 
-            # if nothing was changed on that day, continue
-            if day not in days.keys():
-                continue
+def _apply(func, values):
+    """Apply a scalar math function once per unique value.
 
-            # every file that is changed on that day
-            for file in days[day]:
+    We use the math module instead of the NumPy ufuncs because they may differ in the last bit which would change the results.
+    """
+    uniq, inverse = np.unique(values, return_inverse=True)
+    return np.fromiter(map(func, uniq.tolist()), dtype=np.float64, count=len(uniq))[inverse]
 
-                if file not in weeks_list.keys():
-                    weeks_list[file] = []
 
-                if (i, j) not in weeks_list[file]:
-                    weeks_list[file].append((i, j))
+def _hassan_window(events, num_files, window_size_days, phi1, phi2, phi3):
+    """Calculate the Hassan metrics for one window size on the binned change events.
 
-                if file not in files.keys():
-                    files[file] = {'changed_lines': []}
+    :returns: dict with key metric name and values list of metric values per file index, files without changes in any window are 0
+    """
+    file_idx, days, changed_lines, n_bar = events
 
-                # 2.1 find changeset for this day, we can do this here because Volg uses lists (which preserve order)
-                # idx = instances[file]['ages'].index(day)  # this does not work if we have two commits on one day
+    # 1. create a range of days with window_size_days 14 (2 weeks)
+    # if our date range is not exactly divisible by 14 we do not use the surplus days at the beginning because the days at
+    # the end of the date range are probably more important (closer to release == 0)
+    max_age = int(days.max()) if len(days) else 0
+    end = max_age + (max_age % window_size_days)
+    num_windows = max(len(range(0, end, window_size_days)) - 1, 0)
+
+    # 2. bin every change into its window (0 == most recent window), changes outside of the windows are not used
+    mask = (days >= 0) & (days < num_windows * window_size_days)
+    window = days[mask] // window_size_days
+
+    # one entry for every pair of (file, window) in which the file changed, ordered by file and then from the oldest to the most recent window
+    # as we may have decaying factors
+    keys, inverse = np.unique(file_idx[mask] * num_windows + (num_windows - 1 - window), return_inverse=True)
+    pair_file = keys // max(num_windows, 1)
+    pair_window = num_windows - 1 - keys % max(num_windows, 1)
+
+    # changed lines (added + deleted) of each file in each window and of all files in each window
+    pair_lines = np.bincount(inverse.ravel(), weights=changed_lines[mask], minlength=len(keys))
+    window_lines = np.bincount(pair_window, weights=pair_lines, minlength=num_windows)[pair_window]
+
+    # 3. adaptive sizing entropy for each window
+    # IMPORTANT: if only one file is changed in the given date range we would have log to the base of 1
+    # as this is an entropy based formula we set it to 0
+    # same as when 0 lines are changed
+    changed = window_lines > 0
+    p = np.zeros(len(keys))
+    p[changed] = pair_lines[changed] / window_lines[changed]
+    ase = p > 0 if n_bar > 1 else np.zeros(len(keys), dtype=bool)
+    entropy = -p[ase] * _apply(lambda v: math.log(v, n_bar), p[ase])
+    window_entropy = _group_sum(entropy, pair_window[ase], num_windows)
+
+    # history of complexity metric, the ASE of every period in which the file was changed
+    hcm = window_entropy[pair_window]
+
+    # 4. decay of the history of complexity metric, pos is the 1-based position of the period in the history of the file
+    all_changes = np.bincount(pair_file, minlength=num_files)
+    first = np.cumsum(all_changes) - all_changes
+    pos = np.arange(len(keys)) - first[pair_file] + 1
+    all_changes = all_changes[pair_file]
+
+    ldhcm = hcm / (phi1 * (all_changes + 1 - pos))
+    lgdhcm = hcm / (phi2 * _apply(math.log, (all_changes + 1.01) - pos))
+    edhcm = hcm / _apply(math.exp, phi3 * (all_changes - pos))
+
+    # weighted history of complexity metric
+    # we weight by the changed lines of the file for given date range / all changed lines for given date range
+    whcm = p[changed] * hcm[changed]
+
+    ret = {'HASSAN_ldhcm': _group_sum(ldhcm, pair_file, num_files),
+           'HASSAN_lgdhcm': _group_sum(lgdhcm, pair_file, num_files),
+           'HASSAN_edhcm': _group_sum(edhcm, pair_file, num_files),
+           'HASSAN_hcm': _group_sum(hcm, pair_file, num_files),
+           'HASSAN_whcm': _group_sum(whcm, pair_file[changed], num_files)}
+
+    # files not changed in any window keep the default 0
+    has_changed = np.bincount(pair_file, minlength=num_files) > 0
+    return {name: [value if has_changed[idx] else 0 for idx, value in enumerate(values.tolist())] for name, values in ret.items()}
+
+
+def window_sizes(window_size_days):
+    """Return the window sizes together with the suffix for the metric names.
+
+    A single window size keeps the plain metric names, a list of window sizes suffixes every metric name with the window size, e.g., HASSAN_hcm_14d.
+
+    :param window_size_days: window size in days or list of window sizes in days
+    :rtype: list
+    :returns: list of tuples (window size, metric name suffix)
+    """
+    if isinstance(window_size_days, (list, tuple)):
+        return [(size, '_{}d'.format(size)) for size in window_size_days]
+    return [(window_size_days, '')]
 
-                # this is more expensive but works for more than one commit on a given day
-                for idx in [idx for idx, value in enumerate(instances[file]['days_from_release']) if value == day]:
-                    la = instances[file]['lines_added'][idx]
-                    ld = instances[file]['lines_deleted'][idx]
 
-                    files[file]['changed_lines'].append(la + ld)
-                    all_changed_lines += la + ld
+def hassan(instances, window_size_days=14, phi1=1, phi2=1, phi3=1):
+    """Calculate Hassan complexity of change metrics with the additon from D'Ambros.
 
-                    # we need to count every change to every file for the weighting
-                    all_changed_files += 1
+    The addition includes not only if the file has changed
+    but also the number of lines (added + deleted).
+    Requires the following lists in the dict: lines_added, lines_deleted, days_from_release (list of days before release where the file changed).
 
-        # adaptive sizing entropy for this period, we use a list because we need to sort the values later
-        ase = []
-        # we could iterate over all files directly but files not changed in this date range would yield p=0 anyway
-        for file, dat in files.items():
+    Every change is binned into its window in one pass, the entropy and decay calculation is then done on arrays of (file, window) pairs.
+    If a list of window sizes is given the changes are still only collected once and the metrics for every window size are returned with suffixed names.
 
-            # IMPORTANT: if only one file is changed in the given date range we would have log to the base of 1
-            # as this is an entropy based formula we set it to 0
-            # same as when 0 lines are changed
-            if n_bar > 1 and all_changed_lines > 0:
-                p = sum(dat['changed_lines']) / all_changed_lines
-                if p > 0:
-                    ase.append(-p * math.log(p, n_bar))
+    :param dict instances: dict with structure {'filepath': {'lines_added': [1,2], ...}}.
+    :param window_size_days: window size in days or list of window sizes in days, e.g., [7, 14, 30, 90]
+    :param float phi1: decay factor (linear decay)
+    :param float phi2: decay factor (logarithmic decay)
+    :param float phi3: decay factor (exponential decay)
+    :rtype: dict
+    :returns: dict with key filepath and values change metrics
+    """
+    return _hassan(list(instances.keys()), _change_events(instances), window_size_days, phi1, phi2, phi3)
 
-        for file, dat in files.items():
-            # history of complexity metric, we append the ASE of this period if this file was changed in this period
-            if file not in hcm.keys():
-                hcm[file] = []
-            hcm[file].append(msum(sorted(ase)))
 
-            # weighted history of complexity metric
-            # we weight by number of changes of file for given date range / number of all changes for given date range
-            # the number of changes we can get by looking at the length of the changed_lines list
-            if file not in whcm.keys():
-                whcm[file] = []
-            
-            if all_changed_lines > 0:
-                whcm[file].append((sum(dat['changed_lines']) / all_changed_lines) * msum(sorted(ase)))
+def _hassan(files, events, window_size_days, phi1, phi2, phi3):
+    """Calculate the Hassan metrics for every window size on the binned change events of the files."""
+    rel = {file: {} for file in files}
+    for size, suffix in window_sizes(window_size_days):
+        values = _hassan_window(events, len(files), size, phi1, phi2, phi3)
+        for idx, file in enumerate(files):
+            rel[file].update({name + suffix: metric[idx] for name, metric in values.items()})
+    return rel
 
-    # now get the real values for the decay of the files from our pre-filled hcm list
-    ldhcm = {}
-    lgdhcm = {}
-    edhcm = {}
 
-    # decay factors
-    phi1 = 1
-    phi2 = 1
-    phi3 = 1
+# moser_refactorings (ILIKE '%refactor%')
+REFACTOR_MESSAGE = re.compile('refactor')
 
-    for file in hcm.keys():
+# moser_bugfix (ILIKE '%Fix%' AND NOT ILIKE '% prefix %' AND NOT ILIKE '% postfix %')
+BUGFIX_MESSAGE = re.compile('fix')
+NO_BUGFIX_MESSAGE = re.compile(' (?:pre|post)fix ')
 
-        if file not in ldhcm.keys():
-            ldhcm[file] = []
-            lgdhcm[file] = []
-            edhcm[file] = []
-
-        all_changes = len(hcm[file])
-        for pos, hcmval in enumerate(hcm[file]):
-            pos = pos + 1  # we are not starting from zero, otherwise + 1 would not make much sense
-            ldhcm[file].append(hcmval / (phi1 * (all_changes + 1 - pos)))
-            lgdhcm[file].append(hcmval / (phi2 * (math.log(all_changes + 1.01 - pos))))
-            edhcm[file].append(hcmval / (math.exp(phi3 * (all_changes - pos))))
 
-    for file in instances.keys():
+def classify_message(message):
+    """Classify a commit message as refactoring and / or bug-fix after Moser et al.
 
-        if file not in rel.keys():
-            # defaults if a file has not changed in our inspection period
-            rel[file] = {'HASSAN_ldhcm': 0, 'HASSAN_lgdhcm': 0, 'HASSAN_edhcm': 0, 'HASSAN_hcm': 0, 'HASSAN_whcm': 0}
+    :param str message: commit message
+    :rtype: tuple
+    :returns: tuple of (is refactoring, is bug-fix)
+    """
+    message = message.lower()
+    is_refactoring = REFACTOR_MESSAGE.search(message) is not None
+    is_bugfix = BUGFIX_MESSAGE.search(message) is not None and NO_BUGFIX_MESSAGE.search(message) is None
+    return is_refactoring, is_bugfix
 
-        # if file in weeks_list.keys():  # debug
-        #     rel[file]['HASSAN_weeks'] = weeks_list[file]
 
-        if file in ldhcm.keys():
-            rel[file]['HASSAN_ldhcm'] = msum(sorted(ldhcm[file]))
-            rel[file]['HASSAN_lgdhcm'] = msum(sorted(lgdhcm[file]))
-            rel[file]['HASSAN_edhcm'] = msum(sorted(edhcm[file]))
+def _segment_reduce(ufunc, values, counts, default=0):
+    """Reduce the values of every file with the given ufunc, files without values get the default."""
+    ret = np.full(len(counts), default, dtype=values.dtype)
+    nonempty = counts > 0
+    if len(values):
+        # empty segments do not contain values so we can just leave them out of the reduceat indices
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        ret[nonempty] = ufunc.reduceat(values, starts)
+    return ret
 
-        if file in hcm.keys():
-            rel[file]['HASSAN_hcm'] = msum(sorted(hcm[file]))
 
-        if file in whcm.keys():
-            rel[file]['HASSAN_whcm'] = msum(sorted(whcm[file]))
+def _moser_columns(instances):
+    """Flatten the change lists of every file into columnar arrays.
 
-    return rel
+    Commit messages and authors are only classified / coded once per unique value
+    because a commit repeats its message for every file it touches.
+    """
+    files = list(instances.values())
+    counts = np.array([len(metrics['revisions']) for metrics in files], dtype=np.int64)
+    num_events = int(counts.sum())
+
+    def column(name):
+        return np.fromiter(chain.from_iterable(metrics[name] for metrics in files), dtype=np.int64, count=num_events)
+
+    messages = {}
+    authors = {}
+    flags = np.array([messages.setdefault(message, classify_message(message)) for metrics in files for message in metrics['commit_messages']], dtype=bool).reshape(-1, 2)
+    author_codes = np.fromiter((authors.setdefault(author, len(authors)) for metrics in files for author in metrics['authors']), dtype=np.int64, count=num_events)
+
+    return {'counts': counts,
+            'file_idx': np.repeat(np.arange(len(files)), counts),
+            'authors': author_codes,
+            'num_authors': len(authors),
+            'lines_added': column('lines_added'),
+            'lines_deleted': column('lines_deleted'),
+            'changesets': column('changesets'),
+            'ages': column('ages'),
+            'refactorings': flags[:, 0].astype(np.int64),
+            'bugfix': flags[:, 1].astype(np.int64)}
 
 
 def moser(instances):
@@ -198,50 +243,173 @@ def moser(instances):
 
     Requires the following additional fields in the dict: age (date from the end of metrics selection to the first appearance of the file in days)
 
+    All files are evaluated at once on columnar arrays of their changes so that every list is only traversed once.
+
     :param dict instances: dict with structure {'filepath': {'lines_added': [1,2], ...}}.
     :rtype: dict
     :returns: dict with key filepath and values change metrics
     """
+    cols = _moser_columns(instances)
+    counts = cols['counts']
+    churn = cols['lines_added'] - cols['lines_deleted']
+
+    # number of distinct authors per file
+    pairs = np.unique(cols['file_idx'] * max(cols['num_authors'], 1) + cols['authors'])
+    authors = np.bincount(pairs // max(cols['num_authors'], 1), minlength=len(counts))
+
+    sums = {k: _segment_reduce(np.add, cols[k], counts) for k in ['lines_added', 'lines_deleted', 'changesets', 'refactorings', 'bugfix']}
+    maxs = {k: _segment_reduce(np.maximum, cols[k], counts) for k in ['lines_added', 'lines_deleted', 'changesets']}
+    max_churn = _segment_reduce(np.maximum, churn, counts)
+    weighted_ages = _segment_reduce(np.add, cols['ages'] * cols['lines_added'], counts)
+
     rel = {}
-    for file in instances.keys():
+    for idx, (file, metrics) in enumerate(instances.items()):
+        revisions = int(counts[idx])
+        sum_lines_added = int(sums['lines_added'][idx])
+        sum_lines_deleted = int(sums['lines_deleted'][idx])
+
         rel[file] = {
-            'MOSER_authors': len(set(instances[file]['authors'])),
-            'MOSER_revisions': len(instances[file]['revisions']),
-            'MOSER_sum_lines_added': sum(instances[file]['lines_added']),
-            'MOSER_max_lines_added': max(instances[file]['lines_added'], default=0),
+            'MOSER_authors': int(authors[idx]),
+            'MOSER_revisions': revisions,
+            'MOSER_sum_lines_added': sum_lines_added,
+            'MOSER_max_lines_added': int(maxs['lines_added'][idx]),
             'MOSER_avg_lines_added': 0,
-            'MOSER_sum_lines_deleted': sum(instances[file]['lines_deleted']),
-            'MOSER_max_lines_deleted': max(instances[file]['lines_deleted'], default=0),
+            'MOSER_sum_lines_deleted': sum_lines_deleted,
+            'MOSER_max_lines_deleted': int(maxs['lines_deleted'][idx]),
             'MOSER_avg_lines_deleted': 0,
-            'MOSER_sum_code_churn': sum(instances[file]['lines_added']) - sum(instances[file]['lines_deleted']),
+            'MOSER_sum_code_churn': sum_lines_added - sum_lines_deleted,
             # pairwise churn for finding max
-            'MOSER_max_code_churn': max([la - ld for la, ld in zip(instances[file]['lines_added'], instances[file]['lines_deleted'])], default=0),
+            'MOSER_max_code_churn': int(max_churn[idx]),
             'MOSER_avg_code_churn': 0,
-            'MOSER_max_changeset': max(instances[file]['changesets'], default=0),
+            'MOSER_max_changeset': int(maxs['changesets'][idx]),
             'MOSER_avg_changeset': 0,
-
-            # moser_refactorings (ILIKE '%refactor%')
-            'MOSER_refactorings': sum([1 if 'refactor' in c.lower() else 0 for c in instances[file]['commit_messages']]),
-
-            # moser_bugfix (ILIKE '%Fix%' AND NOT ILIKE '% prefix %' AND NOT ILIKE '% postfix %')
-            'MOSER_bugfix': sum([1 if 'fix' in c.lower() and ' prefix ' not in c.lower() and ' postfix ' not in c.lower() else 0 for c in instances[file]['commit_messages']]),
-            'MOSER_age': instances[file]['age'],  # date from end of metrics selection to first appearence of file in days
+            'MOSER_refactorings': int(sums['refactorings'][idx]),
+            'MOSER_bugfix': int(sums['bugfix'][idx]),
+            'MOSER_age': metrics['age'],  # date from end of metrics selection to first appearence of file in days
             'MOSER_weighted_age': 0
         }
 
         # weighted age is age wighted by changes to the file
-        if sum(instances[file]['lines_added']) > 0:
-            rel[file]['MOSER_weighted_age'] = sum([a * b for a, b in zip(instances[file]['ages'], instances[file]['lines_added'])]) / sum(instances[file]['lines_added'])
-
-        if len(instances[file]['revisions']) > 0:
-            tmp = {'MOSER_avg_lines_added': sum(instances[file]['lines_added']) / len(instances[file]['revisions']),
-                   'MOSER_avg_lines_deleted': sum(instances[file]['lines_deleted']) / len(instances[file]['revisions']),
-                   'MOSER_avg_code_churn': (sum(instances[file]['lines_added']) - sum(instances[file]['lines_deleted'])) / len(instances[file]['revisions']),
-                   'MOSER_avg_changeset': sum(instances[file]['changesets']) / len(instances[file]['revisions'])}
-            rel[file].update(**tmp)
+        if sum_lines_added > 0:
+            rel[file]['MOSER_weighted_age'] = int(weighted_ages[idx]) / sum_lines_added
+
+        if revisions > 0:
+            rel[file]['MOSER_avg_lines_added'] = sum_lines_added / revisions
+            rel[file]['MOSER_avg_lines_deleted'] = sum_lines_deleted / revisions
+            rel[file]['MOSER_avg_code_churn'] = (sum_lines_added - sum_lines_deleted) / revisions
+            rel[file]['MOSER_avg_changeset'] = int(sums['changesets'][idx]) / revisions
     return rel
 
 
+class ChangeMetricsAccumulator(object):
+    """Online variant of the Moser and Hassan change metrics.
+
+    Every change event immediately updates the running sums, maxima, author sets and bug-fix / refactoring counters of the file
+    and the changed lines per day which are later binned into the Hassan windows.
+    This way we do not need to keep the lists of authors, revisions, commit messages and changed lines for every file.
+    The results are the same as calling :func:`moser` and :func:`hassan` on the full lists.
+    """
+
+    def __init__(self, files):
+        self._files = {file: {'authors': set(), 'revisions': 0, 'sum_lines_added': 0, 'max_lines_added': None, 'sum_lines_deleted': 0, 'max_lines_deleted': None,
+                              'max_code_churn': None, 'sum_changeset': 0, 'max_changeset': None, 'refactorings': 0, 'bugfix': 0, 'sum_weighted_age': 0,
+                              'changed_lines': {}} for file in files}
+
+        # the classification is done once per commit, not once per file of the commit
+        self._messages = {}
+
+    def add(self, file, revision_hash, author, message, lines_added, lines_deleted, changeset, age, days_from_release):
+        """Add one change of the file.
+
+        :param str file: release file that changed
+        :param str revision_hash: revision of the change, used to classify the commit message only once
+        :param str author: author of the change
+        :param str message: commit message of the change
+        :param int lines_added: lines added to the file
+        :param int lines_deleted: lines deleted from the file
+        :param int changeset: number of hunks in the commit
+        :param int age: days from the first occurence of the file to the change
+        :param int days_from_release: days from the change to the release
+        """
+        if revision_hash not in self._messages.keys():
+            self._messages[revision_hash] = classify_message(message)
+        is_refactoring, is_bugfix = self._messages[revision_hash]
+
+        m = self._files[file]
+        m['authors'].add(author)
+        m['revisions'] += 1
+        m['sum_lines_added'] += lines_added
+        m['max_lines_added'] = lines_added if m['max_lines_added'] is None else max(m['max_lines_added'], lines_added)
+        m['sum_lines_deleted'] += lines_deleted
+        m['max_lines_deleted'] = lines_deleted if m['max_lines_deleted'] is None else max(m['max_lines_deleted'], lines_deleted)
+        m['max_code_churn'] = lines_added - lines_deleted if m['max_code_churn'] is None else max(m['max_code_churn'], lines_added - lines_deleted)
+        m['sum_changeset'] += changeset
+        m['max_changeset'] = changeset if m['max_changeset'] is None else max(m['max_changeset'], changeset)
+        m['refactorings'] += is_refactoring
+        m['bugfix'] += is_bugfix
+        m['sum_weighted_age'] += age * lines_added
+
+        # hassan only needs the changed lines per day
+        if days_from_release not in m['changed_lines'].keys():
+            m['changed_lines'][days_from_release] = 0
+        m['changed_lines'][days_from_release] += lines_added + lines_deleted
+
+    def moser(self, ages):
+        """Return change metrics after Moser et al.
+
+        :param dict ages: dict with key filepath and value age (date from the end of metrics selection to the first appearance of the file in days)
+        :rtype: dict
+        :returns: dict with key filepath and values change metrics
+        """
+        rel = {}
+        for file, m in self._files.items():
+            rel[file] = {
+                'MOSER_authors': len(m['authors']),
+                'MOSER_revisions': m['revisions'],
+                'MOSER_sum_lines_added': m['sum_lines_added'],
+                'MOSER_max_lines_added': m['max_lines_added'] or 0,
+                'MOSER_avg_lines_added': 0,
+                'MOSER_sum_lines_deleted': m['sum_lines_deleted'],
+                'MOSER_max_lines_deleted': m['max_lines_deleted'] or 0,
+                'MOSER_avg_lines_deleted': 0,
+                'MOSER_sum_code_churn': m['sum_lines_added'] - m['sum_lines_deleted'],
+                'MOSER_max_code_churn': m['max_code_churn'] or 0,
+                'MOSER_avg_code_churn': 0,
+                'MOSER_max_changeset': m['max_changeset'] or 0,
+                'MOSER_avg_changeset': 0,
+                'MOSER_refactorings': m['refactorings'],
+                'MOSER_bugfix': m['bugfix'],
+                'MOSER_age': ages[file],
+                'MOSER_weighted_age': 0
+            }
+
+            if m['sum_lines_added'] > 0:
+                rel[file]['MOSER_weighted_age'] = m['sum_weighted_age'] / m['sum_lines_added']
+
+            if m['revisions'] > 0:
+                rel[file]['MOSER_avg_lines_added'] = m['sum_lines_added'] / m['revisions']
+                rel[file]['MOSER_avg_lines_deleted'] = m['sum_lines_deleted'] / m['revisions']
+                rel[file]['MOSER_avg_code_churn'] = (m['sum_lines_added'] - m['sum_lines_deleted']) / m['revisions']
+                rel[file]['MOSER_avg_changeset'] = m['sum_changeset'] / m['revisions']
+        return rel
+
+    def hassan(self, window_size_days=14, phi1=1, phi2=1, phi3=1):
+        """Return Hassan complexity of change metrics, see :func:`hassan` for the parameters.
+
+        :rtype: dict
+        :returns: dict with key filepath and values change metrics
+        """
+        bins = [m['changed_lines'] for m in self._files.values()]
+        counts = [len(b) for b in bins]
+
+        file_idx = np.repeat(np.arange(len(bins)), counts)
+        days = np.fromiter(chain.from_iterable(b.keys() for b in bins), dtype=np.int64, count=sum(counts))
+        changed_lines = np.fromiter(chain.from_iterable(b.values() for b in bins), dtype=np.int64, count=sum(counts))
+        n_bar = sum(1 for count in counts if count > 0)
+
+        return _hassan(list(self._files.keys()), (file_idx, days, changed_lines, n_bar), window_size_days, phi1, phi2, phi3)
+
+
 def dambros(instances, deltas, alpha=0.01, phi1=1, phi2=1, phi3=1):
     """Calculate D'Ambros et al. churn of source code metrics and entropy of source code metrics.
 
@@ -364,7 +532,7 @@ def dambros(instances, deltas, alpha=0.01, phi1=1, phi2=1, phi3=1):
                     entropy[lgdhh].append(sum_j / (phi3 * math.log(C + 1.01 - pos)))
 
         # sum up everything and report back
-        rel[file] = {k: msum(v) for k, v in churns.items()}
-        rel[file].update(**{k: msum(v) for k, v in entropy.items()})
+        rel[file] = {k: exact_sum(v) for k, v in churns.items()}
+        rel[file].update(**{k: exact_sum(v) for k, v in entropy.items()})
 
     return rel
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides columnar binary output formats for the harmonized dataset.
+
+The harmonized dataset is given as sparse rows (the aggregated instances, keys which are missing in a row are 0) together with the ordered column names.
+The rows are never filled into a dense table of Python values, every format is written one column or one row at a time.
+Every column is written with a type, int and float columns as numeric arrays and everything else (e.g., file and imports) as strings.
+The readers return a column-major table (column name -> array of values in the order of the rows).
+
+The formats are:
+ - npz: NumPy archive, numeric columns of the same type are stored as one matrix with a row per column so that every column is a contiguous view
+ - parquet: Apache Parquet file, requires pyarrow
+ - arrow: Apache Arrow IPC (Feather V2) file which can be memory mapped, requires pyarrow
+ - csr: sparse matrix of the numeric columns in compressed sparse row format, only values which are not 0 are stored
+
+It also provides JSON Lines output, one JSON object per line, which can be written while the objects are produced and read lazily.
+JSON and JSON Lines files may be compressed with gzip or zstd (requires zstandard), the compression is determined by the file extension.
+"""
+
+import io
+import gzip
+import json
+
+import numpy as np
+
+
+# available output formats for the harmonized dataset, csv is written by the plugin itself
+OUTPUT_FORMATS = ['csv', 'npz', 'parquet', 'arrow', 'csr']
+
+# file extensions of the output formats
+OUTPUT_EXTENSIONS = {'csv': 'csv', 'npz': 'npz', 'parquet': 'parquet', 'arrow': 'arrow', 'csr': 'csr.npz'}
+
+# available formats and compressions for the JSON output
+JSON_FORMATS = ['json', 'jsonl']
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+# file extensions of the compressions, they are appended to the file name
+COMPRESSION_EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def column_types(columns, rows):
+    """Type of every column, int if every value is an integer, float if every value is numeric and str otherwise.
+
+    The type only depends on the values which are present in the rows, missing values are 0 (int).
+
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    :rtype: dict
+    :returns: dict of column name -> 'int', 'float' or 'str'
+    """
+    kinds = dict.fromkeys(columns, 'int')
+    for row in rows:
+        for column, value in row.items():
+            kind = kinds.get(column)
+            if kind is None or kind == 'str':
+                continue
+            if not isinstance(value, (int, np.integer)):
+                kinds[column] = 'float' if isinstance(value, (float, np.floating)) else 'str'
+    return kinds
+
+
+def _column(rows, column):
+    """Values of one column in the order of the rows, missing values are 0."""
+    return [row.get(column, 0) for row in rows]
+
+
+def _arrow():
+    try:
+        import pyarrow
+        import pyarrow.feather
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception('pyarrow is required for the parquet and arrow output formats')
+    return pyarrow
+
+
+def write_npz(filename, columns, rows):
+    """Write the rows as NumPy archive.
+
+    The archive contains the column names in order (columns), the names of the int, float and str columns (int_columns, float_columns, str_columns)
+    and one matrix per type (ints, floats, strs) with one row per column.
+    The numeric matrices are filled with the values present in the rows, the string matrix is built one column at a time.
+
+    :param str filename: name of the file
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    """
+    kinds = column_types(columns, rows)
+    names = {'int': [], 'float': [], 'str': []}
+    for column in columns:
+        names[kinds[column]].append(column)
+
+    arrays = {'columns': np.array(columns, dtype=str)}
+    for kind, dtype in [('int', np.int64), ('float', np.float64)]:
+        position = {column: i for i, column in enumerate(names[kind])}
+        matrix = np.zeros((len(names[kind]), len(rows)), dtype=dtype)
+        for j, row in enumerate(rows):
+            for column, value in row.items():
+                if column in position:
+                    matrix[position[column], j] = value
+        arrays['{}_columns'.format(kind)] = np.array(names[kind], dtype=str)
+        arrays['{}s'.format(kind)] = matrix
+
+    arrays['str_columns'] = np.array(names['str'], dtype=str)
+    arrays['strs'] = np.array([_column(rows, column) for column in names['str']], dtype=str).reshape(len(names['str']), len(rows))
+    np.savez(filename, **arrays)
+
+
+def read_npz(filename):
+    """Read a table written with :func:`write_npz`.
+
+    Every column is a view of the matrix of its type, nothing is copied.
+
+    :param str filename: name of the file
+    :rtype: tuple
+    :returns: ordered column names and dict of column name -> NumPy array
+    """
+    with np.load(filename) as data:
+        table = {}
+        for kind in ['int', 'float', 'str']:
+            matrix = data['{}s'.format(kind)]
+            for i, column in enumerate(data['{}_columns'.format(kind)].tolist()):
+                table[column] = matrix[i]
+        return data['columns'].tolist(), table
+
+
+def _arrow_table(columns, rows):
+    """Arrow table of the rows, the values of every column are collected and converted one column at a time."""
+    pa = _arrow()
+    types = {'int': pa.int64(), 'float': pa.float64(), 'str': pa.string()}
+    kinds = column_types(columns, rows)
+    arrays = []
+    for column in columns:
+        values = _column(rows, column)
+        if kinds[column] == 'str':
+            values = [str(value) for value in values]
+        arrays.append(pa.array(values, type=types[kinds[column]]))
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def write_parquet(filename, columns, rows):
+    """Write the rows as Parquet file, requires pyarrow.
+
+    :param str filename: name of the file
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    """
+    _arrow().parquet.write_table(_arrow_table(columns, rows), filename)
+
+
+def write_arrow(filename, columns, rows):
+    """Write the rows as Arrow IPC (Feather V2) file, requires pyarrow.
+
+    :param str filename: name of the file
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    """
+    _arrow().feather.write_feather(_arrow_table(columns, rows), filename, compression='uncompressed')
+
+
+def read_arrow_table(filename):
+    """Read a table written with :func:`write_parquet` or :func:`write_arrow`, requires pyarrow.
+
+    Arrow files are memory mapped, numeric columns without missing values are converted to NumPy arrays without copies.
+
+    :param str filename: name of the file
+    :rtype: tuple
+    :returns: ordered column names and dict of column name -> NumPy array
+    """
+    pa = _arrow()
+    if filename.endswith('.parquet'):
+        data = pa.parquet.read_table(filename)
+    else:
+        data = pa.feather.read_table(filename, memory_map=True)
+
+    table = {}
+    for column in data.column_names:
+        table[column] = data.column(column).to_numpy()
+    return data.column_names, table
+
+
+def write_table(filename, output_format, columns, rows):
+    """Write the rows in the given binary output format.
+
+    :param str filename: name of the file
+    :param str output_format: one of the binary :data:`OUTPUT_FORMATS`
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    """
+    if output_format == 'npz':
+        write_npz(filename, columns, rows)
+    elif output_format == 'parquet':
+        write_parquet(filename, columns, rows)
+    elif output_format == 'arrow':
+        write_arrow(filename, columns, rows)
+    else:
+        raise Exception('Unknown output format {}'.format(output_format))
+
+
+def read_table(filename):
+    """Read a table written in one of the binary output formats, the format is determined by the file extension.
+
+    :param str filename: name of the file
+    :rtype: tuple
+    :returns: ordered column names and dict of column name -> NumPy array
+    """
+    if filename.endswith('.npz'):
+        return read_npz(filename)
+    elif filename.endswith(('.parquet', '.arrow')):
+        return read_arrow_table(filename)
+    raise Exception('Unknown output format of {}'.format(filename))
+
+
+def write_csr(filename, index_filename, columns, rows):
+    """Write sparse rows as compressed sparse row (CSR) matrix.
+
+    The rows are the aggregated instances, keys which are missing in a row are 0, they are never filled in.
+    Numeric columns are stored in the CSR matrix (as float64), its column index file contains one column name per line.
+    The archive uses the same keys as :func:`scipy.sparse.save_npz` (format, shape, data, indices, indptr) so that it can be loaded with :func:`scipy.sparse.load_npz`.
+    String columns (e.g., file) are stored dense in the same archive, see :func:`write_npz`.
+
+    :param str filename: name of the npz file
+    :param str index_filename: name of the column index file
+    :param list columns: ordered column names
+    :param list rows: list of dicts with column name -> value for every row
+    """
+    kinds = column_types(columns, rows)
+    numeric = [column for column in columns if kinds[column] != 'str']
+    strings = [column for column in columns if kinds[column] == 'str']
+    index = {column: j for j, column in enumerate(numeric)}
+
+    data = []
+    indices = []
+    indptr = [0]
+    for row in rows:
+        entries = sorted((index[column], value) for column, value in row.items() if column in index and value != 0)
+        indices.extend(j for j, _ in entries)
+        data.extend(value for _, value in entries)
+        indptr.append(len(indices))
+
+    arrays = {'format': np.array(b'csr'),
+              'shape': np.array([len(rows), len(numeric)], dtype=np.int64),
+              'data': np.array(data, dtype=np.float64),
+              'indices': np.array(indices, dtype=np.int32),
+              'indptr': np.array(indptr, dtype=np.int64),
+              'str_columns': np.array(strings, dtype=str),
+              'strs': np.array([_column(rows, column) for column in strings], dtype=str).reshape(len(strings), len(rows))}
+    np.savez(filename, **arrays)
+
+    with open(index_filename, 'w') as outfile:
+        for column in numeric:
+            outfile.write(column + '\n')
+
+
+def read_csr(filename, index_filename):
+    """Read a sparse matrix written with :func:`write_csr`.
+
+    :param str filename: name of the npz file
+    :param str index_filename: name of the column index file
+    :rtype: dict
+    :returns: dict with the numeric column names (columns), the CSR arrays (data, indices, indptr), the shape and the string columns (strings, column name -> array)
+    """
+    with open(index_filename, 'r') as f:
+        columns = f.read().splitlines()
+
+    with np.load(filename) as data:
+        strings = {}
+        for i, column in enumerate(data['str_columns'].tolist()):
+            strings[column] = data['strs'][i]
+        return {'columns': columns, 'data': data['data'], 'indices': data['indices'], 'indptr': data['indptr'], 'shape': tuple(data['shape'].tolist()), 'strings': strings}
+
+
+def open_text(filename, mode='r'):
+    """Open a text file which is compressed according to its extension (.gz for gzip, .zst for zstd).
+
+    :param str filename: name of the file
+    :param str mode: 'r' for reading or 'w' for writing
+    :returns: text file object
+    """
+    if filename.endswith(COMPRESSION_EXTENSIONS['gzip']):
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+
+    if filename.endswith(COMPRESSION_EXTENSIONS['zstd']):
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception('zstandard is required for zstd compression')
+
+        if mode == 'w':
+            stream = zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'), closefd=True)
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+
+    return open(filename, mode)
+
+
+def write_jsonl(filename, objects, metadata=None):
+    """Write JSON Lines, every object is encoded and written on its own line as it is produced.
+
+    :param str filename: name of the file, the compression is determined by the extension
+    :param objects: iterable of JSON serializable objects
+    :param dict metadata: optional metadata which is written as the first line (e.g., the release date)
+    """
+    with open_text(filename, 'w') as outfile:
+        if metadata is not None:
+            outfile.write(json.dumps(metadata, sort_keys=True) + '\n')
+        for obj in objects:
+            outfile.write(json.dumps(obj, sort_keys=True) + '\n')
+
+
+class JsonlReader(object):
+    """Lazy reader of JSON Lines written with :func:`write_jsonl`, only one line is decoded at a time.
+
+    The reader is a context manager, the file is closed when the context is left even if the objects are not read completely,
+    and when all objects are read.
+
+    :param str filename: name of the file, the compression is determined by the extension
+    :param bool metadata: if the file starts with a metadata line, it is read immediately and available as metadata
+    """
+
+    def __init__(self, filename, metadata=False):
+        self.metadata = None
+        self._file = open_text(filename, 'r')
+        if metadata:
+            try:
+                self.metadata = json.loads(self._file.readline())
+            except Exception:
+                self._file.close()
+                raise
+
+    def __iter__(self):
+        try:
+            for line in self._file:
+                yield json.loads(line)
+        finally:
+            self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_jsonl(filename, metadata=False):
+    """Lazily read JSON Lines written with :func:`write_jsonl`, see :class:`JsonlReader`.
+
+    :param str filename: name of the file, the compression is determined by the extension
+    :param bool metadata: if the file starts with a metadata line
+    :rtype: JsonlReader
+    :returns: reader which iterates over the objects, use it as context manager if the objects may not be read completely
+    """
+    return JsonlReader(filename, metadata)
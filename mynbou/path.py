@@ -17,11 +17,17 @@ import networkx as nx
 from Levenshtein import distance
 from dateutil.relativedelta import relativedelta
 
-from pycoshark.mongomodels import Commit, CodeEntityState, FileAction, File, Issue, Hunk, Refactoring, CommitChanges
-from pycoshark.utils import java_filename_filter, jira_is_resolved_and_fixed, get_commit_graph, heuristic_renames
+from pycoshark.utils import java_filename_filter
 
 from bson.objectid import ObjectId
 from mynbou.constants import *
+from mynbou.metrics.change import ChangeMetricsAccumulator
+from mynbou.repository import MongoRepository, chunked
+from mynbou import instrumentation
+
+
+# number of commits whose documents (file actions, files, issues, refactorings, ...) are loaded at once
+COMMIT_BATCH_SIZE = 1000
 
 
 class OntdekBaan(object):
@@ -105,12 +111,31 @@ class Volg(object):
     If we encounter a copy operation we do not add the old name of the file to the aliases because that file contiues to exist and we would then mix them up.
     """
 
-    def __init__(self, graph, vcs, target_release_hash):
+    def __init__(self, graph, vcs, target_release_hash, dambros_window_size_days=14, accumulate=False, state=None, repository=None):
         self._log = logging.getLogger(self.__class__.__name__)
 
+        # every query goes through the repository, see mynbou.repository
+        self._repository = repository if repository is not None else MongoRepository(vcs)
+
+        # intermediate per commit data which may be shared between releases, see VolgState
+        self._state = state
+
+        # renames and added files per commit, kept in the state if there is one
+        self._renames = state.renames if state is not None else {}
+        self._additions = state.additions if state is not None else {}
+
+        # ids of the files of the aliases for the D'Ambros samples, loaded with the first sample
+        self._alias_file_ids = None
+
         # the metrics that are collected for each file
         self._init_metrics = {'change_types': [], 'bug_fixes': [], 'authors': [], 'revisions': [], 'lines_added': [], 'lines_deleted': [], 'changesets': [], 'ages': [], 'aliases': [], 'linked_issues': [], 'commit_messages': [], 'days_from_release': [], 'refactorings': []}
 
+        # in accumulator mode we do not keep the raw lists per file, every change directly updates the Moser and Hassan metrics
+        self.accumulator = None
+        if accumulate:
+            for k in ['authors', 'revisions', 'lines_added', 'lines_deleted', 'changesets', 'ages', 'commit_messages', 'days_from_release']:
+                del self._init_metrics[k]
+
         # global cache of expensive first occurence calculation for files
         self._first_occurences = {}
 
@@ -125,47 +150,121 @@ class Volg(object):
 
         self._target_release_hash = target_release_hash
 
+        # every commit with a path to the release
+        self._release_ancestors = nx.ancestors(graph, target_release_hash) | {target_release_hash}
+
+        # if the last release mined with the state is an ancestor, only the commits since that release are loaded
+        history, new_commits = self._last_release(graph)
+
         # all paths back to origin
-        self._origin_paths = self._origin_paths(graph, target_release_hash)
+        with instrumentation.stage('origin_paths'):
+            self._origin_paths = self._origin_paths(graph, target_release_hash)
 
         # all paths back to origin for 6 months
-        self._change_paths = self._change_paths(vcs, graph, target_release_hash)
+        with instrumentation.stage('change_paths'):
+            cutoff, dates = self._ancestor_dates(target_release_hash, history, new_commits)
+            self._change_paths = self._change_paths(vcs, graph, target_release_hash, cutoff, dates)
+
+        # ancestors within the 6 month window
+        window = {revision_hash: date for revision_hash, date in dates.items() if date is not None and date >= cutoff}
 
         self._vcs = vcs
 
         # get release files
-        c = Commit.objects.get(vcs_system_id=vcs.id, revision_hash=target_release_hash)
-        for ces in CodeEntityState.objects.filter(id__in=c.code_entity_states, ce_type='file', long_name__endswith='.java'):
+        c = self._repository.commit(target_release_hash)
+        for ces in self._repository.entity_states(c.code_entity_states, ce_types=['file'], long_name_endswith='.java'):
             if java_filename_filter(ces.long_name, production_only=True):
                 self._release_files.append(ces.long_name)
                 self._change_metrics[ces.long_name] = copy.deepcopy(self._init_metrics)
 
         self._release_commit = c
 
+        if accumulate:
+            self.accumulator = ChangeMetricsAccumulator(self._release_files)
+
         # and release date
         self._release_date = c.committer_date
 
         # used to track static metric deltas to construct dambros delta matrix
-        self._dambros_values = []
+        # we can sample for multiple window sizes at once, every window size gets its own samples
         self._dambros_metrics_used = ['wmc', 'dit', 'rfc', 'noc', 'cbo', 'lcom5', 'nii', 'noi', 'tna', 'tnpa', 'tna-tnpa', 'tna-tnla', 'tloc', 'tnm', 'tnlpm', 'tnm-tnpm', 'tnm-tnlm']
-        self._dambros_window_size_days = 14
-        self._dambros_last_date = self._release_date + relativedelta(days=self._dambros_window_size_days + 1)
+        if isinstance(dambros_window_size_days, (list, tuple)):
+            self._dambros_window_sizes = list(dambros_window_size_days)
+        else:
+            self._dambros_window_sizes = [dambros_window_size_days]
+        self._dambros_values = {size: [] for size in self._dambros_window_sizes}
+        self._dambros_last_date = {size: self._release_date + relativedelta(days=size + 1) for size in self._dambros_window_sizes}
 
         # get first occurences of release files
-        self._first_occurences, self._aliases, self._file_name_changes = self.first_occured(vcs, self._origin_paths, self._release_files)
+        if self._state is not None and target_release_hash in self._state.releases.keys():
+            self._first_occurences, self._aliases, self._file_name_changes = self._state.releases[target_release_hash]
+        else:
+            with instrumentation.stage('first_occured'):
+                replay = self._replay_since(history, new_commits, self._release_files) if history is not None else None
+                if replay is None:
+                    commits = [c for c in self._repository.commits_by_date() if c.revision_hash in self._release_ancestors and len(c.parents) <= 1]
+                    replay = self._replay(commits, self._release_files)
+                self._first_occurences, self._aliases, self._file_name_changes = self.first_occured(vcs, replay)
+            if self._state is not None:
+                self._state.releases[target_release_hash] = (self._first_occurences, self._aliases, self._file_name_changes)
+                self._state.history = dict(replay, release=target_release_hash, cutoff=cutoff, dates=window)
+
+        # commits which dropped out of the window are not needed for later releases
+        if self._state is not None:
+            self._state.prune(self._release_ancestors, window)
+
+    def __getstate__(self):
+        """Volg is pickled for checkpoints without the state which is shared between releases and saved on its own and without the repository."""
+        d = self.__dict__.copy()
+        d['_state'] = None
+        d['_repository'] = None
+        d['_renames'] = {}
+        d['_additions'] = {}
+        return d
 
     def _origin_paths(self, graph, target_release_hash):
         o = OntdekBaan(graph)
         o.set_path(target_release_hash, 'backward')
         return list(o.all_paths())
 
-    def _change_paths(self, vcs, graph, target_release_hash):
-        target_release = Commit.objects.get(vcs_system_id=vcs.id, revision_hash=target_release_hash)
-        previous1 = target_release.committer_date - relativedelta(months=6)
+    def _last_release(self, graph):
+        """The history of the last release mined with the state and the commits since that release.
+
+        :rtype: tuple
+        :returns: the history of the state and revision hash -> commit (parents, committer and author date) of the ancestors of our release which are not ancestors of the last release,
+                  None and None if there is no state or the last release is not an ancestor of our release
+        """
+        if self._state is None or self._state.history is None or self._state.history['release'] not in self._release_ancestors:
+            return None, None
+
+        history = self._state.history
+        known = nx.ancestors(graph, history['release']) | {history['release']}
+        new_commits = self._repository.commits_by_hashes([revision_hash for revision_hash in self._release_ancestors if revision_hash not in known], fields=['parents', 'committer_date', 'author_date'])
+        return history, new_commits
+
+    def _ancestor_dates(self, target_release_hash, history, new_commits):
+        """The cutoff date of the change paths and the committer dates of the ancestors of the release.
+
+        The history contains the dates of the ancestors of the last release within its window.
+        If our window does not start before that window we only need the dates of the new commits, the ancestors without a date are outside of our window.
 
+        :rtype: tuple
+        :returns: cutoff date and revision hash -> committer date
+        """
+        target_release = self._repository.commit(target_release_hash, fields=['committer_date'])
+        cutoff = target_release.committer_date - relativedelta(months=6)
+
+        if history is not None and history['cutoff'] <= cutoff:
+            dates = dict(history['dates'])
+            dates.update((revision_hash, c.committer_date) for revision_hash, c in new_commits.items())
+            return cutoff, dates
+
+        # the traversal only visits ancestors of the release, their dates are loaded at once
+        return cutoff, {revision_hash: c.committer_date for revision_hash, c in self._repository.commits_by_hashes(self._release_ancestors, fields=['committer_date']).items()}
+
+    def _change_paths(self, vcs, graph, target_release_hash, cutoff, dates):
         def break_condition(commit):
-            tr = Commit.objects.get(revision_hash=commit, vcs_system_id=vcs.id)
-            return tr.committer_date < previous1
+            return commit not in dates or dates[commit] < cutoff
 
         o = OntdekBaan(graph)
         o.set_path(target_release_hash, 'backward', break_condition)
@@ -193,7 +292,7 @@ class Volg(object):
                     if path[i] in rename_cache:
                         renames = rename_cache[path[i]]
                     else:
-                        renames = heuristic_renames(self._vcs.id, path[i])
+                        renames = self._commit_renames(path[i])
                         rename_cache[path[i]] = renames
                     if renames is not None:
                         for rename in renames[0]:
@@ -207,7 +306,7 @@ class Volg(object):
                     if path[i-1] in rename_cache:
                         renames = rename_cache[path[i-1]]
                     else:
-                        renames = heuristic_renames(self._vcs.id, path[i-1])
+                        renames = self._commit_renames(path[i-1])
                         rename_cache[path[i-1]] = renames
                     if renames is not None:
                         for rename in renames[0]:
@@ -227,28 +326,31 @@ class Volg(object):
         
         files_release = self._release_files
 
-        commit_graph = get_commit_graph(self._vcs.id)
+        commit_graph = self._graph
         undirected_graph = commit_graph.to_undirected(as_view=True)
         rename_cache = {}
         delete_cache = {}
 
         all_fixed_issues = set()
         six_months = self._release_date + relativedelta(months=6)
-        for commit in Commit.objects.filter(vcs_system_id=self._vcs.id, committer_date__gt=self._release_date, committer_date__lt=six_months, labels__adjustedszz_bugfix=True, szz_issue_ids__0__exists=True).only('id', 'committer_date', 'szz_issue_ids', 'revision_hash').timeout(False):
-            for issue in Issue.objects.filter(id__in=commit.szz_issue_ids):
-                if str(issue.issue_type).lower() == "bug" and jira_is_resolved_and_fixed(issue):
+        for commit in self._repository.bugfix_commits('szz_issue_ids', self._release_date, six_months, label='adjustedszz_bugfix'):
+            for issue in self._repository.issues(commit.szz_issue_ids):
+                if str(issue.issue_type).lower() == "bug" and self._repository.is_resolved_and_fixed(issue):
                     all_fixed_issues.add(issue)
 
         ret = {rfile: [] for rfile in files_release}
 
         for issue in all_fixed_issues:
-            for bugfix_commit in Commit.objects.filter(vcs_system_id=self._vcs.id, labels__adjustedszz_bugfix=True, szz_issue_ids=issue.id, committer_date__gt=self._release_date, committer_date__lt=six_months).only('revision_hash', 'id', 'szz_issue_ids', 'committer_date').timeout(False):
+            bugfix_commits = list(self._repository.bugfix_commits('szz_issue_ids', self._release_date, six_months, label='adjustedszz_bugfix', issue_id=issue.id))
+            file_actions = self._repository.file_actions_for_commits([c.id for c in bugfix_commits], ['M'])
+            files = self._repository.files_by_ids([fa.file_id for fas in file_actions.values() for fa in fas])
+            for bugfix_commit in bugfix_commits:
                 
                 # in comparison to issues_six_months_szzr() we skip the inducing step and just use every bugfix commit within 6 months window
                 changed_files = set()
-                for fa in FileAction.objects.filter(commit_id=bugfix_commit.id, mode='M'):
+                for fa in file_actions[bugfix_commit.id]:
 
-                    f = File.objects.get(id=fa.file_id)
+                    f = files[fa.file_id]
                     if f.path not in changed_files and java_filename_filter(f.path):
                         changed_files.add(f.path)
 
@@ -278,34 +380,37 @@ class Volg(object):
         
         files_release = self._release_files
 
-        commit_graph = get_commit_graph(self._vcs.id)
+        commit_graph = self._graph
         undirected_graph = commit_graph.to_undirected(as_view=True)
         rename_cache = {}
         delete_cache = {}
 
         all_fixed_issues = set()
         six_months = self._release_date + relativedelta(months=6)
-        for commit in Commit.objects.filter(vcs_system_id=self._vcs.id, committer_date__gt=self._release_date, committer_date__lt=six_months, labels__issueonly_bugfix=True, linked_issue_ids__0__exists=True).only('id', 'committer_date', 'linked_issue_ids', 'revision_hash').timeout(False):
-            for issue in Issue.objects.filter(id__in=commit.linked_issue_ids):
-                if str(issue.issue_type).lower() == "bug" and jira_is_resolved_and_fixed(issue):
+        for commit in self._repository.bugfix_commits('linked_issue_ids', self._release_date, six_months, label='issueonly_bugfix'):
+            for issue in self._repository.issues(commit.linked_issue_ids):
+                if str(issue.issue_type).lower() == "bug" and self._repository.is_resolved_and_fixed(issue):
                     all_fixed_issues.add(issue)
 
         ret = {rfile: [] for rfile in files_release}
 
         for issue in all_fixed_issues:
-            for bugfix_commit in Commit.objects.filter(vcs_system_id=self._vcs.id, linked_issue_ids=issue.id, committer_date__gt=self._release_date, labels__issueonly_bugfix=True, committer_date__lt=six_months).only('revision_hash', 'id', 'linked_issue_ids', 'committer_date').timeout(False):
+            bugfix_commits = list(self._repository.bugfix_commits('linked_issue_ids', self._release_date, six_months, label='issueonly_bugfix', issue_id=issue.id))
+            file_actions = self._repository.file_actions_for_commits([c.id for c in bugfix_commits], ['M'])
+            files = self._repository.files_by_ids([fa.file_id for fas in file_actions.values() for fa in fas])
+            for bugfix_commit in bugfix_commits:
                 
                 # calculate if there are any inducings for this fa with the specific label
                 # if yes then we consider it?
 
                 changed_files = set()
-                for fa in FileAction.objects.filter(commit_id=bugfix_commit.id, mode='M'):
+                for fa in file_actions[bugfix_commit.id]:
 
                     # check if we find at least one inducing to this fa
-                    if not FileAction.objects.filter(induces__match={'change_file_action_id': fa.id, 'label': 'JL+R'}).count() > 0:
+                    if not self._repository.inducing_file_actions(fa.id, 'JL+R'):
                         continue
 
-                    f = File.objects.get(id=fa.file_id)
+                    f = files[fa.file_id]
                     if f.path not in changed_files and java_filename_filter(f.path):
                         changed_files.add(f.path)
 
@@ -342,29 +447,31 @@ class Volg(object):
         skipped_issues = set()
         all_fixed_issues = set()
 
-        for commit in Commit.objects.filter(vcs_system_id=self._vcs.id, committer_date__gt=self._release_date, labels__validated_bugfix=True, fixed_issue_ids__0__exists=True).only('id', 'committer_date', 'fixed_issue_ids', 'revision_hash').timeout(False):
-            for issue in Issue.objects.filter(id__in=commit.fixed_issue_ids):
-                if issue.issue_type_verified and issue.issue_type_verified.lower() == "bug" and jira_is_resolved_and_fixed(issue):
+        for commit in self._repository.bugfix_commits('fixed_issue_ids', self._release_date, label='validated_bugfix'):
+            for issue in self._repository.issues(commit.fixed_issue_ids):
+                if issue.issue_type_verified and issue.issue_type_verified.lower() == "bug" and self._repository.is_resolved_and_fixed(issue):
                     all_fixed_issues.add(issue)
 
         for issue in all_fixed_issues:
             inducings_have_path = True
             blame_commits = []
 
-            for bugfix_commit in Commit.objects.filter(vcs_system_id=self._vcs.id, fixed_issue_ids=issue.id, committer_date__gt=self._release_date).only('revision_hash', 'id', 'fixed_issue_ids', 'committer_date').timeout(False):
+            bugfix_commits = list(self._repository.bugfix_commits('fixed_issue_ids', self._release_date, issue_id=issue.id))
+            file_actions = self._repository.file_actions_for_commits([c.id for c in bugfix_commits], ['M'])
+            for bugfix_commit in bugfix_commits:
 
-                for fa in FileAction.objects.filter(commit_id=bugfix_commit.id, mode='M'):
+                for fa in file_actions[bugfix_commit.id]:
 
                     # load bug_inducing FileActions
-                    for ifa in FileAction.objects.filter(induces__match={'change_file_action_id': fa.id, 'label': 'JLMIV+R'}):
+                    for ifa in self._repository.inducing_file_actions(fa.id, 'JLMIV+R'):
 
                         # still need to fetch the correct one
                         for ind in ifa.induces:
                             if ind['change_file_action_id'] == fa.id and ind['label'] == 'JLMIV+R' and ind['szz_type'] != 'hard_suspect':
 
-                                bc = Commit.objects.get(id=ifa.commit_id)
+                                bc = self._repository.commit_by_id(ifa.commit_id)
                                 blame_commit = bc.revision_hash
-                                blame_file = File.objects.get(id=ifa.file_id).path
+                                blame_file = self._repository.file(ifa.file_id).path
 
                                 blame_id = '{}_{}'.format(blame_commit, issue.external_id)
 
@@ -413,125 +520,225 @@ class Volg(object):
                             skipped_issues.remove(i[0])
         return ret_issues
 
-    def _add_linked_issues(self, file, commit):
-        for issue_id in commit.linked_issue_ids:
-            i = Issue.objects.get(id=issue_id)
-            self._change_metrics[file]['linked_issues'].append({'external_id': i.external_id, 'priority': i.priority, 'issue_type': i.issue_type})
+    def _commit_changes(self, revision_hash):
+        """Collect the change events of a commit, see :meth:`_commits_changes`."""
+        return self._commits_changes([revision_hash])[revision_hash]
 
-    def _add_change_metrics(self, file, fa, commit):
-        """Add change metrics to our current batch.
+    def _commits_changes(self, revision_hashes):
+        """Collect the change events of the commits.
 
-        It prepends to a list because we are traversing backwards from the release date.
+        Without a state we only collect data for files we are interested in.
+        With a state we collect everything so that later releases can reuse the changes of the commit and we only query commits which are not already in the state.
+        The documents of the commits are loaded in batches of COMMIT_BATCH_SIZE commits.
+
+        :param revision_hashes: revision hashes of the commits
+        :rtype: dict
+        :returns: revision hash -> change events of the commit
         """
-        author_identity = commit.author_id  # author_identity = Identity.objects.get(people=commit.author_id)  for now we ignore Identities
+        ret = {}
+        missing = []
+        for revision_hash in dict.fromkeys(revision_hashes):
+            if self._state is not None and revision_hash in self._state.changes.keys():
+                ret[revision_hash] = self._state.changes[revision_hash]
+            else:
+                missing.append(revision_hash)
+
+        for batch in chunked(missing, COMMIT_BATCH_SIZE):
+            ret.update(self._load_commits_changes(batch))
+        return ret
+
+    def _load_commits_changes(self, revision_hashes):
+        complete = self._state is not None
+        commits = self._repository.commits_by_hashes(revision_hashes)
+
+        # merge commits are skipped as we traverse all possible paths
+        single = [commits[revision_hash] for revision_hash in revision_hashes if len(commits[revision_hash].parents) <= 1]
+        parents = self._repository.commits_by_hashes([c.parents[0] for c in single if c.parents], fields=[])
+        file_actions = self._repository.file_actions_for_commits([c.id for c in single])
+        files = self._repository.files_by_ids([fa.file_id for fas in file_actions.values() for fa in fas])
+
+        ret = {}
+        for revision_hash in revision_hashes:
+            c = commits[revision_hash]
+            ret[revision_hash] = {'revision_hash': c.revision_hash, 'parents': c.parents, 'committer_date': c.committer_date,
+                                  'author': '{}'.format(c.author_id), 'message': c.message,  # author_identity = Identity.objects.get(people=commit.author_id)  for now we ignore Identities
+                                  'file_actions': [], 'linked_issues': [], 'changeset': 0, 'refactorings': [], 'change_types': []}
+
+            if len(c.parents) > 1:
+                continue
+
+            for fa in file_actions[c.id]:
+                f = files[fa.file_id]
+
+                # skip file we are not interested in
+                if complete or f.path in self._aliases.keys():
+                    ret[revision_hash]['file_actions'].append((f.path, fa.lines_added, fa.lines_deleted))
+
+        # issues, hunks and refactorings are only needed for commits with file actions we are interested in
+        changed = [c for c in single if ret[c.revision_hash]['file_actions']]
+        issues = self._repository.issues_by_ids([issue_id for c in changed for issue_id in c.linked_issue_ids])
+        hunks = self._repository.hunk_counts([fa.id for c in changed for fa in file_actions[c.id]])
+        refactorings = self._repository.refactorings_for_commits([c.id for c in changed])
+        states = self._repository.entity_states_by_ids([ref.ce_state['ce_after'] for refs in refactorings.values() for ref in refs if 'ce_after' in ref.ce_state.keys()])
+        commit_changes = self._repository.commit_changes_for_commits([c.id for c in single if c.parents])
+
+        file_ids = [ces.file_id for ces in states.values()]
+        for cc in commit_changes.values():
+            file_ids += [ObjectId(file_id) for file_id in (cc.classification or {}).keys()]
+        files.update(self._repository.files_by_ids([file_id for file_id in file_ids if file_id not in files]))
+
+        for c in single:
+            changes = ret[c.revision_hash]
+
+            if changes['file_actions']:
+                for issue_id in c.linked_issue_ids:
+                    i = issues[issue_id]
+                    changes['linked_issues'].append({'external_id': i.external_id, 'priority': i.priority, 'issue_type': i.issue_type})
+
+                changes['changeset'] = sum(hunks.get(fa.id, 0) for fa in file_actions[c.id])
+
+                for ref in refactorings.get(c.id, []):
+                    if 'ce_after' in ref.ce_state.keys():
+                        ces = states[ObjectId(ref.ce_state['ce_after'])]
+                        file = files[ces.file_id]
+                        if complete or file.path in self._aliases.keys():
+                            changes['refactorings'].append((file.path, ref.type, ces.long_name))
+
+            if c.parents:
+                cc = commit_changes.get((parents[c.parents[0]].id, c.id))
+                if cc is not None:
+                    for file_id, file_changes in (cc.classification or {}).items():
+                        file = files[ObjectId(file_id)]
+                        if complete or file.path in self._aliases.keys():
+                            changes['change_types'].append((file.path, file_changes))
+
+        if complete:
+            self._state.changes.update(ret)
+        return ret
 
-        self._change_metrics[file]['authors'] = ['{}'.format(author_identity)] + self._change_metrics[file]['authors']
-        self._change_metrics[file]['revisions'] = [commit.revision_hash] + self._change_metrics[file]['revisions']
-        self._change_metrics[file]['lines_added'] = [fa.lines_added] + self._change_metrics[file]['lines_added']
-        self._change_metrics[file]['lines_deleted'] = [fa.lines_deleted] + self._change_metrics[file]['lines_deleted']
-        self._change_metrics[file]['changesets'] = [len(Hunk.objects.filter(file_action_id__in=[ffa.id for ffa in FileAction.objects.filter(commit_id=commit.id)]))] + self._change_metrics[file]['changesets']
-        self._change_metrics[file]['commit_messages'] = [commit.message] + self._change_metrics[file]['commit_messages']
+    def _add_linked_issues(self, file, changes):
+        for issue in changes['linked_issues']:
+            self._change_metrics[file]['linked_issues'].append(dict(issue))
 
+    def _add_change_metrics(self, file, lines_added, lines_deleted, changes):
+        """Add change metrics to our current batch.
+
+        It prepends to a list because we are traversing backwards from the release date.
+        In accumulator mode the change is only added to the running metrics of the accumulator.
+        """
         # we also calculate a list of ages to calulate weighted age later
         # weighted age according to Moser et al.
-        td = commit.committer_date - self._first_occurences[file]
-        td2 = self._release_date - commit.committer_date
+        td = changes['committer_date'] - self._first_occurences[file]
+        td2 = self._release_date - changes['committer_date']
+
+        if self.accumulator is not None:
+            self.accumulator.add(file, changes['revision_hash'], changes['author'], changes['message'], lines_added, lines_deleted, changes['changeset'], td.days, td2.days)
+            return
+
+        self._change_metrics[file]['authors'] = [changes['author']] + self._change_metrics[file]['authors']
+        self._change_metrics[file]['revisions'] = [changes['revision_hash']] + self._change_metrics[file]['revisions']
+        self._change_metrics[file]['lines_added'] = [lines_added] + self._change_metrics[file]['lines_added']
+        self._change_metrics[file]['lines_deleted'] = [lines_deleted] + self._change_metrics[file]['lines_deleted']
+        self._change_metrics[file]['changesets'] = [changes['changeset']] + self._change_metrics[file]['changesets']
+        self._change_metrics[file]['commit_messages'] = [changes['message']] + self._change_metrics[file]['commit_messages']
         self._change_metrics[file]['ages'] = [td.days] + self._change_metrics[file]['ages']
         self._change_metrics[file]['days_from_release'] = [td2.days] + self._change_metrics[file]['days_from_release']
 
-    def _add_refactorings(self, commit):
+    def _add_refactorings(self, changes):
         cache = set()
-        for ref in Refactoring.objects.filter(commit_id=commit.id):
-            if 'ce_after' in ref.ce_state.keys():
-                ces = CodeEntityState.objects.get(id=ref.ce_state['ce_after'])
-                if ces:
-                    file = File.objects.get(id=ces.file_id)
-
-                    if file.path not in self._aliases.keys():
-                        continue
+        for (ref_file, ref, long_name) in changes['refactorings']:
+            if ref_file not in self._aliases.keys():
+                continue
+            cache.add((ref_file, ref, long_name))
 
-                    cache.add((file.path, ref.type, ces.long_name))
-                    # self._log.debug('[{}] refactoring File: {}, CES: {}, Type: {}'.format(revision_hash, file.path, ces.long_name, ref.type))
         for (ref_file, ref, long_name) in cache:
             self._change_metrics[self._aliases[ref_file]]['refactorings'].append(ref)
 
-    def _add_change_types(self, old_commit, new_commit):
-        try:
-            cc = CommitChanges.objects.get(old_commit_id=old_commit.id, new_commit_id=new_commit.id)
-        except CommitChanges.DoesNotExist:
-            return
-
-        if not cc.classification:
-            return
-
-        for file_id, changes in cc.classification.items():
-            file = File.objects.get(id=file_id)
+    def _add_change_types(self, changes):
+        for file, file_changes in changes['change_types']:
 
-            if file.path not in self._aliases.keys():
+            if file not in self._aliases.keys():
                 continue
 
             # initialize the file with 0 if it does not exist
             change_types = {d: 0 for d in CHANGE_TYPES}
 
             # update with new values
-            for ctype, cvalue in changes.items():
+            for ctype, cvalue in file_changes.items():
                 change_types[ctype.lower()] += cvalue
 
-            self._change_metrics[self._aliases[file.path]]['change_types'] += [change_types]
+            self._change_metrics[self._aliases[file]]['change_types'] += [change_types]
 
-    def _add_dambros_metrics(self, commit):
-        """Use for dambros."""
-        # 1. check if current commit is within the window_size in days, if yes skip this commit
-        if self._dambros_last_date - relativedelta(days=self._dambros_window_size_days) < commit.committer_date:
-            return
+    def _dambros_sample(self, revision_hash):
+        """Collect the averaged class metrics per file of the commit.
+
+        Without a state we only query the files in our aliases, with a state we query every file and keep the result in the state.
+        """
+        if self._state is not None and revision_hash in self._state.dambros.keys():
+            return self._state.dambros[revision_hash]
 
-        self._dambros_last_date = commit.committer_date
+        commit = self._repository.commit(revision_hash)
 
         # we need to collect the classes per file
-        files = File.objects.filter(path__in=self._aliases.keys())
+        file_ids = None
+        if self._state is None:
+            if self._alias_file_ids is None:
+                self._alias_file_ids = [f.id for f in self._repository.files_by_paths(list(self._aliases.keys()))]
+            file_ids = self._alias_file_ids
 
         # 2. if not collect metrics from the commit and filter for files in our aliases
-        classes = CodeEntityState.objects().aggregate(*[
-            {'$match': {'_id': {'$in': [ObjectId(cesid) for cesid in commit.code_entity_states]}, 'ce_type': 'class', 'file_id': {'$in': [ObjectId(f.id) for f in files]}}},
-            {'$group': {'_id': '$file_id',
-                        'wmc': {'$avg': '$metrics.WMC'},
-                        'dit': {'$avg': '$metrics.DIT'},
-                        'rfc': {'$avg': '$metrics.RFC'},
-                        'noc': {'$avg': '$metrics.NOC'},
-                        'cbo': {'$avg': '$metrics.CBO'},
-                        'lcom5': {'$avg': '$metrics.LCOM5'},
-                        'nii': {'$avg': '$metrics.NII'},
-                        'noi': {'$avg': '$metrics.NOI'},
-                        'tna': {'$avg': '$metrics.TNA'},
-                        'tnpa': {'$avg': '$metrics.TNPA'},
-                        'tloc': {'$avg': '$metrics.TLOC'},
-                        'tnm': {'$avg': '$metrics.TNM'},
-                        'tnlpm': {'$avg': '$metrics.TNLPM'},
-                        'tnla': {'$avg': '$metrics.TNLA'},
-                        'tnpm': {'$avg': '$metrics.TNPM'},
-                        'tnlm': {'$avg': '$metrics.TNLM'}
-                        }},
-            {'$addFields': {'tna-tnpa': {'$subtract': ['$tna', '$tnpa']},
-                            'tna-tnla': {'$subtract': ['$tna', '$tnla']},
-                            'tnm-tnpm': {'$subtract': ['$tnm', '$tnpm']},
-                            'tnm-tnlm': {'$subtract': ['$tnm', '$tnlm']}}}
-        ])
-
-        # grouped by file id
-        tmp = {}
+        classes = list(self._repository.class_metrics(commit.code_entity_states, file_ids))
+        files = self._repository.files_by_ids([cl['_id'] for cl in classes])
+
+        # grouped by file path
+        sample = []
         for cl in classes:
-            f = File.objects.get(id=cl['_id'])
-            target = self._aliases[f.path]
+            f = files[ObjectId(cl['_id'])]
 
-            tmp[target] = {}
+            metrics = {}
             for m in self._dambros_metrics_used:
                 if m in cl.keys() and cl[m]:
-                    tmp[target][m] = cl[m]
+                    metrics[m] = cl[m]
+            sample.append((f.path, metrics))
+
+        if self._state is not None:
+            self._state.dambros[revision_hash] = sample
+        return sample
+
+    def _add_dambros_metrics(self, changes):
+        """Use for dambros.
+
+        The metrics of the commit are only queried once, even if the commit is a sample for multiple window sizes.
+        """
+        # 1. check if current commit is within the window_size in days, if yes skip this commit for that window size
+        sample_for = []
+        for size in self._dambros_window_sizes:
+            if self._dambros_last_date[size] - relativedelta(days=size) < changes['committer_date']:
+                continue
+            self._dambros_last_date[size] = changes['committer_date']
+            sample_for.append(size)
+
+        if not sample_for:
+            return
+
+        # grouped by release file
+        tmp = {}
+        for path, metrics in self._dambros_sample(changes['revision_hash']):
+            if path not in self._aliases.keys():
+                continue
+            tmp[self._aliases[path]] = dict(metrics)
 
-        self._dambros_values.append(tmp)
+        for size in sample_for:
+            self._dambros_values[size].append(tmp)
+
+    def dambros_deltas(self, window_size_days=None):
+        """Create the dambros delta matrix of our collected metrics.
+
+        :param int window_size_days: window size of the samples, defaults to the first window size Volg was initialized with
+        """
+        if window_size_days is None:
+            window_size_days = self._dambros_window_sizes[0]
 
-    def dambros_deltas(self):
-        """Create the dambros delta matrix of our collected metrics."""
         deltas = {}
         for m in self._dambros_metrics_used:
             deltas[m] = {}
@@ -539,10 +746,10 @@ class Volg(object):
                 deltas[m][file] = []
 
         # reverse the entries as we are going from release to end of change path
-        self._dambros_values = list(reversed(self._dambros_values))
+        values = list(reversed(self._dambros_values[window_size_days]))
 
         # create the deltas pairwise
-        for entry1, entry2 in zip(self._dambros_values[::2], self._dambros_values[1::2]):
+        for entry1, entry2 in zip(values[::2], values[1::2]):
             for file in self._aliases.values():
                 # if the file does not exist in our data in one or the other (or both) set the value to -1
                 if file not in entry1.keys() or file not in entry2.keys():
@@ -561,30 +768,29 @@ class Volg(object):
 
         Uses the change paths which uses a cutoff time.
         """
+        # the change events of every commit on the change paths are loaded in batches
+        changes_by_commit = self._commits_changes(revision_hash for path in self._change_paths for revision_hash in path)
+
         for path in self._change_paths:
             for revision_hash in path:
-                c = Commit.objects.get(vcs_system_id=self._vcs.id, revision_hash=revision_hash)
+                changes = changes_by_commit[revision_hash]
 
                 # skip merge commits as we traverse all possible paths
-                if len(c.parents) > 1:
+                if len(changes['parents']) > 1:
                     continue
 
-                for fa in FileAction.objects.filter(commit_id=c.id):
-                    f = File.objects.get(id=fa.file_id)
+                for file, lines_added, lines_deleted in changes['file_actions']:
 
                     # skip file we are not interested in
-                    if f.path not in self._aliases.keys():
+                    if file not in self._aliases.keys():
                         continue
 
-                    self._add_linked_issues(self._aliases[f.path], c)
-                    self._add_change_metrics(self._aliases[f.path], fa, c)
-                    self._add_refactorings(c)
-
-                if c.parents:
-                    prev = Commit.objects.get(vcs_system_id=self._vcs.id, revision_hash=c.parents[0])
-                    self._add_change_types(prev, c)
+                    self._add_linked_issues(self._aliases[file], changes)
+                    self._add_change_metrics(self._aliases[file], lines_added, lines_deleted, changes)
+                    self._add_refactorings(changes)
 
-                self._add_dambros_metrics(c)
+                self._add_change_types(changes)
+                self._add_dambros_metrics(changes)
 
         for file in self._change_metrics.keys():
             fo = self._first_occurences[file]
@@ -602,15 +808,23 @@ class Volg(object):
         This function uses another heuristic to detect renames by employing a string distance metric on the file name.
         This captures things like commons-math renames org.apache.math -> org.apache.math3.
         """
-        renames = {}
-        for fa in FileAction.objects.filter(commit_id=commit.id, mode='R'):
-            new_file = File.objects.get(id=fa.file_id)
-            old_file = File.objects.get(id=fa.old_file_id)
-
-            if old_file.path not in renames.keys():
-                renames[old_file.path] = []
-            renames[old_file.path].append(new_file.path)
-
+        if commit.revision_hash not in self._renames.keys():
+            self._prefetch_file_changes([commit])
+        return self._renames[commit.revision_hash]
+
+    def _commit_renames(self, revision_hash):
+        """Renames of the commit, see :meth:`_heuristic_renames`, the commit is only loaded (without its fields) if its renames are not cached."""
+        if revision_hash in self._renames.keys():
+            return self._renames[revision_hash]
+        return self._heuristic_renames(self._repository.commit(revision_hash, fields=[]))
+
+    def _probable_renames(self, renames):
+        """Select the most probable rename for every old file, see :meth:`_heuristic_renames`.
+
+        :param dict renames: old file path -> list of new file paths
+        :rtype: tuple
+        :returns: list of (old file, new file) renames and list of the remaining new files
+        """
         true_renames = []
         added_files = []
         for old_file, new_files in renames.items():
@@ -634,24 +848,61 @@ class Volg(object):
                 if new_file == probable_file:
                     continue
                 added_files.append(new_file)
+
         return true_renames, added_files
 
+    def _added_files(self, commit):
+        """Return the files added or copied in the commit."""
+        if commit.revision_hash not in self._additions.keys():
+            self._prefetch_file_changes([commit])
+        return self._additions[commit.revision_hash]
+
+    def _prefetch_file_changes(self, commits):
+        """Load the renames and added files of the commits which are not cached yet.
+
+        The file actions and files are loaded in batches of COMMIT_BATCH_SIZE commits.
+        """
+        missing = [c for c in commits if c.revision_hash not in self._renames.keys() or c.revision_hash not in self._additions.keys()]
+        for batch in chunked(missing, COMMIT_BATCH_SIZE):
+            file_actions = self._repository.file_actions_for_commits([c.id for c in batch], ['R', 'A', 'C'])
+            file_ids = []
+            for fas in file_actions.values():
+                for fa in fas:
+                    file_ids.append(fa.file_id)
+                    if fa.mode == 'R':
+                        file_ids.append(fa.old_file_id)
+            files = self._repository.files_by_ids(file_ids)
+
+            for c in batch:
+                renames = {}
+                added_files = []
+                for fa in file_actions[c.id]:
+                    if fa.mode == 'R':
+                        old_file = files[fa.old_file_id].path
+                        if old_file not in renames.keys():
+                            renames[old_file] = []
+                        renames[old_file].append(files[fa.file_id].path)
+                    else:
+                        added_files.append(files[fa.file_id].path)
+
+                self._renames[c.revision_hash] = self._probable_renames(renames)
+                self._additions[c.revision_hash] = added_files
+
     def _first_occured_fallback(self, vcs, file_name):
 
         needle = file_name
 
-        for c in Commit.objects.filter(vcs_system_id=vcs.id).order_by('-committer_date', '-author_date').only('id', 'revision_hash', 'parents', 'committer_date'):
+        commits = [c for c in self._repository.commits_by_date() if c.revision_hash in self._release_ancestors]
+        self._prefetch_file_changes(commits)
 
-            if not nx.has_path(self._graph, c.revision_hash, self._target_release_hash):
-                continue
+        for c in commits:
 
             # merge commits are allowd in fallback mode
             # if len(c.parents) > 1:
             #    continue
 
-            for fa in FileAction.objects.filter(commit_id=c.id, mode__in=['A', 'C']):
-                f = File.objects.get(id=fa.file_id)
-                if f.path == needle:
+            for added_file in self._added_files(c):
+                if added_file == needle:
                     return c.committer_date
 
             true_renames, false_renames = self._heuristic_renames(c)
@@ -663,33 +914,40 @@ class Volg(object):
                 if new_file == needle:
                     return c.committer_date
 
-    def first_occured(self, vcs, paths, release_files):
-        """Traverse all FileActions of all paths to find when which file was added.
+    def _replay(self, commits, release_files):
+        """Traverse the renames and additions of the commits to find when which file was added.
 
         Follows subsequent renames. We collect aliases for files because we need to know
         which names point to a file contained in the release.
         We do this by having key, value pairs of alias -> release file.
+
+        :param list commits: commits without merge commits, ordered by committer and author date descending
+        :param list release_files: files of the release
+        :rtype: dict
+        :returns: release_files, aliases, additions (file -> latest addition date), file_name_changes, rename_paths (both files of every true rename) and newest (committer date of the newest commit)
         """
         additions = {}
         aliases = {}
         file_name_changes = {}
+        rename_paths = set()
 
         # prefill aliases with release files
         for release_file in release_files:
             aliases[release_file] = release_file
 
-        for c in Commit.objects.filter(vcs_system_id=vcs.id).order_by('-committer_date', '-author_date').only('id', 'revision_hash', 'parents', 'committer_date'):
+        # the renames and additions of the commits are loaded in batches before the traversal
+        self._prefetch_file_changes(commits)
 
-            revision_hash = c.revision_hash
-            if not nx.has_path(self._graph, c.revision_hash, self._target_release_hash):
-                continue
+        for c in commits:
 
-            if len(c.parents) > 1:
-                continue
+            revision_hash = c.revision_hash
 
             true_renames, false_renames = self._heuristic_renames(c)
 
             for old_file, new_file in true_renames:
+                rename_paths.add(old_file)
+                rename_paths.add(new_file)
+
                 if old_file in aliases.keys() and new_file in aliases.keys() and aliases[old_file] != aliases[new_file]:
                     self._log.warning('[{}] would overwrite target {} of alias {} with target {}, creating fake addition of the target, skipping'.format(revision_hash, aliases[old_file], old_file, aliases[new_file]))
                     # test with fallback
@@ -716,30 +974,85 @@ class Volg(object):
             for new_file in false_renames:
                 added_files.append(new_file)
 
-            for fa in FileAction.objects.filter(commit_id=c.id, mode__in=['A', 'C']):
-                f = File.objects.get(id=fa.file_id)
-                added_files.append(f.path)
+            added_files += self._added_files(c)
 
+            # if we have multiple possible addition dates we use the max
             for new_file in added_files:
-                if new_file not in additions.keys():
-                    additions[new_file] = []
-                additions[new_file].append(c.committer_date)
+                if new_file not in additions.keys() or additions[new_file] < c.committer_date:
+                    additions[new_file] = c.committer_date
+
+        return {'release_files': set(release_files), 'aliases': aliases, 'additions': additions, 'file_name_changes': file_name_changes, 'rename_paths': rename_paths,
+                'newest': commits[0].committer_date if commits else None}
+
+    def _replay_since(self, history, new_commits, release_files):
+        """Replay the commits since the last release and continue with the replay of the last release from the history.
+
+        The result is the same as replaying every commit if the replay of the history takes the same steps after the new commits,
+        i.e., the new commits are newer than the commits of the history and the new aliases do not change which of the renamed files of the history are aliases.
+        Otherwise every commit has to be replayed.
+
+        :param dict history: history of the last release, see :meth:`_replay`
+        :param dict new_commits: revision hash -> commit of the ancestors which are not ancestors of the last release
+        :param list release_files: files of the release
+        :rtype: dict
+        :returns: the replay of every commit, see :meth:`_replay`, None if the history can not be continued
+        """
+        commits = [c for c in new_commits.values() if len(c.parents) <= 1]
+
+        # the order of the new commits has to be unique and before the commits of the history
+        dates = {(c.committer_date, c.author_date) for c in commits}
+        if len(dates) < len(commits) or any(c.committer_date is None or c.author_date is None for c in commits):
+            return None
+        if history['newest'] is None or any(c.committer_date <= history['newest'] for c in commits):
+            return None
+
+        commits.sort(key=lambda c: (c.committer_date, c.author_date), reverse=True)
+        replay = self._replay(commits, release_files)
+        aliases = replay['aliases']
+
+        # the renamed files of the history have to be aliases exactly if they were aliases of the last release and different release files of the last release have to stay different
+        renamed = history['rename_paths']
+        if any(path in renamed for path in aliases.keys() if path not in history['release_files']):
+            return None
+        targets = [aliases.get(path) for path in history['release_files'] if path in renamed]
+        if None in targets or len(set(targets)) < len(targets):
+            return None
+
+        # the release files of the last release are aliases of our release files now
+        for path, release_file in history['aliases'].items():
+            if path in renamed and path not in aliases.keys():
+                aliases[path] = aliases[release_file]
+
+        for path, date in history['additions'].items():
+            if path not in replay['additions'].keys():
+                replay['additions'][path] = date
+
+        for release_file, change in history['file_name_changes'].items():
+            replay['file_name_changes'][aliases[release_file]] = change
+
+        replay['rename_paths'] |= renamed
+        if not commits:
+            replay['newest'] = history['newest']
+        return replay
+
+    def first_occured(self, vcs, replay):
+        """Find when the release files were added from the replay of the commits, see :meth:`_replay`.
+
+        :rtype: tuple
+        :returns: first occurences, aliases and file name changes of the release files
+        """
+        aliases = replay['aliases']
 
         ret = {}
-        for file_name, add_dates in additions.items():
+        for file_name, add_date in replay['additions'].items():
             if file_name not in aliases.keys():
                 continue
-            if aliases[file_name] not in ret.keys():
-                ret[aliases[file_name]] = []
-            ret[aliases[file_name]] += add_dates
+            if aliases[file_name] not in ret.keys() or ret[aliases[file_name]] < add_date:
+                ret[aliases[file_name]] = add_date
 
         # added files contains all files but we only need release files so we only trigger the fallback for release files
-        for file_name in release_files:
+        for file_name in self._release_files:
             if file_name not in ret:
-                ret[file_name] = [self._first_occured_fallback(vcs, file_name)]
-
-        first_occurences = {}
-        for file_name, add_dates in ret.items():
-            first_occurences[file_name] = max(add_dates)  # if we have multiple possible addition dates we use the max
+                ret[file_name] = self._first_occured_fallback(vcs, file_name)
 
-        return first_occurences, aliases, file_name_changes
+        return ret, aliases, replay['file_name_changes']
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides a profiling mode for a mining run.
+
+The :class:`Profiler` records nested spans of the stages (see :mod:`mynbou.instrumentation`) and of the methods of Mynbou, Volg, OntdekBaan
+and the change metric functions as Chrome trace events, the trace can be opened in chrome://tracing, Perfetto or speedscope.
+Optionally every top level stage is run with cProfile and its statistics are dumped as .pstats file which can be opened with pstats, snakeviz or similar viewers.
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import inspect
+import cProfile
+import threading
+import functools
+import contextlib
+
+from mynbou import instrumentation
+
+
+def _targets():
+    """Default classes and modules whose functions are traced."""
+    from mynbou.core import Mynbou
+    from mynbou.path import Volg, OntdekBaan
+    from mynbou.metrics import change
+    return [Mynbou, Volg, OntdekBaan, change.ChangeMetricsAccumulator, change]
+
+
+class Profiler(object):
+    """Records spans as Chrome trace events and optionally cProfile statistics per top level stage.
+
+    :param str stats_dir: directory for the .pstats files of the top level stages, None disables cProfile
+    :param list targets: classes and modules whose functions are traced, default Mynbou, Volg, OntdekBaan and the change metrics
+    """
+
+    def __init__(self, stats_dir=None, targets=None):
+        self.stats_dir = stats_dir
+        self.targets = targets
+        self.events = []
+        self.stats_files = []
+        self._patched = []
+        self._depth = 0
+        self._start = None
+
+    def start(self):
+        """Trace the functions of the targets and activate this profiler for the following stages."""
+        self._start = time.perf_counter()
+        if self.stats_dir:
+            os.makedirs(self.stats_dir, exist_ok=True)
+        for target in (self.targets if self.targets is not None else _targets()):
+            self._instrument(target)
+        instrumentation.activate(self)
+        return self
+
+    def stop(self):
+        """Deactivate this profiler and restore the traced functions."""
+        instrumentation.deactivate(self)
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+
+    def _instrument(self, target):
+        if isinstance(target, types.ModuleType):
+            prefix = target.__name__.split('.')[-1]
+            functions = [(name, func) for name, func in vars(target).items() if isinstance(func, types.FunctionType) and func.__module__ == target.__name__]
+        else:
+            prefix = target.__name__
+            functions = [(name, func) for name, func in vars(target).items() if isinstance(func, types.FunctionType) and (name == '__init__' or not name.startswith('__'))]
+
+        for name, func in functions:
+            # generators only do their work while they are consumed, the caller is traced instead
+            if inspect.isgeneratorfunction(func):
+                continue
+            wrapper = self._traced(func, '{}.{}'.format(prefix, name))
+
+            # functions imported by name, e.g., hassan in mynbou.core, are replaced as well
+            owners = [target]
+            if isinstance(target, types.ModuleType):
+                owners += [module for module_name, module in list(sys.modules.items()) if module_name.startswith('mynbou') and module is not target and module is not None]
+            for owner in owners:
+                if vars(owner).get(name) is func:
+                    self._patched.append((owner, name, func))
+                    setattr(owner, name, wrapper)
+
+    def _traced(self, func, name):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.span(name, 'function'):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _event(self, name, category, begin, end, args=None):
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': (begin - self._start) * 1e6, 'dur': (end - begin) * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category='function'):
+        """Record a span as complete trace event.
+
+        :param str name: name of the span, e.g., Volg.change_metrics
+        :param str category: category of the span, e.g., function or stage
+        """
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._event(name, category, begin, time.perf_counter())
+
+    @contextlib.contextmanager
+    def stage(self, name, info=None):
+        """Record the stage as span, top level stages are run with cProfile if a directory for the statistics is set.
+
+        :param str name: name of the stage
+        :param dict info: additional information about the stage which is added to the trace event
+        """
+        profile = None
+        if self.stats_dir and self._depth == 0:
+            profile = cProfile.Profile()
+
+        self._depth += 1
+        begin = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self._event(name, 'stage', begin, time.perf_counter(), info)
+            self._depth -= 1
+
+            if profile is not None:
+                filename = os.path.join(self.stats_dir, '{:02d}_{}.pstats'.format(len(self.stats_files), name))
+                profile.dump_stats(filename)
+                self.stats_files.append(filename)
+
+    def save(self, filename):
+        """Write the trace as Chrome trace event JSON file.
+
+        :param str filename: name of the file
+        """
+        events = sorted(self.events, key=lambda event: (event['ts'], -event['dur']))
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
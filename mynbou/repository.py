@@ -0,0 +1,872 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides the data access of Mynbou and Volg.
+
+Every query of Mynbou and Volg goes through a repository, the repository serves the documents of one VCS system.
+The :class:`MongoRepository` queries the SmartSHARK MongoDB via mongoengine, the :class:`MemoryRepository` serves the documents
+from indexed dictionaries, e.g., loaded from a local snapshot (see :mod:`mynbou.snapshot`).
+
+Both return documents in the natural order of their collection and provide the fields as attributes, the in-memory documents are :class:`Record` instances.
+The batch methods (e.g., :meth:`Repository.file_actions_for_commits`, :meth:`Repository.files_by_ids`) load the documents for many commits or ids at once,
+the MongoRepository queries them in chunks of :data:`CHUNK_SIZE` ids.
+In lean mode the MongoRepository returns the commits, files, file actions, code entity states, packages, refactorings and change type classifications
+as projected raw documents (Records with only the :data:`LEAN_FIELDS`) instead of mongoengine documents.
+Its file lookups by id and by path go through a :class:`FileCache` which is shared by every MongoRepository of the process.
+"""
+
+import abc
+import datetime
+import collections
+
+from bson.objectid import ObjectId
+
+from pycoshark.mongomodels import Commit, CodeEntityState, CodeGroupState, FileAction, File, Issue, Hunk, Refactoring, CommitChanges
+from pycoshark.utils import jira_is_resolved_and_fixed
+
+
+# number of ids per query of the batch methods
+CHUNK_SIZE = 10000
+
+# default maximum number of files in the shared file cache
+FILE_CACHE_SIZE = 100000
+
+# fields of the documents which Mynbou and Volg use, the MongoRepository only loads these fields in lean mode
+LEAN_FIELDS = {'commits': ['id', 'revision_hash', 'parents', 'committer_date', 'author_id', 'message', 'linked_issue_ids', 'fixed_issue_ids', 'szz_issue_ids'],
+               'files': ['id', 'path'],
+               'file_actions': ['id', 'commit_id', 'file_id', 'old_file_id', 'mode', 'lines_added', 'lines_deleted'],
+               'code_entity_states': ['id', 'ce_type', 'long_name', 'file_id', 'metrics', 'imports', 'linter'],
+               'code_group_states': ['id', 'commit_id', 'long_name', 'metrics'],
+               'refactorings': ['id', 'commit_id', 'type', 'ce_state'],
+               'commit_changes': ['id', 'old_commit_id', 'new_commit_id', 'classification']}
+
+# class metrics which are averaged per file for the D'Ambros samples, name -> metric of the code entity state
+CLASS_METRIC_AVERAGES = [('wmc', 'WMC'), ('dit', 'DIT'), ('rfc', 'RFC'), ('noc', 'NOC'), ('cbo', 'CBO'), ('lcom5', 'LCOM5'), ('nii', 'NII'), ('noi', 'NOI'),
+                         ('tna', 'TNA'), ('tnpa', 'TNPA'), ('tloc', 'TLOC'), ('tnm', 'TNM'), ('tnlpm', 'TNLPM'), ('tnla', 'TNLA'), ('tnpm', 'TNPM'), ('tnlm', 'TNLM')]
+
+# differences of the averaged class metrics, name -> (minuend, subtrahend)
+CLASS_METRIC_DIFFERENCES = [('tna-tnpa', ('tna', 'tnpa')), ('tna-tnla', ('tna', 'tnla')), ('tnm-tnpm', ('tnm', 'tnpm')), ('tnm-tnlm', ('tnm', 'tnlm'))]
+
+
+def chunked(ids, size=CHUNK_SIZE):
+    """Split the ids into lists of at most size ids, duplicates are removed.
+
+    :param ids: iterable of ids
+    :param int size: maximum number of ids per list
+    :rtype: generator
+    """
+    ids = list(dict.fromkeys(ids))
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class FileCache(object):
+    """Bounded LRU cache of the paths of files by their id and of the ids by VCS system and path.
+
+    Mynbou resolves the same files over and over, e.g., for every change, refactoring, change type, D'Ambros sample, rename and bug fix.
+    The cache can be warmed up with every file of a VCS system at once, the least recently used files are evicted first.
+
+    :param int maxsize: maximum number of cached files, 0 disables the cache
+    """
+
+    def __init__(self, maxsize=FILE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._paths = collections.OrderedDict()  # file id -> (vcs system id, path)
+        self._ids = {}  # (vcs system id, path) -> file id
+        self._warm = set()
+
+    def path(self, file_id):
+        """The path of the file, None if the file is not cached."""
+        try:
+            entry = self._paths[file_id]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._paths.move_to_end(file_id)
+        self.hits += 1
+        return entry[1]
+
+    def file_id(self, vcs_system_id, path):
+        """The id of the file with the path in the VCS system, None if the file is not cached."""
+        file_id = self._ids.get((vcs_system_id, path))
+        if file_id is None:
+            self.misses += 1
+            return None
+        self._paths.move_to_end(file_id)
+        self.hits += 1
+        return file_id
+
+    def put(self, vcs_system_id, file_id, path):
+        """Cache the file, evicts the least recently used file if the cache is full."""
+        if self.maxsize <= 0:
+            return
+        self._paths[file_id] = (vcs_system_id, path)
+        self._paths.move_to_end(file_id)
+        self._ids[(vcs_system_id, path)] = file_id
+        while len(self._paths) > self.maxsize:
+            evicted_id, key = self._paths.popitem(last=False)
+            if self._ids.get(key) == evicted_id:
+                del self._ids[key]
+            self._warm.clear()
+
+    def resize(self, maxsize):
+        """Change the maximum number of cached files, evicts the least recently used files if there are more."""
+        self.maxsize = maxsize
+        while len(self._paths) > max(0, maxsize):
+            evicted_id, key = self._paths.popitem(last=False)
+            if self._ids.get(key) == evicted_id:
+                del self._ids[key]
+            self._warm.clear()
+
+    def warm_up(self, vcs_system_id):
+        """Load every file of the VCS system with one query, nothing is loaded if the cache is disabled or already warm for the VCS system.
+
+        :rtype: int
+        :returns: number of loaded files
+        """
+        if self.maxsize <= 0 or vcs_system_id in self._warm:
+            return 0
+        count = 0
+        for f in File.objects.filter(vcs_system_id=vcs_system_id).only('id', 'path').as_pymongo().timeout(False):
+            self.put(vcs_system_id, f['_id'], f['path'])
+            count += 1
+        self._warm.add(vcs_system_id)
+        return count
+
+    def clear(self):
+        """Remove every file and reset the statistics."""
+        self._paths.clear()
+        self._ids.clear()
+        self._warm.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Hit and miss statistics of the cache.
+
+        :rtype: dict
+        :returns: dict with hits, misses, hit_rate, size and maxsize
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0, 'size': len(self._paths), 'maxsize': self.maxsize}
+
+
+# file cache shared by every MongoRepository of the process, None until it is first used
+_file_cache = None
+
+
+def shared_file_cache(maxsize=None):
+    """The file cache shared by every MongoRepository of the process.
+
+    :param int maxsize: resize the cache to this maximum number of files, None keeps the current size (initially :data:`FILE_CACHE_SIZE`)
+    :rtype: FileCache
+    """
+    global _file_cache
+    if _file_cache is None:
+        _file_cache = FileCache(FILE_CACHE_SIZE if maxsize is None else maxsize)
+    elif maxsize is not None and maxsize != _file_cache.maxsize:
+        _file_cache.resize(maxsize)
+    return _file_cache
+
+
+class Repository(abc.ABC):
+    """Abstract data access for one VCS system, implemented by the MongoDB and the in-memory repository.
+
+    :param vcs: the VCS system
+    """
+
+    # revision hashes of the releases the repository has data for, None if it has data for every release
+    releases = None
+
+    # cache of the file lookups, None if the repository does not use one
+    file_cache = None
+
+    def __init__(self, vcs):
+        self.vcs = vcs
+
+    def warm_up(self):
+        """Load the data which is used throughout the mining at once, e.g., the files of the VCS system into the file cache."""
+        pass
+
+    @abc.abstractmethod
+    def commits(self):
+        """Every commit with id, revision_hash and parents.
+
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def commits_by_date(self):
+        """Every commit with id, revision_hash, parents and committer_date, ordered by committer date and author date descending.
+
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def commit(self, revision_hash, fields=None):
+        """The commit with the revision hash.
+
+        :param str revision_hash: revision hash of the commit
+        :param list fields: only load these fields (and id and revision_hash), None for every field including the code entity states
+        """
+
+    @abc.abstractmethod
+    def commit_by_id(self, commit_id):
+        """The commit with the id.
+
+        :param commit_id: id of the commit
+        """
+
+    @abc.abstractmethod
+    def bugfix_commits(self, issue_field, after, before=None, label=None, issue_id=None):
+        """Commits with a committer date within the given bounds which are linked to issues.
+
+        :param str issue_field: field of the issue links (fixed_issue_ids, linked_issue_ids, szz_issue_ids)
+        :param datetime after: exclusive lower bound of the committer date
+        :param datetime before: exclusive upper bound of the committer date, None for no bound
+        :param str label: label the commits need to have, None for any commit
+        :param issue_id: the commits are linked to this issue, None for commits linked to any issue
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def issues(self, issue_ids):
+        """The issues with the ids.
+
+        :param list issue_ids: ids of the issues
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def is_resolved_and_fixed(self, issue):
+        """Return True if the issue was closed and resolved as fixed (at least once), see :func:`pycoshark.utils.jira_is_resolved_and_fixed`.
+
+        :param issue: the issue
+        :rtype: bool
+        """
+
+    @abc.abstractmethod
+    def file(self, file_id):
+        """The file with the id.
+
+        :param file_id: id of the file
+        """
+
+    @abc.abstractmethod
+    def files_by_paths(self, paths):
+        """The files with one of the paths.
+
+        :param paths: paths of the files
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def inducing_file_actions(self, file_action_id, label):
+        """File actions which induce the change of the file action with the label.
+
+        :param file_action_id: id of the bug-fixing file action
+        :param str label: label of the inducing link
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def entity_states(self, entity_state_ids, ce_types=None, file_id=None, long_name_contains=None, long_name_endswith=None):
+        """The code entity states with the ids which match the filters.
+
+        :param list entity_state_ids: ids of the code entity states, usually the code_entity_states of a commit
+        :param list ce_types: only code entity states of these types, None for every type
+        :param file_id: only code entity states of this file, None for every file
+        :param str long_name_contains: only code entity states whose long name contains this string
+        :param str long_name_endswith: only code entity states whose long name ends with this string
+        :rtype: iterable
+        """
+
+    @abc.abstractmethod
+    def class_metrics(self, entity_state_ids, file_ids=None):
+        """Class metrics averaged per file, see :data:`CLASS_METRIC_AVERAGES` and :data:`CLASS_METRIC_DIFFERENCES`.
+
+        :param list entity_state_ids: ids of the code entity states, usually the code_entity_states of a commit
+        :param list file_ids: only classes of these files, None for every file
+        :rtype: iterable
+        :returns: dicts with the file id as _id and the averaged metrics, a metric is None if no class of the file has it
+        """
+
+    @abc.abstractmethod
+    def commits_by_hashes(self, revision_hashes, fields=None):
+        """The commits with the revision hashes, without their code entity states.
+
+        :param revision_hashes: revision hashes of the commits
+        :param list fields: only load these fields (and id and revision_hash), None for every field except the code entity states
+        :rtype: dict
+        :returns: revision hash -> commit
+        """
+
+    @abc.abstractmethod
+    def issues_by_ids(self, issue_ids):
+        """The issues with the ids.
+
+        :param issue_ids: ids of the issues
+        :rtype: dict
+        :returns: id -> issue
+        """
+
+    @abc.abstractmethod
+    def files_by_ids(self, file_ids):
+        """The files with the ids.
+
+        :param file_ids: ids of the files, as ObjectId or string
+        :rtype: dict
+        :returns: id (ObjectId) -> file
+        """
+
+    @abc.abstractmethod
+    def file_actions_for_commits(self, commit_ids, modes=None):
+        """The file actions of the commits.
+
+        :param commit_ids: ids of the commits
+        :param list modes: only file actions with one of these modes, None for every mode
+        :rtype: dict
+        :returns: commit id -> list of file actions in their natural order, every commit is contained
+        """
+
+    @abc.abstractmethod
+    def hunk_counts(self, file_action_ids):
+        """Number of hunks per file action.
+
+        :param file_action_ids: ids of the file actions
+        :rtype: dict
+        :returns: file action id -> number of hunks, file actions without hunks are missing
+        """
+
+    @abc.abstractmethod
+    def refactorings_for_commits(self, commit_ids):
+        """The refactorings of the commits.
+
+        :param commit_ids: ids of the commits
+        :rtype: dict
+        :returns: commit id -> list of refactorings in their natural order, commits without refactorings are missing
+        """
+
+    @abc.abstractmethod
+    def entity_states_by_ids(self, entity_state_ids):
+        """The code entity states with the ids.
+
+        :param entity_state_ids: ids of the code entity states, as ObjectId or string
+        :rtype: dict
+        :returns: id (ObjectId) -> code entity state
+        """
+
+    @abc.abstractmethod
+    def entity_states_for_commit(self, commit, ce_types=None, file_ids=None):
+        """The code entity states of the commit.
+
+        :param commit: the commit with its code entity states
+        :param list ce_types: only code entity states of these types, None for every type
+        :param list file_ids: only code entity states of these files, None for every file
+        :rtype: list
+        """
+
+    @abc.abstractmethod
+    def package_states_for_commit(self, commit_id):
+        """The packages of the commit.
+
+        :param commit_id: id of the commit
+        :rtype: dict
+        :returns: long name -> list of packages with that name
+        """
+
+    @abc.abstractmethod
+    def commit_changes_for_commits(self, new_commit_ids):
+        """The change type classifications of the commits.
+
+        :param new_commit_ids: ids of the commits
+        :rtype: dict
+        :returns: (old commit id, new commit id) -> commit changes
+        """
+
+
+class MongoRepository(Repository):
+    """Repository which queries the SmartSHARK MongoDB with the current mongoengine connection.
+
+    In lean mode the documents are loaded with as_pymongo() and only their :data:`LEAN_FIELDS`, they are not hydrated to mongoengine documents.
+    Document mode loads the full mongoengine documents, e.g., to compare the results of both modes. Issues are always mongoengine documents.
+    In lean mode the files are resolved via the file cache, the cached files are Records with id and path.
+
+    :param vcs: the VCS system
+    :param bool lean: load projected raw documents instead of mongoengine documents
+    :param FileCache file_cache: cache of the file lookups in lean mode, defaults to the shared file cache (see :func:`shared_file_cache`)
+    """
+
+    def __init__(self, vcs, lean=True, file_cache=None):
+        super().__init__(vcs)
+        self.lean = lean
+        if lean:
+            self.file_cache = file_cache if file_cache is not None else shared_file_cache()
+
+    def warm_up(self):
+        if self.file_cache is not None:
+            self.file_cache.warm_up(self.vcs.id)
+
+    def _cached_file(self, file_id, path):
+        return Record({'_id': file_id, 'path': path})
+
+    def _put_files(self, files):
+        """Add the loaded files to the file cache and return them."""
+        if self.file_cache is not None:
+            for f in files:
+                self.file_cache.put(self.vcs.id, f.id, f.path)
+        return files
+
+    def _documents(self, queryset, collection, fields=None):
+        """The documents of the queryset, in lean mode as Records with only the fields (default: the LEAN_FIELDS of the collection)."""
+        if not self.lean:
+            return queryset
+        return [_record(collection, document) for document in queryset.only(*(fields or LEAN_FIELDS[collection])).as_pymongo()]
+
+    def _document(self, queryset, collection, fields=None, **query):
+        """The single document of the queryset which matches the query, in lean mode as Record."""
+        if not self.lean:
+            return queryset.get(**query)
+        return _record(collection, queryset.only(*(fields or LEAN_FIELDS[collection])).as_pymongo().get(**query))
+
+    def commits(self):
+        return self._documents(Commit.objects.only('id', 'revision_hash', 'parents').timeout(False).filter(vcs_system_id=self.vcs.id), 'commits', ['id', 'revision_hash', 'parents'])
+
+    def commits_by_date(self):
+        return self._documents(Commit.objects.filter(vcs_system_id=self.vcs.id).order_by('-committer_date', '-author_date').only('id', 'revision_hash', 'parents', 'committer_date'),
+                               'commits', ['id', 'revision_hash', 'parents', 'committer_date'])
+
+    def commit(self, revision_hash, fields=None):
+        if fields is None:
+            return self._document(Commit.objects, 'commits', LEAN_FIELDS['commits'] + ['code_entity_states'], vcs_system_id=self.vcs.id, revision_hash=revision_hash)
+        fields = ['id', 'revision_hash'] + fields
+        return self._document(Commit.objects.only(*fields), 'commits', fields, vcs_system_id=self.vcs.id, revision_hash=revision_hash)
+
+    def commit_by_id(self, commit_id):
+        return self._document(Commit.objects, 'commits', id=commit_id)
+
+    def bugfix_commits(self, issue_field, after, before=None, label=None, issue_id=None):
+        query = {'vcs_system_id': self.vcs.id, 'committer_date__gt': after}
+        if before is not None:
+            query['committer_date__lt'] = before
+        if label is not None:
+            query['labels__{}'.format(label)] = True
+        if issue_id is None:
+            query['{}__0__exists'.format(issue_field)] = True
+        else:
+            query[issue_field] = issue_id
+        fields = ['id', 'committer_date', issue_field, 'revision_hash']
+        return self._documents(Commit.objects.filter(**query).only(*fields).timeout(False), 'commits', fields)
+
+    def issues(self, issue_ids):
+        return Issue.objects.filter(id__in=issue_ids)
+
+    def is_resolved_and_fixed(self, issue):
+        return jira_is_resolved_and_fixed(issue)
+
+    def file(self, file_id):
+        if self.file_cache is not None:
+            path = self.file_cache.path(ObjectId(file_id))
+            if path is not None:
+                return self._cached_file(ObjectId(file_id), path)
+        return self._put_files([self._document(File.objects, 'files', id=file_id)])[0]
+
+    def files_by_paths(self, paths):
+        if self.file_cache is None:
+            return self._documents(File.objects.filter(vcs_system_id=self.vcs.id, path__in=paths), 'files')
+
+        ret = []
+        missing = []
+        for path in dict.fromkeys(paths):
+            file_id = self.file_cache.file_id(self.vcs.id, path)
+            if file_id is None:
+                missing.append(path)
+            else:
+                ret.append(self._cached_file(file_id, path))
+        for chunk in chunked(missing):
+            ret += self._put_files(self._documents(File.objects.filter(vcs_system_id=self.vcs.id, path__in=chunk), 'files'))
+        return ret
+
+    def inducing_file_actions(self, file_action_id, label):
+        return self._documents(FileAction.objects.filter(induces__match={'change_file_action_id': file_action_id, 'label': label}), 'file_actions', LEAN_FIELDS['file_actions'] + ['induces'])
+
+    def entity_states(self, entity_state_ids, ce_types=None, file_id=None, long_name_contains=None, long_name_endswith=None):
+        query = {'id__in': entity_state_ids}
+        if ce_types is not None:
+            query['ce_type__in'] = ce_types
+        if file_id is not None:
+            query['file_id'] = file_id
+        if long_name_contains is not None:
+            query['long_name__contains'] = long_name_contains
+        if long_name_endswith is not None:
+            query['long_name__endswith'] = long_name_endswith
+        return self._documents(CodeEntityState.objects.filter(**query), 'code_entity_states')
+
+    def class_metrics(self, entity_state_ids, file_ids=None):
+        match = {'_id': {'$in': [ObjectId(cesid) for cesid in entity_state_ids]}, 'ce_type': 'class'}
+        if file_ids is not None:
+            match['file_id'] = {'$in': [ObjectId(file_id) for file_id in file_ids]}
+
+        group = {'_id': '$file_id'}
+        for name, metric in CLASS_METRIC_AVERAGES:
+            group[name] = {'$avg': '$metrics.{}'.format(metric)}
+        return CodeEntityState.objects().aggregate(*[
+            {'$match': match},
+            {'$group': group},
+            {'$addFields': {name: {'$subtract': ['$' + a, '$' + b]} for name, (a, b) in CLASS_METRIC_DIFFERENCES}}
+        ])
+
+    def commits_by_hashes(self, revision_hashes, fields=None):
+        ret = {}
+        for hashes in chunked(revision_hashes):
+            query = Commit.objects.filter(vcs_system_id=self.vcs.id, revision_hash__in=hashes).timeout(False)
+            if fields is None:
+                query = self._documents(query.exclude('code_entity_states'), 'commits')
+            else:
+                query = self._documents(query.only('id', 'revision_hash', *fields), 'commits', ['id', 'revision_hash'] + fields)
+            for c in query:
+                ret[c.revision_hash] = c
+        return ret
+
+    def issues_by_ids(self, issue_ids):
+        ret = {}
+        for ids in chunked(issue_ids):
+            for i in Issue.objects.filter(id__in=ids):
+                ret[i.id] = i
+        return ret
+
+    def files_by_ids(self, file_ids):
+        ret = {}
+        missing = []
+        for file_id in dict.fromkeys(ObjectId(file_id) for file_id in file_ids):
+            path = self.file_cache.path(file_id) if self.file_cache is not None else None
+            if path is None:
+                missing.append(file_id)
+            else:
+                ret[file_id] = self._cached_file(file_id, path)
+        for ids in chunked(missing):
+            for f in self._put_files(self._documents(File.objects.filter(id__in=ids), 'files')):
+                ret[f.id] = f
+        return ret
+
+    def file_actions_for_commits(self, commit_ids, modes=None):
+        ret = {commit_id: [] for commit_id in commit_ids}
+        for ids in chunked(commit_ids):
+            query = FileAction.objects.filter(commit_id__in=ids).timeout(False)
+            if modes is not None:
+                query = query.filter(mode__in=modes)
+            for fa in self._documents(query, 'file_actions'):
+                ret[fa.commit_id].append(fa)
+        return ret
+
+    def hunk_counts(self, file_action_ids):
+        ret = {}
+        for ids in chunked(file_action_ids):
+            for count in Hunk.objects.filter(file_action_id__in=ids).aggregate({'$group': {'_id': '$file_action_id', 'count': {'$sum': 1}}}):
+                ret[count['_id']] = count['count']
+        return ret
+
+    def refactorings_for_commits(self, commit_ids):
+        ret = {}
+        for ids in chunked(commit_ids):
+            for ref in self._documents(Refactoring.objects.filter(commit_id__in=ids), 'refactorings'):
+                ret.setdefault(ref.commit_id, []).append(ref)
+        return ret
+
+    def entity_states_by_ids(self, entity_state_ids):
+        ret = {}
+        for ids in chunked(ObjectId(cesid) for cesid in entity_state_ids):
+            for ces in self._documents(CodeEntityState.objects.filter(id__in=ids), 'code_entity_states'):
+                ret[ces.id] = ces
+        return ret
+
+    def entity_states_for_commit(self, commit, ce_types=None, file_ids=None):
+        query = {'id__in': commit.code_entity_states}
+        if ce_types is not None:
+            query['ce_type__in'] = ce_types
+        if file_ids is not None:
+            query['file_id__in'] = file_ids
+        return list(self._documents(CodeEntityState.objects.filter(**query), 'code_entity_states'))
+
+    def package_states_for_commit(self, commit_id):
+        ret = {}
+        for cgs in self._documents(CodeGroupState.objects.filter(commit_id=commit_id, cg_type='package'), 'code_group_states'):
+            ret.setdefault(cgs.long_name, []).append(cgs)
+        return ret
+
+    def commit_changes_for_commits(self, new_commit_ids):
+        ret = {}
+        for ids in chunked(new_commit_ids):
+            for cc in self._documents(CommitChanges.objects.filter(new_commit_id__in=ids), 'commit_changes'):
+                ret.setdefault((cc.old_commit_id, cc.new_commit_id), cc)
+        return ret
+
+
+class Record(dict):
+    """Document of the in-memory repository, the fields are available as attributes like the fields of mongoengine documents.
+
+    The id is stored as _id and available as id, missing fields are None.
+    Records are also the raw documents of the MongoRepository in lean mode.
+    Like mongoengine documents records are equal if their ids are equal.
+    """
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name == 'id':
+            name = '_id'
+        return self.get(name)
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return False
+        return self.get('_id') == other.get('_id')
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.get('_id'))
+
+
+# fields which are lists or dicts in the documents, missing fields are initialized as empty like mongoengine does
+_EMPTY_FIELDS = {'commits': {'parents': list, 'linked_issue_ids': list, 'fixed_issue_ids': list, 'szz_issue_ids': list, 'code_entity_states': list, 'labels': dict},
+                 'file_actions': {'induces': list},
+                 'code_entity_states': {'linter': list, 'imports': list, 'metrics': dict},
+                 'code_group_states': {'metrics': dict},
+                 'refactorings': {'ce_state': dict}}
+
+
+def _record(collection, document):
+    """Record of a raw document of the collection, missing list and dict fields are initialized as empty."""
+    r = Record(document)
+    for field, empty in _EMPTY_FIELDS.get(collection, {}).items():
+        if r.get(field) is None:
+            r[field] = empty()
+    return r
+
+
+def _date_key(value):
+    """Sort key for dates which may be missing, missing dates are sorted first like null values in MongoDB."""
+    return (value is not None, value or datetime.datetime.min)
+
+
+class MemoryRepository(Repository):
+    """Repository which serves the documents from memory.
+
+    The documents are given per collection as lists of dicts in their natural order, they are indexed once by every key the queries use.
+    The collections are commits, files, file_actions, code_entity_states, code_group_states, refactorings, commit_changes and issues.
+    The file actions contain the number of their hunks as hunks instead of the hunk collection.
+    The issues contain the result of :func:`pycoshark.utils.jira_is_resolved_and_fixed` as resolved_and_fixed instead of the event collection.
+
+    :param dict vcs: the VCS system
+    :param dict collections: collection name -> list of documents
+    :param list releases: revision hashes of the releases the documents were collected for, None for every release
+    """
+
+    def __init__(self, vcs, collections, releases=None):
+        super().__init__(Record(vcs))
+        self.releases = releases
+
+        docs = {}
+        for name in ['commits', 'files', 'file_actions', 'code_entity_states', 'code_group_states', 'refactorings', 'commit_changes', 'issues']:
+            docs[name] = []
+            for document in collections.get(name, []):
+                docs[name].append(_record(name, document))
+
+        self._commits = docs['commits']
+        self._commits_by_hash = {c.revision_hash: c for c in self._commits}
+        self._commits_by_id = {c.id: c for c in self._commits}
+        self._commits_by_issue = {}
+        for field in ['fixed_issue_ids', 'linked_issue_ids', 'szz_issue_ids']:
+            self._commits_by_issue[field] = {}
+            for c in self._commits:
+                for issue_id in dict.fromkeys(c[field]):
+                    self._commits_by_issue[field].setdefault(issue_id, []).append(c)
+        self._commits_sorted = None
+
+        self._files_by_id = {f.id: f for f in docs['files']}
+        self._files_by_path = {}
+        for f in docs['files']:
+            self._files_by_path.setdefault(f.path, []).append(f)
+
+        self._file_actions_by_commit = {}
+        self._inducing = {}
+        for fa in docs['file_actions']:
+            self._file_actions_by_commit.setdefault(fa.commit_id, []).append(fa)
+            for link in {(ind.get('change_file_action_id'), ind.get('label')) for ind in fa.induces}:
+                self._inducing.setdefault(link, []).append(fa)
+        self._hunks = {fa.id: fa.hunks or 0 for fa in docs['file_actions']}
+
+        self._entity_states = {ces.id: ces for ces in docs['code_entity_states']}
+        self._entity_state_position = {ces.id: i for i, ces in enumerate(docs['code_entity_states'])}
+
+        self._packages = {}
+        for cgs in docs['code_group_states']:
+            if cgs.cg_type == 'package':
+                self._packages.setdefault((cgs.commit_id, cgs.long_name), []).append(cgs)
+
+        self._refactorings = {}
+        for ref in docs['refactorings']:
+            self._refactorings.setdefault(ref.commit_id, []).append(ref)
+
+        self._commit_changes = {}
+        for cc in docs['commit_changes']:
+            self._commit_changes.setdefault((cc.old_commit_id, cc.new_commit_id), cc)
+
+        self._issues = {i.id: i for i in docs['issues']}
+        self._issue_position = {i.id: n for n, i in enumerate(docs['issues'])}
+
+    def _get(self, index, key, name):
+        try:
+            return index[key]
+        except KeyError:
+            raise Exception('{} {} is not contained in the repository'.format(name, key))
+
+    def commits(self):
+        return list(self._commits)
+
+    def commits_by_date(self):
+        # sorted is stable, commits with the same dates keep their natural order
+        if self._commits_sorted is None:
+            self._commits_sorted = sorted(self._commits, key=lambda c: (_date_key(c.committer_date), _date_key(c.author_date)), reverse=True)
+        return list(self._commits_sorted)
+
+    def commit(self, revision_hash, fields=None):
+        return self._get(self._commits_by_hash, revision_hash, 'Commit')
+
+    def commit_by_id(self, commit_id):
+        return self._get(self._commits_by_id, commit_id, 'Commit')
+
+    def bugfix_commits(self, issue_field, after, before=None, label=None, issue_id=None):
+        if issue_id is None:
+            commits = [c for c in self._commits if c[issue_field]]
+        else:
+            commits = self._commits_by_issue[issue_field].get(issue_id, [])
+
+        ret = []
+        for c in commits:
+            if c.committer_date is None or c.committer_date <= after:
+                continue
+            if before is not None and c.committer_date >= before:
+                continue
+            if label is not None and c.labels.get(label) is not True:
+                continue
+            ret.append(c)
+        return ret
+
+    def issues(self, issue_ids):
+        found = {issue_id for issue_id in issue_ids if issue_id in self._issues}
+        return [self._issues[issue_id] for issue_id in sorted(found, key=self._issue_position.get)]
+
+    def is_resolved_and_fixed(self, issue):
+        # decided with jira_is_resolved_and_fixed when the issue was exported
+        return issue.resolved_and_fixed is True
+
+    def file(self, file_id):
+        # classifications of commit changes use the file ids as strings
+        return self._get(self._files_by_id, ObjectId(file_id), 'File')
+
+    def files_by_paths(self, paths):
+        ret = []
+        for path in dict.fromkeys(paths):
+            ret += self._files_by_path.get(path, [])
+        return ret
+
+    def inducing_file_actions(self, file_action_id, label):
+        return list(self._inducing.get((file_action_id, label), []))
+
+    def entity_states(self, entity_state_ids, ce_types=None, file_id=None, long_name_contains=None, long_name_endswith=None):
+        found = {ObjectId(cesid) for cesid in entity_state_ids}
+        ret = []
+        for cesid in sorted(found.intersection(self._entity_states.keys()), key=self._entity_state_position.get):
+            ces = self._entity_states[cesid]
+            if ce_types is not None and ces.ce_type not in ce_types:
+                continue
+            if file_id is not None and ces.file_id != file_id:
+                continue
+            if long_name_contains is not None and (ces.long_name is None or long_name_contains not in ces.long_name):
+                continue
+            if long_name_endswith is not None and (ces.long_name is None or not ces.long_name.endswith(long_name_endswith)):
+                continue
+            ret.append(ces)
+        return ret
+
+    def class_metrics(self, entity_state_ids, file_ids=None):
+        if file_ids is not None:
+            file_ids = {ObjectId(file_id) for file_id in file_ids}
+
+        classes = {}
+        for ces in self.entity_states(entity_state_ids, ce_types=['class']):
+            if file_ids is not None and ces.file_id not in file_ids:
+                continue
+            classes.setdefault(ces.file_id, []).append(ces.metrics)
+
+        # $avg of MongoDB, values which are not numbers are ignored, None if there is no number
+        ret = []
+        for file_id, metrics in classes.items():
+            cl = {'_id': file_id}
+            for name, metric in CLASS_METRIC_AVERAGES:
+                values = [m[metric] for m in metrics if isinstance(m.get(metric), (int, float)) and not isinstance(m.get(metric), bool)]
+                cl[name] = sum(values) / len(values) if values else None
+            for name, (a, b) in CLASS_METRIC_DIFFERENCES:
+                cl[name] = cl[a] - cl[b] if cl[a] is not None and cl[b] is not None else None
+            ret.append(cl)
+        return ret
+
+    def commits_by_hashes(self, revision_hashes, fields=None):
+        return {revision_hash: self._commits_by_hash[revision_hash] for revision_hash in revision_hashes if revision_hash in self._commits_by_hash}
+
+    def issues_by_ids(self, issue_ids):
+        return {issue_id: self._issues[issue_id] for issue_id in issue_ids if issue_id in self._issues}
+
+    def files_by_ids(self, file_ids):
+        ret = {}
+        for file_id in file_ids:
+            file_id = ObjectId(file_id)
+            if file_id in self._files_by_id:
+                ret[file_id] = self._files_by_id[file_id]
+        return ret
+
+    def file_actions_for_commits(self, commit_ids, modes=None):
+        ret = {}
+        for commit_id in commit_ids:
+            fas = self._file_actions_by_commit.get(commit_id, [])
+            ret[commit_id] = list(fas) if modes is None else [fa for fa in fas if fa.mode in modes]
+        return ret
+
+    def hunk_counts(self, file_action_ids):
+        return {file_action_id: self._hunks[file_action_id] for file_action_id in file_action_ids if self._hunks.get(file_action_id)}
+
+    def refactorings_for_commits(self, commit_ids):
+        return {commit_id: list(self._refactorings[commit_id]) for commit_id in commit_ids if commit_id in self._refactorings}
+
+    def entity_states_by_ids(self, entity_state_ids):
+        ret = {}
+        for cesid in entity_state_ids:
+            cesid = ObjectId(cesid)
+            if cesid in self._entity_states:
+                ret[cesid] = self._entity_states[cesid]
+        return ret
+
+    def entity_states_for_commit(self, commit, ce_types=None, file_ids=None):
+        states = self.entity_states(commit.code_entity_states, ce_types=ce_types)
+        if file_ids is None:
+            return states
+        file_ids = set(file_ids)
+        return [ces for ces in states if ces.file_id in file_ids]
+
+    def package_states_for_commit(self, commit_id):
+        ret = {}
+        for (package_commit_id, long_name), packages in self._packages.items():
+            if package_commit_id == commit_id:
+                ret[long_name] = list(packages)
+        return ret
+
+    def commit_changes_for_commits(self, new_commit_ids):
+        new_commit_ids = set(new_commit_ids)
+        return {key: cc for key, cc in self._commit_changes.items() if key[1] in new_commit_ids}
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides local snapshots of the SmartSHARK data Mynbou needs for the releases of a project.
+
+A snapshot is exported once from the MongoDB and contains:
+ - every commit of the VCS system with its parents, dates, author, message, bug-fix labels and issue links
+ - every file and every file action with the number of its hunks and its bug-inducing links
+ - the issues linked to the commits and whether they were resolved as fixed, decided with :func:`pycoshark.utils.jira_is_resolved_and_fixed` during the export
+ - the code entity states and package states of the releases
+ - the class states (D'Ambros samples), refactorings and change type classifications of the commits within 6 months before the releases
+
+The snapshot is a gzipped pickle of the documents, :func:`load_snapshot` indexes them in a :class:`mynbou.repository.MemoryRepository`
+so that :meth:`mynbou.core.Mynbou.release` runs without a database.
+"""
+
+import os
+import gzip
+import pickle
+
+import networkx as nx
+from dateutil.relativedelta import relativedelta
+
+from pycoshark.mongomodels import Project, Commit, File, FileAction, Hunk, CodeEntityState, CodeGroupState, Refactoring, CommitChanges, Issue
+from pycoshark.utils import jira_is_resolved_and_fixed
+
+from mynbou.repository import MemoryRepository, chunked
+
+
+# version of the snapshot format, snapshots of a different version are not loaded
+SNAPSHOT_FORMAT = 2
+
+# labels of the commits which are used for the selection of bug-fixing commits
+BUGFIX_LABELS = ['validated_bugfix', 'issueonly_bugfix', 'adjustedszz_bugfix']
+
+
+def _relevant_commits(commits, release):
+    """Commits which may be on the change paths of the release, i.e., ancestors of the release within 6 months before the release."""
+    by_hash = {c['revision_hash']: c for c in commits}
+    cutoff = release['committer_date'] - relativedelta(months=6)
+
+    graph = nx.DiGraph()
+    for c in commits:
+        for p in c.get('parents', []):
+            if p in by_hash and by_hash[p]['committer_date'] is not None and by_hash[p]['committer_date'] >= cutoff:
+                graph.add_edge(p, c['revision_hash'])
+    graph.add_node(release['revision_hash'])
+    return nx.ancestors(graph, release['revision_hash']) | {release['revision_hash']}
+
+
+def export_snapshot(vcs, release_hashes, filename):
+    """Export everything Mynbou needs for the releases of the VCS system to a snapshot file.
+
+    :param vcs: the VCS system
+    :param list release_hashes: revision hashes of the releases
+    :param str filename: path of the snapshot file
+    :rtype: dict
+    :returns: number of exported documents per collection
+    """
+    collections = {}
+
+    commits = []
+    for c in Commit.objects(vcs_system_id=vcs.id).only('id', 'revision_hash', 'parents', 'author_id', 'author_date', 'committer_date', 'message', 'labels',
+                                                       'linked_issue_ids', 'fixed_issue_ids', 'szz_issue_ids', 'code_entity_states').as_pymongo().timeout(False):
+        c = dict(c)
+        c['labels'] = {label: value for label, value in c.get('labels', {}).items() if label in BUGFIX_LABELS}
+        commits.append(c)
+    by_hash = {c['revision_hash']: c for c in commits}
+
+    releases = []
+    for release_hash in release_hashes:
+        if release_hash not in by_hash:
+            raise Exception('Release {} is not a commit of VCS system {}'.format(release_hash, vcs.url))
+        releases.append(by_hash[release_hash])
+
+    relevant = set()
+    for release in releases:
+        relevant |= _relevant_commits(commits, release)
+    relevant_ids = [by_hash[revision_hash]['_id'] for revision_hash in relevant]
+
+    # every state of the releases, only the class states of the other commits for the D'Ambros samples
+    # the states are queried per commit so that they keep their natural order for every commit
+    states = {}
+    release_ids = {release['_id'] for release in releases}
+    for c in releases + [by_hash[revision_hash] for revision_hash in sorted(relevant) if by_hash[revision_hash]['_id'] not in release_ids]:
+        query = {'id__in': c.get('code_entity_states', [])}
+        if c['_id'] not in release_ids:
+            query['ce_type'] = 'class'
+        for ces in CodeEntityState.objects(**query).only('id', 'ce_type', 'long_name', 'file_id', 'metrics', 'imports', 'linter').as_pymongo():
+            ces = dict(ces)
+            ces['linter'] = [{'l_ty': line['l_ty']} for line in ces.get('linter', []) if 'l_ty' in line]
+            states.setdefault(ces['_id'], ces)
+    for c in commits:
+        c['code_entity_states'] = [cesid for cesid in c.get('code_entity_states', []) if cesid in states]
+
+    collections['code_group_states'] = list(CodeGroupState.objects(commit_id__in=list(release_ids), cg_type='package').only('id', 'commit_id', 'cg_type', 'long_name', 'metrics').as_pymongo())
+
+    collections['refactorings'] = []
+    for ids in chunked(relevant_ids):
+        collections['refactorings'] += list(Refactoring.objects(commit_id__in=ids).only('id', 'commit_id', 'type', 'ce_state').as_pymongo())
+    after = [ref['ce_state']['ce_after'] for ref in collections['refactorings'] if 'ce_after' in ref.get('ce_state', {}) and ref['ce_state']['ce_after'] not in states]
+    for ids in chunked(after):
+        for ces in CodeEntityState.objects(id__in=ids).only('id', 'ce_type', 'long_name', 'file_id').as_pymongo():
+            states.setdefault(ces['_id'], dict(ces))
+    collections['code_entity_states'] = list(states.values())
+
+    collections['commit_changes'] = []
+    for ids in chunked(relevant_ids):
+        collections['commit_changes'] += list(CommitChanges.objects(new_commit_id__in=ids).only('id', 'old_commit_id', 'new_commit_id', 'classification').as_pymongo())
+
+    collections['files'] = list(File.objects(vcs_system_id=vcs.id).only('id', 'path').as_pymongo().timeout(False))
+
+    # one query for the file actions so that they keep their natural order, bug-inducing file actions are returned in this order
+    file_actions = [dict(fa) for fa in FileAction.objects(commit_id__in=[c['_id'] for c in commits]).only('id', 'commit_id', 'file_id', 'old_file_id', 'mode', 'lines_added', 'lines_deleted', 'induces').as_pymongo().timeout(False)]
+    relevant_id_set = set(relevant_ids)
+    hunks = {}
+    for ids in chunked(fa['_id'] for fa in file_actions if fa['commit_id'] in relevant_id_set):
+        for count in Hunk.objects(file_action_id__in=ids).aggregate({'$group': {'_id': '$file_action_id', 'count': {'$sum': 1}}}):
+            hunks[count['_id']] = count['count']
+    for fa in file_actions:
+        if fa['_id'] in hunks:
+            fa['hunks'] = hunks[fa['_id']]
+        if not fa.get('induces'):
+            fa.pop('induces', None)
+    collections['file_actions'] = file_actions
+
+    issue_ids = set()
+    for c in commits:
+        for field in ['linked_issue_ids', 'fixed_issue_ids', 'szz_issue_ids']:
+            issue_ids.update(c.get(field, []))
+    # the issues are decided with their events while the database is available
+    collections['issues'] = []
+    for issue in Issue.objects(id__in=list(issue_ids)).only('id', 'external_id', 'issue_type', 'issue_type_verified', 'priority', 'status', 'resolution', 'created_at').as_pymongo():
+        issue = dict(issue)
+        issue['resolved_and_fixed'] = jira_is_resolved_and_fixed(Issue(id=issue['_id'], status=issue.get('status'), resolution=issue.get('resolution')))
+        collections['issues'].append(issue)
+
+    collections['commits'] = commits
+
+    snapshot = {'format': SNAPSHOT_FORMAT,
+                'project_name': Project.objects.get(id=vcs.project_id).name,
+                'vcs': {'_id': vcs.id, 'url': vcs.url, 'project_id': vcs.project_id},
+                'releases': list(release_hashes),
+                'collections': collections}
+
+    tmp = filename + '.tmp'
+    with gzip.open(tmp, 'wb') as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, filename)
+
+    return {name: len(documents) for name, documents in collections.items()}
+
+
+def load_snapshot(filename):
+    """Load a snapshot file as repository.
+
+    :param str filename: path of the snapshot file
+    :rtype: MemoryRepository
+    """
+    with gzip.open(filename, 'rb') as f:
+        snapshot = pickle.load(f)
+
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        raise Exception('Snapshot {} has format {}, expected {}'.format(filename, snapshot.get('format'), SNAPSHOT_FORMAT))
+
+    return MemoryRepository(snapshot['vcs'], snapshot['collections'], snapshot['releases'])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""This module provides the VolgState which persists intermediate data of Volg between releases.
+
+Commits do not change after they are mined, therefore everything Volg extracts for a single commit can be reused when the next release of the same project is mined.
+The state also keeps the history of the last mined release, i.e., the aliases and additions of its files and the dates of the commits within its 6 month window.
+If that release is an ancestor of the next release, the next release only loads and replays the commits which are not ancestors of the last release, see :meth:`mynbou.path.Volg.first_occured`.
+Commits which drop out of the 6 month window of a release are removed from the state.
+"""
+
+import gzip
+import pickle
+
+
+class VolgState(object):
+    """Intermediate per commit data of Volg for one VCS system.
+
+    The state contains:
+     - renames: revision_hash -> (true renames, additional files) of the commit, see :meth:`Volg._heuristic_renames`
+     - additions: revision_hash -> list of files added or copied in the commit
+     - changes: revision_hash -> change events of the commit (file actions, linked issues, refactorings, change types)
+     - dambros: revision_hash -> averaged class metrics per file path for commits sampled for D'Ambros metrics
+     - releases: release revision_hash -> first occurences, aliases and file name changes of the release files
+     - history: the last mined release with the result of replaying its commits and the dates of the commits within its window, see :meth:`Volg._replay`
+    """
+
+    def __init__(self, vcs_id):
+        self.vcs_id = vcs_id
+        self.renames = {}
+        self.additions = {}
+        self.changes = {}
+        self.dambros = {}
+        self.releases = {}
+        self.history = None
+
+    @classmethod
+    def load(cls, filename, vcs_id):
+        """Load the state from the file, if the file does not exist an empty state is returned.
+
+        :param str filename: path to the gzipped state file
+        :param vcs_id: id of the VCS system the state is used for
+        :rtype: VolgState
+        """
+        try:
+            with gzip.open(filename, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return cls(vcs_id)
+
+        if state.vcs_id != vcs_id:
+            raise Exception('State in {} belongs to VCS system {} not {}'.format(filename, state.vcs_id, vcs_id))
+        return state
+
+    def prune(self, ancestors, window):
+        """Remove the commits of a release which dropped out of its window.
+
+        Commits which are not ancestors of the release are kept, e.g., the commits after the release are visited by the next release.
+
+        :param set ancestors: revision hashes of the ancestors of the release
+        :param window: revision hashes of the ancestors within the 6 month window of the release
+        """
+        for commits in [self.renames, self.additions, self.changes, self.dambros]:
+            for revision_hash in [h for h in commits.keys() if h in ancestors and h not in window]:
+                del commits[revision_hash]
+
+    def save(self, filename):
+        """Save the state to the file.
+
+        :param str filename: path to the gzipped state file
+        """
+        with gzip.open(filename, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -12,7 +12,8 @@ setup(
     name='mynbou',
     version='0.0.2',
     description='Extraction of defect prediction datasets for SmartSHARK.',
-    install_requires=['networkx>=2.2', 'pycoshark>=1.2.6', 'python-dateutil>=2.8.0', 'python-Levenshtein>=0.12.0'],
+    install_requires=['networkx>=2.2', 'numpy>=1.16', 'pycoshark>=1.2.6', 'python-dateutil>=2.8.0', 'python-Levenshtein>=0.12.0'],
+    extras_require={'arrow': ['pyarrow>=1.0'], 'zstd': ['zstandard>=0.15']},
     author='atrautsch',
     author_email='alexander.trautsch@cs.uni-goettingen.de',
     url='https://github.com/smartshark/mynbou',
@@ -10,6 +10,7 @@ import logging
 import json
 import timeit
 import math
+import multiprocessing
 
 from pycoshark.mongomodels import Project, VCSSystem
 from pycoshark.utils import create_mongodb_uri_string
@@ -18,8 +19,18 @@ from pycoshark.utils import get_base_argparser
 from mongoengine import connect
 
 from mynbou.core import Mynbou
+from mynbou.repository import MongoRepository, shared_file_cache
+from mynbou.state import VolgState
 from mynbou.constants import *
 from mynbou import aggregation
+from mynbou import output
+from mynbou import instrumentation
+from mynbou import profiling
+from mynbou import snapshot
+
+# document modes of the database queries: lean loads projected raw documents, full loads mongoengine documents,
+# compare mines the release in both modes and fails if the results differ
+DOCUMENT_MODES = ['lean', 'full', 'compare']
 
 log = logging.getLogger()
 log.setLevel(logging.INFO)
@@ -33,6 +44,199 @@ log.setLevel(logging.INFO)
 # log.addHandler(e)
 
 
+def _aggregate_instances(instances, latest_bugfix, cache_size, precision):
+    """Aggregate the metrics of cleaned instances.
+
+    This is a module level function so that it can be run by the worker processes of :meth:`SmartsharkPlugin._harmonize_instances`.
+    The names of the fixed issues are returned in the order they are found so that the merge of the chunks is deterministic.
+
+    :param list instances: cleaned instances
+    :param dict latest_bugfix: issue name -> list of bug-fixing commit dates of all instances
+    :param int cache_size: maximum size of the aggregation memo
+    :param str precision: precision mode of the aggregations
+    :rtype: tuple
+    :returns: list of (aggregated instance, list of issue names) and the statistics of the aggregation memo
+    """
+    log = logging.getLogger(SmartsharkPlugin.__name__)
+    memo = aggregation.AggregationMemo(cache_size, precision)
+    aggregated = []
+    for instance in instances:
+        inst = {}
+        issue_names = []
+        for k, v in instance.items():
+
+            # skip our debug values
+            if k in ['ages', 'revisions', 'changesets', 'commit_messages', 'days_from_release']:
+                continue
+
+            # skip values which are NaN
+            if k in ['SM_method_hcpl', 'SM_method_heff', 'SM_method_htrp', 'SM_method_hvol', 'SM_method_hndb']:
+                continue
+
+            key = k
+
+            # create issue matrix
+            if k.startswith('bug_fixes'):
+                inst['BUGFIX_issues'] = []
+                unique_ids = set()
+                for iss in v:  # tuple is like this: (id, commitdate, revision hash, priority, type)
+                    inst['BUGFIX_issues'].append({'name': iss[0], 'severity': iss[3], 'type': iss[4], 'bugfix_commit': iss[2], 'bugfix_commit_date': iss[1], 'created_at': iss[5]})
+                    unique_ids.add(iss[0])
+
+                    issue_name = '{}_{}_{}'.format(iss[0], iss[3], max(latest_bugfix[iss[0]]))
+                    issue_names.append(issue_name)
+                    inst[issue_name] = 1
+                inst['BUGFIX_count'] = len(set(unique_ids))
+
+            # count all refactorings
+            elif k == 'refactorings':
+                for ref in v:
+                    ref_name = 'REFACTOR_{}'.format(ref)
+                    if ref_name not in inst.keys():
+                        inst[ref_name] = 0
+                    inst[ref_name] += 1
+
+            # count all change types
+            elif k.startswith('change_types'):
+                for change_dict in v:
+                    for change_type, change_count in change_dict.items():
+                        change_name = 'CHANGE_TYPE_{}'.format(change_type.lower())
+                        if change_name not in inst.keys():
+                            inst[change_name] = 0
+                        inst[change_name] += change_count
+
+            elif k.startswith(('SM_method', 'SM_interface', 'SM_enum', 'SM_class', 'SM_annotation')):  # and isinstance(v, list):  # everything in ce_type file is not a list because we only have one
+
+                if isinstance(v, list):
+                    v2 = v
+                else:
+                    v2 = [v]
+                # special aggregations for method level to file level
+                # if k.startswith('SM_method'):
+                for value in v2:
+                    if math.isnan(value):
+                        log.error('value is NaN for {} in file {}'.format(k, instance['file']))
+                # we only have this k if we have at least one element in the list
+                for name, value in memo.aggregate(v2).items():
+                    inst[k + '_' + name] = value
+
+            # collect severities
+            elif k.startswith('PMD') and not k.startswith('PMD_severity_') and not k.startswith('PMD_rule_type_') and not k.startswith('PMD_package'):
+                # create keys for all severities
+                for sev in PMD_SEVERITIES:
+                    key = 'PMD_severity_{}'.format(sev.lower())
+                    if key not in inst.keys():
+                        inst[key] = 0
+
+                for rt in PMD_RULE_TYPES:
+                    key = 'PMD_rule_type_{}'.format(rt.lower())
+                    if key not in inst.keys():
+                        inst[key] = 0
+
+                # count rule violation towards its severity
+                inst['PMD_severity_' + PMD_RMATCH[k].lower()] += 1
+
+                # count rule violations toward its rule type
+                inst['PMD_rule_type_' + PMD_RTMATCH[k].lower()] += 1
+
+                # also set normal counts for PMD Linter
+                tmp = k.split('_')
+                inst['_'.join(tmp[0:-1]) + '_' + tmp[-1].lower()] = v
+
+            elif k == 'linked_issues':
+
+                # make this unique quickly per file
+                linked_issues = set()
+                for i in v:
+                    linked_issues.add('{}_{}_{}'.format(i['priority'], i['issue_type'], i['external_id']))
+
+                for issue in linked_issues:  # we only count each issue once
+                    issue_severity, issue_type, issue_id = issue.split('_')
+
+                    itype = str(issue_type).lower().strip()
+                    if itype in TICKET_TYPE_MAPPING.keys():
+                        itype = TICKET_TYPE_MAPPING[itype]
+                    else:
+                        itype = 'other'
+
+                    iseverity = str(issue_severity).lower().strip()
+                    if iseverity not in TICKET_SEVERITIES:
+                        iseverity = 'other'
+
+                    key = 'ISSUE_{}_{}'.format(iseverity, itype)
+                    if key not in inst.keys():
+                        inst[key] = 0
+                    inst[key] += 1
+            elif k == 'imports':
+                inst[k] = ','.join(v)
+            else:
+                inst[k] = v
+
+        aggregated.append((inst, issue_names))
+    return aggregated, memo.stats()
+
+
+def _static_columns():
+    """Build the columns of the harmonized instances which do not depend on the mined release.
+
+    These are all available metrics, every instance gets a value of 0 for the metrics it does not have.
+    Duplicates are removed keeping the first occurence.
+
+    :rtype: list
+    """
+    keys = []
+    for key in SM_METRICS + CLONE_METRICS:
+
+        # skip values which are NaN
+        if key in ['SM_method_hcpl', 'SM_method_heff', 'SM_method_htrp', 'SM_method_hvol', 'SM_method_hndb']:
+            continue
+
+        if key.startswith(('SM_method', 'SM_interface', 'SM_enum', 'SM_class', 'SM_annotation')):
+            for name in aggregation.AGGREGATIONS:
+                keys.append(key + '_' + name)
+        else:
+            keys.append(key)
+
+    # build PMD keys for abbrevs and also for severities
+    for key in PMD_RMATCH.keys():
+        tmp = key.split('_')
+        keys.append('_'.join(tmp[:-1]) + '_' + tmp[-1].lower())
+
+    for key in list(set(PMD_RMATCH.values())):
+        keys.append('PMD_severity_' + key.lower())
+
+    # PMD rule types
+    for key in PMD_RULE_TYPES:
+        keys.append('PMD_rule_type_' + key.lower())
+
+    # commit change tpye
+    for change_type in CHANGE_TYPES:
+        change_name = 'CHANGE_TYPE_{}'.format(change_type.lower())
+        keys.append(change_name)
+
+    # refactoring types
+    for key in REFACTORING_TYPES:
+        keys.append('REFACTOR_{}'.format(key))
+
+    # ticket severities
+    for key in TICKET_SEVERITIES + ['other']:
+        for key2 in set(TICKET_TYPE_MAPPING.values()):
+            keys.append('ISSUE_{}_{}'.format(key.lower(), key2.lower()))
+
+    # java node types (we should have these for every file)
+    for key in JAVA_NODE_TYPES:
+        keys.append('AST_{}'.format(key.lower()))
+
+    return list(dict.fromkeys(keys))
+
+
+# static part of the columns of the harmonized instances, computed once at import
+STATIC_COLUMNS = _static_columns()
+
+# write buffer of the CSV file in bytes
+CSV_BUFFER_SIZE = 1024 * 1024
+
+
 class SmartsharkPlugin(object):
     """Use metrics and issues from SmartSHARK Database."""
 
@@ -48,19 +252,19 @@ class SmartsharkPlugin(object):
 
             del tmp['first_occurence']  # datetime object no longer needed
             # del tmp['weeks']  # debug data no longer needed
-            del tmp['authors']  # list of names, we don't want that
+            tmp.pop('authors', None)  # list of names, we don't want that (not collected with accumulated change metrics)
 
             # remove base attributes that were used to calculate new ones
             del tmp['aliases']
             del tmp['age']
             # del tmp['ages']
             # del tmp['days_from_release']
-            del tmp['changesets']
-            del tmp['lines_added']
-            del tmp['lines_deleted']
+            tmp.pop('changesets', None)
+            tmp.pop('lines_added', None)
+            tmp.pop('lines_deleted', None)
             # del tmp['imports']  # we change this later to a comma separated string
             # del tmp['revisions']
-            del tmp['commit_messages']
+            tmp.pop('commit_messages', None)
 
             tmp['file'] = file
             cleaned_instances.append(tmp)
@@ -97,308 +301,230 @@ class SmartsharkPlugin(object):
                         latest_bugfix[prei[0]].append(prei[1]) 
 
 
-        for instance in cleaned_instances:
-            inst = {}
-            for k, v in instance.items():
-
-                # skip our debug values
-                if k in ['ages', 'revisions', 'changesets', 'commit_messages', 'days_from_release']:
-                    continue
-
-                # skip values which are NaN
-                if k in ['SM_method_hcpl', 'SM_method_heff', 'SM_method_htrp', 'SM_method_hvol', 'SM_method_hndb']:
-                    continue
-
-                key = k
-
-                # create issue matrix
-                if k.startswith('bug_fixes'):
-                    inst['BUGFIX_issues'] = []
-                    unique_ids = set()
-                    for iss in v:  # tuple is like this: (id, commitdate, revision hash, priority, type)
-                        inst['BUGFIX_issues'].append({'name': iss[0], 'severity': iss[3], 'type': iss[4], 'bugfix_commit': iss[2], 'bugfix_commit_date': iss[1], 'created_at': iss[5]})
-                        unique_ids.add(iss[0])
-
-                        if instance['file'] not in bug_fixes.keys():
-                            bug_fixes[instance['file']] = set()
-
-                        issue_name = '{}_{}_{}'.format(iss[0], iss[3], max(latest_bugfix[iss[0]]))
-                        bug_fixes[instance['file']].add(issue_name)
-                        inst[issue_name] = 1
-                    inst['BUGFIX_count'] = len(set(unique_ids))
-
-                # count all refactorings
-                elif k == 'refactorings':
-                    for ref in v:
-                        ref_name = 'REFACTOR_{}'.format(ref)
-                        if ref_name not in inst.keys():
-                            inst[ref_name] = 0
-                        inst[ref_name] += 1
-
-                # count all change types
-                elif k.startswith('change_types'):
-                    for change_dict in v:
-                        for change_type, change_count in change_dict.items():
-                            change_name = 'CHANGE_TYPE_{}'.format(change_type.lower())
-                            if change_name not in inst.keys():
-                                inst[change_name] = 0
-                            inst[change_name] += change_count
-
-                elif k.startswith(('SM_method', 'SM_interface', 'SM_enum', 'SM_class', 'SM_annotation')):  # and isinstance(v, list):  # everything in ce_type file is not a list because we only have one
-
-                    if isinstance(v, list):
-                        v2 = v
-                    else:
-                        v2 = [v]
-                    # special aggregations for method level to file level
-                    # if k.startswith('SM_method'):
-                    for value in v2:
-                        if math.isnan(value):
-                            self._log.error('value is NaN for {} in file {}'.format(k, instance['file']))
-                    inst[k + '_sum'] = sum(v2)
-                    inst[k + '_min'] = min(v2)
-                    inst[k + '_max'] = max(v2)
-                    inst[k + '_avg'] = sum(v2) / len(v2)  # we only have this k if we have at least one element in the list
-                    inst[k + '_median'] = 0
-                    inst[k + '_stdev'] = 0
-                    inst[k + '_coefficient_of_variation'] = 0
-                    inst[k + '_gini'] = 0
-                    inst[k + '_hoover'] = 0
-                    inst[k + '_atkinson'] = 0
-                    inst[k + '_shannon_entropy'] = 0
-                    inst[k + '_generalized_entropy'] = 0
-                    inst[k + '_theil'] = 0
-                    if len(v2) > 0:
-                        inst[k + '_median'] = aggregation.median(v2)
-                        inst[k + '_stdev'] = aggregation.stddev(v2)
-                        inst[k + '_coefficient_of_variation'] = aggregation.cov(v2)
-                        inst[k + '_gini'] = aggregation.gini(v2)
-                        inst[k + '_hoover'] = aggregation.hoover(v2)
-                        inst[k + '_atkinson'] = aggregation.atkinson(v2)
-                        inst[k + '_shannon_entropy'] = aggregation.shannon_entropy(v2)
-                        inst[k + '_generalized_entropy'] = aggregation.generalized_entropy(v2)
-                        inst[k + '_theil'] = aggregation.theil(v2)
-
-                # collect severities
-                elif k.startswith('PMD') and not k.startswith('PMD_severity_') and not k.startswith('PMD_rule_type_') and not k.startswith('PMD_package'):
-                    # create keys for all severities
-                    for sev in PMD_SEVERITIES:
-                        key = 'PMD_severity_{}'.format(sev.lower())
-                        if key not in inst.keys():
-                            inst[key] = 0
-
-                    for rt in PMD_RULE_TYPES:
-                        key = 'PMD_rule_type_{}'.format(rt.lower())
-                        if key not in inst.keys():
-                            inst[key] = 0
-
-                    # count rule violation towards its severity
-                    inst['PMD_severity_' + PMD_RMATCH[k].lower()] += 1
-
-                    # count rule violations toward its rule type
-                    inst['PMD_rule_type_' + PMD_RTMATCH[k].lower()] += 1
-
-                    # also set normal counts for PMD Linter
-                    tmp = k.split('_')
-                    inst['_'.join(tmp[0:-1]) + '_' + tmp[-1].lower()] = v
-
-                elif k == 'linked_issues':
-
-                    # make this unique quickly per file
-                    linked_issues = set()
-                    for i in v:
-                        linked_issues.add('{}_{}_{}'.format(i['priority'], i['issue_type'], i['external_id']))
-
-                    for issue in linked_issues:  # we only count each issue once
-                        issue_severity, issue_type, issue_id = issue.split('_')
-
-                        itype = str(issue_type).lower().strip()
-                        if itype in TICKET_TYPE_MAPPING.keys():
-                            itype = TICKET_TYPE_MAPPING[itype]
-                        else:
-                            itype = 'other'
-
-                        iseverity = str(issue_severity).lower().strip()
-                        if iseverity not in TICKET_SEVERITIES:
-                            iseverity = 'other'
-
-                        key = 'ISSUE_{}_{}'.format(iseverity, itype)
-                        if key not in inst.keys():
-                            inst[key] = 0
-                        inst[key] += 1
-                elif k == 'imports':
-                    inst[k] = ','.join(v)
-                else:
-                    inst[k] = v
-
-            aggregated_instances.append(inst)
+        cache_size = int(self.args.aggregation_cache_size)
+        processes = int(self.args.harmonize_processes)
+        if processes > 1:
+            # a few chunks per process so that the work is balanced, pool.starmap keeps the order of the chunks
+            size = max(1, math.ceil(len(cleaned_instances) / (processes * 4)))
+            chunks = [cleaned_instances[i:i + size] for i in range(0, len(cleaned_instances), size)]
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.starmap(_aggregate_instances, [(chunk, latest_bugfix, cache_size, self.args.aggregation_precision) for chunk in chunks])
+        else:
+            results = [_aggregate_instances(cleaned_instances, latest_bugfix, cache_size, self.args.aggregation_precision)]
+
+        # merge in the order of the instances, the issue sets are filled in the same order as with a single process
+        hits, misses = 0, 0
+        for aggregated, stats in results:
+            hits += stats['hits']
+            misses += stats['misses']
+            for inst, issue_names in aggregated:
+                for issue_name in issue_names:
+                    if inst['file'] not in bug_fixes.keys():
+                        bug_fixes[inst['file']] = set()
+                    bug_fixes[inst['file']].add(issue_name)
+                aggregated_instances.append(inst)
+        self._log.info('aggregation memo: {} hits, {} misses, hit rate {:.2%}'.format(hits, misses, hits / max(1, hits + misses)))
 
         # we build a list of all available metrics and set their value to 0 if they are not in the instance
-        keys = []
-        for key in SM_METRICS + CLONE_METRICS:
-
-            # skip values which are NaN
-            if key in ['SM_method_hcpl', 'SM_method_heff', 'SM_method_htrp', 'SM_method_hvol', 'SM_method_hndb']:
-                continue
-
-            if key.startswith(('SM_method', 'SM_interface', 'SM_enum', 'SM_class', 'SM_annotation')):
-                keys.append(key + '_sum')
-                keys.append(key + '_min')
-                keys.append(key + '_max')
-                keys.append(key + '_avg')
-                keys.append(key + '_median')
-                keys.append(key + '_stdev')
-                keys.append(key + '_coefficient_of_variation')
-                keys.append(key + '_gini')
-                keys.append(key + '_hoover')
-                keys.append(key + '_atkinson')
-                keys.append(key + '_shannon_entropy')
-                keys.append(key + '_generalized_entropy')
-                keys.append(key + '_theil')
-            else:
-                keys.append(key)
-
-        # build PMD keys for abbrevs and also for severities
-        for key in PMD_RMATCH.keys():
-            tmp = key.split('_')
-            keys.append('_'.join(tmp[:-1]) + '_' + tmp[-1].lower())
-
-        for key in list(set(PMD_RMATCH.values())):
-            keys.append('PMD_severity_' + key.lower())
-
-        # PMD rule types
-        for key in PMD_RULE_TYPES:
-            keys.append('PMD_rule_type_' + key.lower())
-
-        # commit change tpye
-        for change_type in CHANGE_TYPES:
-            change_name = 'CHANGE_TYPE_{}'.format(change_type.lower())
-            keys.append(change_name)
-
-        # refactoring types
-        for key in REFACTORING_TYPES:
-            keys.append('REFACTOR_{}'.format(key))
-
-        # ticket severities
-        for key in TICKET_SEVERITIES + ['other']:
-            for key2 in set(TICKET_TYPE_MAPPING.values()):
-                keys.append('ISSUE_{}_{}'.format(key.lower(), key2.lower()))
-
-        # java node types (we should have these for every file)
-        for key in JAVA_NODE_TYPES:
-            keys.append('AST_{}'.format(key.lower()))
+        keys = list(STATIC_COLUMNS)
+        known = set(keys)
 
         # we also add keys present in every instance (change, bug_fix, etc.)
         # this allows us to add this without having extra definitions for these
         # print('aggregated keys', aggregated_instances[0].keys())
         for key in aggregated_instances[0].keys():
-            if key not in keys:
+            if key not in known:
                 # print('adding', key)
                 keys.append(key)
+                known.add(key)
 
         # filter our keys for stuff we do not want in aggregated but exist in every instance
         for remove in ['refactorings', 'bug_fixes', 'change_types', 'BUGFIX_issues']:
-            if remove in keys:
+            if remove in known:
                 keys.remove(remove)
+                known.remove(remove)
 
         # bug fixes matrix
         for issues in bug_fixes.values():
             for issue in issues:
-                keys.append(issue)
+                if issue not in known:
+                    keys.append(issue)
+                    known.add(issue)
+
+        # the aggregated instances stay sparse, missing keys are 0
+        return aggregated_instances, bug_fixes, keys
+
+    def _write_json(self, name, objects, metadata=None):
+        """Write the objects (e.g., instances) as JSON document or JSON Lines depending on the json format argument.
+
+        The JSON document is a list of the objects, or with metadata the metadata and the objects as instances.
+        JSON Lines are written one object at a time, the metadata is the first line.
+        """
+        filename = name + '.' + self.args.json_format + output.COMPRESSION_EXTENSIONS[self.args.json_compression]
+        if self.args.json_format == 'jsonl':
+            output.write_jsonl(filename, objects, metadata)
+            return
+
+        data = list(objects)
+        if metadata is not None:
+            data = dict(metadata, instances=data)
+        with output.open_text(filename, 'w') as outfile:
+            json.dump(data, outfile, sort_keys=True, indent=4)
 
-        harmonized_instances = []
-        for instance in aggregated_instances:
-            inst = {}
-            for k in keys:
-                if k not in instance.keys():
-                    inst[k] = 0
-                else:
-                    inst[k] = instance[k]
-            harmonized_instances.append(inst)
+    def _csv_header(self, keys, bug_fixes):
+        """Header of the CSV file, file first, then all other keys sorted, BUGFIX_count and the issue matrix at the end.
 
-        return harmonized_instances, bug_fixes, keys
+        The issue columns are kept in an ordered set (dict) so that the header is built in linear time.
+        """
+        issue_columns = {}
+        for issues in bug_fixes.values():
+            for issue in issues:
+                issue_columns[issue] = None
 
-    def start_mining(self, release):
-        start = timeit.default_timer()
+        header = ['file']
+        for key in sorted(set(keys)):
+            if key not in issue_columns and key not in ['file', 'BUGFIX_count']:
+                header.append(key)
+        header.append('BUGFIX_count')
+        header.extend(issue_columns.keys())
+        return header
 
-        project_id = Project.objects.get(name=self.args.project_name).id
-        self.vcs = VCSSystem.objects.get(project_id=project_id)
+    def _write_csv(self, filename, header, aggregated_instances):
+        """Write the harmonized instances to the CSV file.
 
-        m = Mynbou(self.vcs, self.args.project_name, release)
-        instances, release_information = m.release(self.args.type)
+        Every row is formatted from the sparse instance while it is written, missing keys are 0, and written through a large write buffer.
+        """
+        with open(filename, 'w', buffering=CSV_BUFFER_SIZE) as outfile:
+            outfile.write(';'.join(header) + '\n')
+            outfile.writelines(';'.join([str(instance.get(key, 0)) for key in header]) + '\n' for instance in aggregated_instances)
+
+    def start_mining(self, release):
+        start = timeit.default_timer()
 
         base_file_name = self.release_name
         if self.args.type != 'False':
             base_file_name = '{}_{}'.format(self.release_name, self.args.type)
 
+        # per stage timing and query counts are written next to the outputs
+        report = None
+        if self.args.instrumentation_report.lower() != 'false':
+            report = instrumentation.Report().start()
+
+        # nested spans of the stages and methods as Chrome trace, optionally with cProfile statistics per stage
+        profiler = None
+        if self.args.profile.lower() != 'false' or self.args.profile_stats_dir:
+            profiler = profiling.Profiler(self.args.profile_stats_dir).start()
+
+        try:
+            self._mine(release, base_file_name)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+                profiler.save(base_file_name + '_trace.json')
+            if report is not None:
+                report.stop()
+                report.save(base_file_name + '_instrumentation.json')
+
+        end = timeit.default_timer() - start
+        log.info("Finished mynbou in {:.5f}s".format(end))
+
+    def _compare_document_mode(self, release, window_size_days, instances, release_information):
+        """Mine the release again from full mongoengine documents and raise an exception if the result differs from the lean mode."""
+        log.info('mining release {} in document mode for comparison'.format(release))
+        m = Mynbou(self.vcs, self.args.project_name, release, repository=MongoRepository(self.vcs, lean=False))
+        full_instances, full_information = m.release(self.args.type, window_size_days, self.args.accumulate_change_metrics.lower() != 'false')
+
+        # repr also compares NaN values and the order of the metrics
+        differences = sorted(file for file in set(instances.keys()) | set(full_instances.keys()) if repr(instances.get(file)) != repr(full_instances.get(file)))
+        if differences or release_information != full_information:
+            raise Exception('Release {} differs between lean and document mode for {} files: {}'.format(release, len(differences), ', '.join(differences[:10])))
+        log.info('lean and document mode yield the same release')
+
+    def _mine(self, release, base_file_name):
+        # a local snapshot replaces the database
+        repository = None
+        if self.args.snapshot:
+            repository = snapshot.load_snapshot(self.args.snapshot)
+            self.vcs = repository.vcs
+        else:
+            project_id = Project.objects.get(name=self.args.project_name).id
+            self.vcs = VCSSystem.objects.get(project_id=project_id)
+            repository = MongoRepository(self.vcs, lean=self.args.document_mode != 'full', file_cache=shared_file_cache(int(self.args.file_cache_size)))
+
+        # a comma separated list of window sizes calculates the windowed change metrics for every window size
+        window_size_days = [int(size) for size in str(self.args.window_size_days).split(',')]
+        if len(window_size_days) == 1:
+            window_size_days = window_size_days[0]
+
+        # incremental mining, the state of previously mined releases is reused and updated with the commits of this release
+        state = None
+        if self.args.state_file:
+            state = VolgState.load(self.args.state_file, self.vcs.id)
+
+        m = Mynbou(self.vcs, self.args.project_name, release, self.args.checkpoint_dir, repository)
+        instances, release_information = m.release(self.args.type, window_size_days, self.args.accumulate_change_metrics.lower() != 'false', state)
+
+        if state is not None:
+            state.save(self.args.state_file)
+
+        if self.args.document_mode == 'compare' and not self.args.snapshot:
+            self._compare_document_mode(release, window_size_days, instances, release_information)
+
         if not instances:
             raise Exception('No instances extracted for this release')
 
         # write full file with only cleaned instances
-        cleaned_instances = self._clean_instances(instances)
-        data = {'release_date': release_information['release_date'],
-                'instances': cleaned_instances}
-        with open(base_file_name + '.json', 'w') as outfile:
-            json.dump(data, outfile, sort_keys=True, indent=4)
+        with instrumentation.stage('clean'):
+            cleaned_instances = self._clean_instances(instances)
+        metadata = {'release_date': release_information['release_date']}
+        with instrumentation.stage('write_json'):
+            self._write_json(base_file_name, cleaned_instances, metadata)
 
         # information about bug_fixes written to extra file
-        bug_info = self._bug_info(cleaned_instances)
-        with open(base_file_name + '_bug_fixes.json', 'w') as outfile:
-            json.dump(bug_info, outfile, sort_keys=True, indent=4)
+        with instrumentation.stage('write_bug_fixes'):
+            bug_info = self._bug_info(cleaned_instances)
+            self._write_json(base_file_name + '_bug_fixes', bug_info)
 
         # harmonize instances and get keys from harmonization, they are later used to provide a header for the csv file
-        harmonized_instances, bug_fixes, keys = self._harmonize_instances(cleaned_instances)
+        with instrumentation.stage('harmonization'):
+            aggregated_instances, bug_fixes, keys = self._harmonize_instances(cleaned_instances)
 
         # write new aggregated data
-        data['instances'] = harmonized_instances
         if self.args.generate_json.lower() != "false":
-            with open(base_file_name + '_aggregated.json', 'w') as outfile:
-                json.dump(data, outfile, sort_keys=True, indent=4)
+            with instrumentation.stage('write_aggregated_json'):
+                rows = ({k: instance.get(k, 0) for k in keys} for instance in aggregated_instances)
+                self._write_json(base_file_name + '_aggregated', rows, metadata)
 
         # create csv, bugfix_count and matrix at the end
-        # make sure the BUGFIX_count and issue matrix are at the end
-        header = sorted(list(set(keys)))
-        header.remove('file')
-        header.remove('BUGFIX_count')
-        for issue in bug_fixes.values():
-            if type(issue) == set:
-                for i in issue:
-                    if i in header:
-                        header.remove(i)
-            else:
-                if issue in header:
-                    header.remove(issue)
-
-        header = ['file'] + header
-        header.append('BUGFIX_count')
-        for issue in bug_fixes.values():
-            if type(issue) == set:
-                for i in issue:
-                    if i not in header:
-                        header.append(i)
+        with instrumentation.stage('write_aggregated'):
+            header = self._csv_header(keys, bug_fixes)
+            filename = '{}_aggregated.{}'.format(base_file_name, output.OUTPUT_EXTENSIONS[self.args.output_format])
+            if self.args.output_format == 'csv':
+                self._write_csv(filename, header, aggregated_instances)
+            elif self.args.output_format == 'csr':
+                output.write_csr(filename, '{}_aggregated.columns.txt'.format(base_file_name), header, aggregated_instances)
             else:
-                if i not in header:
-                    header.append(issue)
-
-        with open(base_file_name + '_aggregated.csv', 'w') as outfile:
-            outfile.write(';'.join(header) + '\n')
-
-            for instance in harmonized_instances:
-                inst = []
-                for key in header:
-                    inst.append(instance[key])
-                outfile.write(';'.join([str(i) for i in inst]) + '\n')
-
-        end = timeit.default_timer() - start
-        log.info("Finished mynbou in {:.5f}s".format(end))
+                output.write_table(filename, self.args.output_format, header, aggregated_instances)
 
 
 def main(args):
     if args.log_level and hasattr(logging, args.log_level):
         log.setLevel(getattr(logging, args.log_level))
 
-    uri = create_mongodb_uri_string(args.db_user, args.db_password, args.db_hostname, args.db_port, args.db_authentication, args.ssl)
-    connect(args.db_database, host=uri)
+    # the command listener has to be registered before the connection is created
+    if args.instrumentation_report.lower() != 'false':
+        instrumentation.register_command_counter()
+
+    if not args.snapshot:
+        uri = create_mongodb_uri_string(args.db_user, args.db_password, args.db_hostname, args.db_port, args.db_authentication, args.ssl)
+        connect(args.db_database, host=uri)
+
+    if args.export_snapshot:
+        project_id = Project.objects.get(name=args.project_name).id
+        vcs = VCSSystem.objects.get(project_id=project_id)
+        counts = snapshot.export_snapshot(vcs, args.release_commit.split(','), args.export_snapshot)
+        log.info('exported snapshot {}: {}'.format(args.export_snapshot, ', '.join('{} {}'.format(v, k) for k, v in sorted(counts.items()))))
+        return
 
     c = SmartsharkPlugin(args)
     c.start_mining(args.release_commit)
@@ -412,5 +538,22 @@ if __name__ == '__main__':
     parser.add_argument('-tp', '--type', help='Limit window after release for bug-fixing commits to be considered to 6 months.', default='False')
     parser.add_argument('-ll', '--log-level', help='Log level for stdout (DEBUG, INFO), default INFO', default='INFO')
     parser.add_argument('-gs', '--generate-json', help='Indicate if an additional aggregated JSON file should be generated (True, False).', default='False')
+    parser.add_argument('-ac', '--accumulate-change-metrics', help='Calculate change metrics on the fly without keeping the raw lists of authors, revisions, commit messages and changed lines (True, False), these lists are then missing from the JSON output.', default='False')
+    parser.add_argument('-sf', '--state-file', help='File for intermediate per commit data which is reused and updated by consecutive runs for releases of the same project (incremental mining).', default=None)
+    parser.add_argument('-ap', '--aggregation-precision', help='Precision of the Fraction based aggregations (hoover, shannon_entropy, generalized_entropy, theil), exact uses rational arithmetic, fast uses floats with correctly rounded summation (exact, fast), default exact', default='exact')
+    parser.add_argument('-acs', '--aggregation-cache-size', help='Number of distinct value lists for which the aggregations are memoized, 0 disables the memo, default 100000', default='100000')
+    parser.add_argument('-hp', '--harmonize-processes', help='Number of processes which aggregate the instances in chunks, the output is the same as with a single process, default 1', default='1')
+    parser.add_argument('-of', '--output-format', help='Format of the aggregated dataset (csv, npz, parquet, arrow, csr), the columns have the same order as in the csv file, parquet and arrow require pyarrow, csr writes the numeric columns as sparse matrix with a column index file, default csv', default='csv', choices=output.OUTPUT_FORMATS)
+    parser.add_argument('-jf', '--json-format', help='Format of the JSON files, json writes one document per file, jsonl writes one instance per line with the release date in the first line (json, jsonl), default json', default='json', choices=output.JSON_FORMATS)
+    parser.add_argument('-jc', '--json-compression', help='Compression of the JSON files, zstd requires zstandard (none, gzip, zstd), default none', default='none', choices=output.COMPRESSIONS)
+    parser.add_argument('-cd', '--checkpoint-dir', help='Directory for checkpoints of the mining stages, a rerun with the same directory, release and parameters resumes after the last completed stage.', default=None)
+    parser.add_argument('-ir', '--instrumentation-report', help='Write the wall time, CPU time, peak memory increase and MongoDB queries and documents per collection of every stage to <release name>_instrumentation.json (True, False), default False', default='False')
+    parser.add_argument('-pf', '--profile', help='Write nested spans of the stages and of the methods of Mynbou, Volg, OntdekBaan and the change metrics as Chrome trace to <release name>_trace.json (True, False), default False', default='False')
+    parser.add_argument('-psd', '--profile-stats-dir', help='Directory for cProfile statistics (.pstats) of every top level stage, implies --profile.', default=None)
+    parser.add_argument('-es', '--export-snapshot', help='Export the data of the project needed for the release commits (comma separated) to this snapshot file and exit without mining.', default=None)
+    parser.add_argument('-ss', '--snapshot', help='Mine the release from this snapshot file (see --export-snapshot) instead of the database.', default=None)
+    parser.add_argument('-dm', '--document-mode', help='Documents of the database queries, lean loads only the needed fields as raw documents, full loads mongoengine documents, compare mines the release in both modes and fails if they differ (lean, full, compare), default lean', default='lean', choices=DOCUMENT_MODES)
+    parser.add_argument('-fcs', '--file-cache-size', help='Number of files whose id and path are cached in lean document mode, the cache is warmed up with every file of the project, 0 disables the cache, default 100000', default='100000')
+    parser.add_argument('-ws', '--window-size-days', help='Window size in days for Hassan and D\'Ambros metrics, a comma separated list (e.g., 7,14,30,90) calculates every window size with suffixed metric names, default 14', default='14')
 
     main(parser.parse_args())
@@ -4,13 +4,51 @@
 import sys
 import unittest
 import math
+import random
+from fractions import Fraction
+
+import numpy as np
 
 from mynbou.aggregation import *
 
 
+def _ratios_to_mean(vals):
+    """Ratios of the values to the mean as in generalized_entropy and theil, the floored mean is used for integer values."""
+    mean = sum(vals) / len(vals)
+    ratios = []
+    for value in vals:
+        if math.isnan(value) or math.isnan(mean):
+            continue
+        elif int(value) == value and math.floor(mean) > 0:
+            ratios.append(int(value) / math.floor(mean))
+        elif mean > 0:
+            ratios.append(value / mean)
+    return ratios
+
+
+def _absolute_terms(func, vals):
+    """Sum of the absolute summed terms of a fast aggregation including its constant factor, the parts of differences are added separately."""
+    N = len(vals)
+    if func is hoover:
+        total = math.fsum(vals)
+        return 0 if total == 0 or math.isnan(total) else math.fsum(0.5 * abs(v / total) + 0.5 / N for v in vals)
+    if func is shannon_entropy:
+        return math.fsum(abs(vals.count(v) / N * math.log(vals.count(v) / N)) / N for v in vals)
+    if func is generalized_entropy:
+        # prefix -1 / (N * alpha * (1 - alpha)) with alpha = 0.5
+        return math.fsum(4 / N * (math.sqrt(vm) + 1) for vm in _ratios_to_mean(vals) if vm >= 0)
+    if func is theil:
+        return math.fsum(abs(vm * math.log(vm)) / N for vm in _ratios_to_mean(vals) if vm > 0)
+
+
 class TestAggregations(unittest.TestCase):
     """Test aggregation methods."""
 
+    def test_mean(self):
+        self.assertEqual(6, mean([2, 10]))
+        self.assertEqual(1.5, mean([0.5, 1, 3]))
+        self.assertTrue(math.isnan(mean([1, math.nan])))
+
     def test_median(self):
         vals1 = sorted([0, 1, 5, 0, 0, 3, 2.1, 0.0009, 0.5])
         vals2 = sorted([0, 1, 5, 0, 0, 3, 2.1, 0.0009, 0.5, 0.3])
@@ -96,4 +134,109 @@ class TestAggregations(unittest.TestCase):
         self.assertEqual(0, theil(vals))
 
         vals = [0, math.nan]
-        self.assertEqual(0, theil(vals))
\ No newline at end of file
+        self.assertEqual(0, theil(vals))
+
+    def test_aggregate_all(self):
+        for vals in [[2, 10], [0, 0], [0, math.nan], [1, 1, 2], [0.5, 3, 3, 7.25, 0]]:
+            have = aggregate_all(vals)
+            want = {'sum': sum(vals), 'min': min(vals), 'max': max(vals), 'avg': sum(vals) / len(vals), 'median': median(vals), 'stdev': stddev(vals),
+                    'coefficient_of_variation': cov(vals), 'gini': gini(vals), 'hoover': hoover(vals), 'atkinson': atkinson(vals),
+                    'shannon_entropy': shannon_entropy(vals), 'generalized_entropy': generalized_entropy(vals), 'theil': theil(vals)}
+
+            self.assertEqual(list(have.keys()), AGGREGATIONS)
+            for k, v in want.items():
+                if math.isnan(v):
+                    self.assertTrue(math.isnan(have[k]))
+                else:
+                    self.assertEqual(v, have[k])
+
+    def test_aggregate_batch(self):
+        lists = [[2, 10], [0, 0], [], [1, 1, 2], [0.5, 3, 3, 7.25, 0], [4], [1, 2, math.nan], [math.nan, 1, 2], [0, math.nan]]
+        offsets = [0]
+        for vals in lists:
+            offsets.append(offsets[-1] + len(vals))
+
+        have = aggregate_batch([v for vals in lists for v in vals], offsets)
+        for i, vals in enumerate(lists):
+            want = aggregate_all(vals)
+            for k in AGGREGATIONS:
+                if math.isnan(want[k]):
+                    self.assertTrue(math.isnan(have[k][i]))
+                else:
+                    self.assertAlmostEqual(want[k], have[k][i], places=12)
+
+        # min and max skip NaN values which are not the first value as in aggregate_all
+        self.assertEqual(have['min'][6], 1)
+        self.assertEqual(have['max'][6], 2)
+        self.assertTrue(math.isnan(have['min'][7]))
+
+    def test_fast_precision(self):
+        cases = [[2, 10], [0, 0], [0, math.nan], [0, 1, 5, 0, 0, 3, 2.1, 0.0009, 0.5], [1, 1, 2]]
+
+        # large random inputs, integers, floats and many duplicates
+        rnd = random.Random(42)
+        for size in [10, 100, 1000]:
+            cases.append([rnd.randint(0, 50) for _ in range(size)])
+            cases.append([rnd.expovariate(0.1) for _ in range(size)])
+            cases.append([rnd.choice([0, 1, 2.5, rnd.random() * 1000]) for _ in range(size)])
+
+        for vals in cases:
+            for func in [hoover, shannon_entropy, generalized_entropy, theil]:
+                # the documented bound relative to the sum of the absolute terms
+                bound = FAST_ERROR_BOUND * _absolute_terms(func, vals)
+                exact = func(vals)
+                fast = func(vals, precision='fast')
+                if math.isnan(exact):
+                    self.assertTrue(math.isnan(fast))
+                else:
+                    self.assertLessEqual(abs(exact - fast), bound)
+
+                # aggregate_all uses the same calculation
+                if not math.isnan(fast):
+                    self.assertEqual(fast, aggregate_all(vals, precision='fast')[func.__name__])
+
+    def test_unknown_precision(self):
+        with self.assertRaises(Exception):
+            hoover([2, 10], precision='approximate')
+
+    def test_exact_sum(self):
+        rnd = random.Random(1)
+        for _ in range(1000):
+            vals = [rnd.random() * 10 ** rnd.randint(-20, 20) * rnd.choice([1, -1]) for _ in range(rnd.randint(1, 30))]
+            exact = float(sum(map(Fraction, vals), Fraction(0)))
+            self.assertEqual(exact, exact_sum(vals))
+            self.assertEqual(exact, exact_sum(np.array(vals)))
+            self.assertEqual(exact_sum(vals), exact_sum(reversed(vals)))
+
+        # same behaviour as msum where math.fsum differs
+        for vals in [[], [2, 10], [math.inf], [math.inf, 1], [math.inf, -math.inf], [0, math.nan], [1e308, 1e308], [Fraction(1, 3)] * 3, [2 ** 60, 1]]:
+            if math.isnan(msum(vals)):
+                self.assertTrue(math.isnan(exact_sum(vals)))
+            else:
+                self.assertEqual(msum(vals), exact_sum(vals))
+
+    def test_aggregation_memo(self):
+        memo = AggregationMemo(maxsize=2)
+        rnd = random.Random(3)
+        cases = [[1], [0, 0], [0.0, 0.0], [0, 0.0], [0.0, 0], [-0.0], [0.0], [1, 1, 2], [2, 1, 1], [0, math.nan], [1e16, 1, -1e16], [-1e16, 1, 1e16]]
+        cases += [[rnd.choice([0, 1, 2, 0.5]) for _ in range(rnd.randint(1, 4))] for _ in range(200)]
+
+        for vals in cases:
+            want = aggregate_all(vals)
+            have = memo.aggregate(vals)
+            self.assertEqual(list(want.keys()), list(have.keys()))
+            for k in AGGREGATIONS:
+                if math.isnan(want[k]):
+                    self.assertTrue(math.isnan(have[k]))
+                else:
+                    self.assertEqual(repr(want[k]), repr(have[k]))
+
+        stats = memo.stats()
+        self.assertEqual(len(cases), stats['hits'] + stats['misses'])
+        self.assertGreater(stats['hits'], 0)
+        self.assertEqual(2, stats['size'])
+
+        memo = AggregationMemo()
+        memo.aggregate([1, 1, 2])
+        memo.aggregate([2, 1, 1])
+        self.assertEqual({'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1, 'maxsize': 100000}, memo.stats())
@@ -6,7 +6,7 @@ import math
 
 import datetime
 
-from mynbou.metrics.change import hassan, dambros, moser
+from mynbou.metrics.change import hassan, dambros, moser, classify_message, ChangeMetricsAccumulator
 
 INSTANCES = {'test.py': {'age': 16,
                          'ages': [0, 2, 4, 4, 16],
@@ -103,6 +103,14 @@ class TestChangeMetrics(unittest.TestCase):
 
         self.assertEqual(moser_test, moser_wanted)
 
+    def test_moser_message_classification(self):
+        """Refactoring and bug-fix classification of commit messages."""
+        self.assertEqual(classify_message('Refactored the parser'), (True, False))
+        self.assertEqual(classify_message('FIX for BUG-123'), (False, True))
+        self.assertEqual(classify_message('add a prefix to names'), (False, False))
+        self.assertEqual(classify_message('fix a postfix operator'), (False, False))
+        self.assertEqual(classify_message('refactor and fix'), (True, True))
+
     def test_hassan_metrics(self):
         """Happy path check for all hassan metrics on our fixture."""
         phi1 = 1
@@ -115,25 +123,83 @@ class TestChangeMetrics(unittest.TestCase):
         h1 = -((5 / 8) * math.log(5 / 8, 3) + (3 / 8) * math.log(3 / 8, 3))
         h2 = -((3 / 10) * math.log(3 / 10, 3) + (3 / 10) * math.log(3 / 10, 3) + (4 / 10) * math.log(4 / 10, 3))
 
-        wanted = {'test.py': {'HASSAN_ldhcm': h1 / (phi2 * (2 + 1 - 1)) + h2 / (phi2 * (2 + 1 - 2)),
-                              'HASSAN_lgdhcm': h1 / (phi3 * math.log(2 + 1.01 - 1)) + h2 / (phi3 * math.log(2 + 1.01 - 2)),
-                              'HASSAN_edhcm': h1 / math.exp(phi1 * (2 - 1)) + h2 / math.exp(phi1 * (2 - 2)),
+        wanted = {'test.py': {'HASSAN_ldhcm': h1 / (phi1 * (2 + 1 - 1)) + h2 / (phi1 * (2 + 1 - 2)),
+                              'HASSAN_lgdhcm': h1 / (phi2 * math.log(2 + 1.01 - 1)) + h2 / (phi2 * math.log(2 + 1.01 - 2)),
+                              'HASSAN_edhcm': h1 / math.exp(phi3 * (2 - 1)) + h2 / math.exp(phi3 * (2 - 2)),
+                              'HASSAN_whcm': (5 / 8) * h1 + (3 / 10) * h2,
+                              'HASSAN_hcm': h1 + h2},
+                  'test2.py': {'HASSAN_ldhcm': h1 / (phi1 * (2 + 1 - 1)) + h2 / (phi1 * (2 + 1 - 2)),
+                               'HASSAN_lgdhcm': h1 / (phi2 * math.log(2 + 1.01 - 1)) + h2 / (phi2 * math.log(2 + 1.01 - 2)),
+                               'HASSAN_edhcm': h1 / math.exp(phi3 * (2 - 1)) + h2 / math.exp(phi3 * (2 - 2)),
+                               'HASSAN_whcm': (3 / 8) * h1 + (3 / 10) * h2,
+                               'HASSAN_hcm': h1 + h2},
+                  'test3.py': {'HASSAN_ldhcm': h2 / (phi1 * (1 + 1 - 1)),
+                               'HASSAN_lgdhcm': h2 / (phi2 * math.log(1 + 1.01 - 1)),
+                               'HASSAN_edhcm': h2 / math.exp(phi3 * (1 - 1)),
+                               'HASSAN_whcm': (4 / 10) * h2,
+                               'HASSAN_hcm': h2}}
+
+        self.maxDiff = None
+        self.assertEqual(have, wanted)
+
+    def test_hassan_decay_factors(self):
+        """Distinct decay factors, phi1 is used for the linear, phi2 for the logarithmic and phi3 for the exponential decay."""
+        phi1 = 2
+        phi2 = 3
+        phi3 = 0.5
+
+        have = hassan(INSTANCES, window_size_days=7, phi1=phi1, phi2=phi2, phi3=phi3)
+
+        # formula for adaptive sizing entropy
+        h1 = -((5 / 8) * math.log(5 / 8, 3) + (3 / 8) * math.log(3 / 8, 3))
+        h2 = -((3 / 10) * math.log(3 / 10, 3) + (3 / 10) * math.log(3 / 10, 3) + (4 / 10) * math.log(4 / 10, 3))
+
+        wanted = {'test.py': {'HASSAN_ldhcm': h1 / (phi1 * (2 + 1 - 1)) + h2 / (phi1 * (2 + 1 - 2)),
+                              'HASSAN_lgdhcm': h1 / (phi2 * math.log(2 + 1.01 - 1)) + h2 / (phi2 * math.log(2 + 1.01 - 2)),
+                              'HASSAN_edhcm': h1 / math.exp(phi3 * (2 - 1)) + h2 / math.exp(phi3 * (2 - 2)),
                               'HASSAN_whcm': (5 / 8) * h1 + (3 / 10) * h2,
                               'HASSAN_hcm': h1 + h2},
-                  'test2.py': {'HASSAN_ldhcm': h1 / (phi2 * (2 + 1 - 1)) + h2 / (phi2 * (2 + 1 - 2)),
-                               'HASSAN_lgdhcm': h1 / (phi3 * math.log(2 + 1.01 - 1)) + h2 / (phi3 * math.log(2 + 1.01 - 2)),
-                               'HASSAN_edhcm': h1 / math.exp(phi1 * (2 - 1)) + h2 / math.exp(phi1 * (2 - 2)),
+                  'test2.py': {'HASSAN_ldhcm': h1 / (phi1 * (2 + 1 - 1)) + h2 / (phi1 * (2 + 1 - 2)),
+                               'HASSAN_lgdhcm': h1 / (phi2 * math.log(2 + 1.01 - 1)) + h2 / (phi2 * math.log(2 + 1.01 - 2)),
+                               'HASSAN_edhcm': h1 / math.exp(phi3 * (2 - 1)) + h2 / math.exp(phi3 * (2 - 2)),
                                'HASSAN_whcm': (3 / 8) * h1 + (3 / 10) * h2,
                                'HASSAN_hcm': h1 + h2},
-                  'test3.py': {'HASSAN_ldhcm': h2 / (phi2 * (1 + 1 - 1)),
-                               'HASSAN_lgdhcm': h2 / (phi3 * math.log(1 + 1.01 - 1)),
-                               'HASSAN_edhcm': h2 / math.exp(phi1 * (1 - 1)),
+                  'test3.py': {'HASSAN_ldhcm': h2 / (phi1 * (1 + 1 - 1)),
+                               'HASSAN_lgdhcm': h2 / (phi2 * math.log(1 + 1.01 - 1)),
+                               'HASSAN_edhcm': h2 / math.exp(phi3 * (1 - 1)),
                                'HASSAN_whcm': (4 / 10) * h2,
                                'HASSAN_hcm': h2}}
 
         self.maxDiff = None
         self.assertEqual(have, wanted)
 
+    def test_hassan_multiple_windows(self):
+        """Multiple window sizes yield the same metrics as single runs, suffixed with the window size."""
+        have = hassan(INSTANCES, window_size_days=[7, 14])
+
+        wanted = {}
+        for size in [7, 14]:
+            for file, metrics in hassan(INSTANCES, window_size_days=size).items():
+                if file not in wanted.keys():
+                    wanted[file] = {}
+                for k, v in metrics.items():
+                    wanted[file]['{}_{}d'.format(k, size)] = v
+
+        self.maxDiff = None
+        self.assertEqual(have, wanted)
+
+    def test_accumulator(self):
+        """Running change metrics yield the same results as the calculation on the full lists."""
+        acc = ChangeMetricsAccumulator(INSTANCES.keys())
+        for file, m in INSTANCES.items():
+            for idx, revision_hash in enumerate(m['revisions']):
+                acc.add(file, revision_hash, m['authors'][idx], m['commit_messages'][idx], m['lines_added'][idx], m['lines_deleted'][idx], m['changesets'][idx], m['ages'][idx], m['days_from_release'][idx])
+
+        self.maxDiff = None
+        self.assertEqual(acc.moser({file: m['age'] for file, m in INSTANCES.items()}), moser(INSTANCES))
+        self.assertEqual(acc.hassan(window_size_days=7), hassan(INSTANCES, window_size_days=7))
+        self.assertEqual(acc.hassan(window_size_days=[7, 14]), hassan(INSTANCES, window_size_days=[7, 14]))
+
     def test_dambros(self):
         """Happy path check for all dambros metrics, here we do not use the fixture but define a delta matrix for two files, two timestepas and two metrics."""
         phi1 = 1
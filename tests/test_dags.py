@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import networkx as nx
+
+from mynbou.path import OntdekBaan
+from benchmarks.dags import SHAPES, generate_dag
+
+
+class TestDags(unittest.TestCase):
+
+    def test_shapes(self):
+        for shape in SHAPES:
+            graph, head = generate_dag(shape, 500)
+            self.assertTrue(nx.is_directed_acyclic_graph(graph))
+            self.assertGreaterEqual(len(graph), 500)
+            self.assertEqual([node for node in graph if graph.in_degree(node) == 0], ['c0'])
+            self.assertEqual([node for node in graph if graph.out_degree(node) == 0], [head])
+
+            # every commit is reached by the traversal back to the origin
+            o = OntdekBaan(graph)
+            o.set_path(head, 'backward')
+            self.assertEqual(set(node for path in o.all_paths() for node in path), set(graph.nodes()))
+
+            max_parents = max(graph.in_degree(node) for node in graph)
+            if shape == 'linear':
+                self.assertEqual(max_parents, 1)
+            elif shape == 'octopus':
+                self.assertGreater(max_parents, 2)
+            else:
+                self.assertEqual(max_parents, 2)
+
+    def test_deterministic(self):
+        first, _ = generate_dag('feature_branches', 300, seed=2)
+        second, _ = generate_dag('feature_branches', 300, seed=2)
+        self.assertEqual(sorted(first.edges()), sorted(second.edges()))
+
+    def test_unknown_shape(self):
+        with self.assertRaises(Exception):
+            generate_dag('spiral', 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import os
 import math
 import json
+import tempfile
 import importlib
 import unittest
 import datetime
+from unittest import mock
 
 import mongoengine
 from bson.objectid import ObjectId
 
-from pycoshark.mongomodels import VCSSystem, Commit, CodeEntityState, File, FileAction, Issue
+from pycoshark.mongomodels import VCSSystem, Commit, CodeEntityState, File, FileAction, Issue, Event
+from pycoshark.utils import jira_is_resolved_and_fixed
 from mynbou.core import Mynbou
+from mynbou.path import Volg
+from mynbou.state import VolgState
+from mynbou.snapshot import export_snapshot, load_snapshot
+from mynbou.repository import MongoRepository, Record, FileCache, shared_file_cache
 
 
 class TestDatabase(unittest.TestCase):
@@ -26,6 +34,9 @@ class TestDatabase(unittest.TestCase):
         mongoengine.connection.disconnect()
         mongoengine.connect('testdb', host='mongomock://localhost')
 
+        # the fixtures are loaded again for every test, the cached files of the previous test are stale
+        shared_file_cache().clear()
+
     def tearDown(self):
         """Tear down the mongomock connection."""
         mongoengine.connection.disconnect()
@@ -384,3 +395,266 @@ class TestDatabase(unittest.TestCase):
                                         'HASSAN_hcm': h2}}
 
         self.assertEqual(hassan, hassan_wanted)
+
+    def test_change_accumulated(self):
+        """Accumulated change metrics are the same as the change metrics calculated from the full lists."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        ces1 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE1")
+        ces2 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE2")
+        ces3 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE3")
+        c.code_entity_states = [ObjectId(ces1.id), ObjectId(ces2.id), ObjectId(ces3.id)]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        m = Mynbou(vcs, project_name, release)
+        instances, release_information = m.release("False")
+        accumulated, release_information = m.release("False", accumulate=True)
+
+        for file, values in instances.items():
+            want = {k: v for k, v in values.items() if k.startswith(('HASSAN', 'MOSER'))}
+            have = {k: v for k, v in accumulated[file].items() if k.startswith(('HASSAN', 'MOSER'))}
+            self.assertEqual(have, want)
+
+            # the raw lists are not kept
+            self.assertNotIn('commit_messages', accumulated[file].keys())
+
+    def test_incremental_state(self):
+        """Releases mined with a state of a previous run yield the same results as without a state."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        ces1 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE1")
+        ces2 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE2")
+        ces3 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE3")
+        c.code_entity_states = [ObjectId(ces1.id), ObjectId(ces2.id), ObjectId(ces3.id)]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        m = Mynbou(vcs, project_name, release)
+        instances, release_information = m.release("False")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_file = os.path.join(tmp, 'state.pickle.gz')
+
+            state = VolgState.load(state_file, vcs.id)
+            first, release_information = m.release("False", state=state)
+            state.save(state_file)
+
+            # the state contains every commit of the change path
+            self.assertEqual(set(state.changes.keys()), release_information['change_path_commits'])
+
+            state = VolgState.load(state_file, vcs.id)
+            second, release_information = m.release("False", state=state)
+
+        self.maxDiff = None
+        self.assertEqual(first, instances)
+        self.assertEqual(second, instances)
+
+    def test_checkpoints(self):
+        """A run which failed in the last stage is resumed from the checkpoints and yields the same results."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        ces1 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE1")
+        ces2 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE2")
+        ces3 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE3")
+        c.code_entity_states = [ObjectId(ces1.id), ObjectId(ces2.id), ObjectId(ces3.id)]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        instances, release_information = Mynbou(vcs, project_name, release).release("False")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            m = Mynbou(vcs, project_name, release, checkpoint_dir=tmp)
+            with mock.patch.object(Mynbou, '_file_metrics', side_effect=Exception('2 files in CodeEntityStates for A.java')):
+                with self.assertRaises(Exception):
+                    m.release("False")
+
+            # the rerun starts with the file metrics, change metrics and issues are not calculated again
+            with mock.patch.object(Volg, 'change_metrics', side_effect=Exception('change metrics calculated again')), mock.patch.object(Volg, 'issues', side_effect=Exception('issues loaded again')):
+                resumed, resumed_information = Mynbou(vcs, project_name, release, checkpoint_dir=tmp).release("False")
+
+            # other parameters do not use the checkpoints
+            with self.assertRaises(Exception):
+                with mock.patch.object(Volg, 'change_metrics', side_effect=Exception('change metrics calculated again')):
+                    Mynbou(vcs, project_name, release, checkpoint_dir=tmp).release("False", accumulate=True)
+
+        self.maxDiff = None
+        self.assertEqual(resumed, instances)
+        self.assertEqual(resumed_information, release_information)
+
+    def test_checkpoints_state(self):
+        """With a state the stages of Volg are run again when resuming so that the state gets the commits of the release."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        c.code_entity_states = [ces.id for ces in CodeEntityState.objects.filter(s_key__startswith="CESFORCOMMIT5")]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        instances, release_information = Mynbou(vcs, project_name, release).release("False")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.object(Mynbou, '_file_metrics', side_effect=Exception('2 files in CodeEntityStates for A.java')):
+                with self.assertRaises(Exception):
+                    Mynbou(vcs, project_name, release, checkpoint_dir=tmp).release("False", state=VolgState(vcs.id))
+
+            # the state of the failed run is not saved, the rerun starts with an empty state
+            state = VolgState(vcs.id)
+            resumed, resumed_information = Mynbou(vcs, project_name, release, checkpoint_dir=tmp).release("False", state=state)
+
+        self.assertIn(release, state.releases.keys())
+        self.assertIn(release, state.changes.keys())
+        self.assertTrue(state.renames)
+
+        self.maxDiff = None
+        self.assertEqual(resumed, instances)
+        self.assertEqual(resumed_information, release_information)
+
+    def test_snapshot(self):
+        """A release mined from an exported snapshot without database is the same as the release mined from the database."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        ces1 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE1")
+        ces2 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE2")
+        ces3 = CodeEntityState.objects.get(s_key="CESFORCOMMIT5FILE3")
+        c.code_entity_states = [ObjectId(ces1.id), ObjectId(ces2.id), ObjectId(ces3.id)]
+        c.save()
+
+        # issues which are resolved as fixed by their fields, by their events, never and as won't fix
+        issue_system_id = ObjectId()
+        issues = [Issue(issue_system_id=issue_system_id, external_id='IS-1', status='Closed', resolution='Fixed').save(),
+                  Issue(issue_system_id=issue_system_id, external_id='IS-2', status='Open').save(),
+                  Issue(issue_system_id=issue_system_id, external_id='IS-3', status='Open').save(),
+                  Issue(issue_system_id=issue_system_id, external_id='IS-4', status='Closed', resolution="Won't Fix").save()]
+        Event(external_id='E-1', issue_id=issues[1].id, created_at=datetime.datetime(2018, 1, 1), status='status', new_value='Closed').save()
+        Event(external_id='E-2', issue_id=issues[1].id, created_at=datetime.datetime(2018, 1, 2), status='resolution', new_value='Fixed').save()
+        Event(external_id='E-3', issue_id=issues[2].id, created_at=datetime.datetime(2018, 1, 1), status='resolution', new_value='Fixed').save()
+        c.linked_issue_ids = [issue.id for issue in issues]
+        c.save()
+        resolved_and_fixed = [jira_is_resolved_and_fixed(issue) for issue in issues]
+        self.assertEqual(resolved_and_fixed, [True, True, False, False])
+
+        vcs = VCSSystem.objects.get(url=url)
+        instances, release_information = Mynbou(vcs, project_name, release).release("False")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'snapshot.pickle.gz')
+            export_snapshot(vcs, [release], filename)
+
+            mongoengine.connection.disconnect()
+            repository = load_snapshot(filename)
+            from_snapshot, snapshot_information = Mynbou(repository.vcs, project_name, release, repository=repository).release("False")
+
+            # the decision of pycoshark is exported with the issues
+            exported = repository.issues([issue.id for issue in issues])
+            self.assertEqual([issue.external_id for issue in exported], ['IS-1', 'IS-2', 'IS-3', 'IS-4'])
+            self.assertEqual([repository.is_resolved_and_fixed(issue) for issue in exported], resolved_and_fixed)
+
+            # the snapshot only contains the exported releases
+            with self.assertRaises(Exception):
+                Mynbou(repository.vcs, project_name, 'hash5', repository=repository)
+
+        self.maxDiff = None
+        self.assertEqual(from_snapshot, instances)
+        self.assertEqual(snapshot_information, release_information)
+
+    def test_document_mode(self):
+        """Projected raw documents (lean mode) yield the same release as mongoengine documents."""
+        self._load_fixture('change_metrics')
+
+        release = "hash6"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        c.code_entity_states = [ces.id for ces in CodeEntityState.objects.filter(s_key__startswith="CESFORCOMMIT5")]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        lean = MongoRepository(vcs)
+        self.assertIsInstance(lean.commit(release), Record)
+        self.assertIsInstance(MongoRepository(vcs, lean=False).commit(release), Commit)
+
+        # only the commits which need them are loaded with their code entity states
+        self.assertEqual(len(lean.commit(release).code_entity_states), 3)
+        self.assertEqual(lean.commit(release, fields=[]).code_entity_states, [])
+        self.assertEqual(MongoRepository(vcs, lean=False).commit(release, fields=['committer_date']).code_entity_states, [])
+
+        # the renames on the shortest paths to bug fixes only load commits which are not cached
+        v = Volg.__new__(Volg)
+        v._renames = {release: ([('A.java', 'B.java')], [])}
+        v._additions = {}
+        v._repository = mock.Mock(commit=mock.Mock(side_effect=Exception('commit loaded')))
+        self.assertEqual(v._commit_renames(release), ([('A.java', 'B.java')], []))
+        v._repository = lean
+        self.assertEqual(v._commit_renames('hash5'), v._renames['hash5'])
+
+        instances, release_information = Mynbou(vcs, project_name, release, repository=lean).release("False")
+        full_instances, full_information = Mynbou(vcs, project_name, release, repository=MongoRepository(vcs, lean=False)).release("False")
+
+        self.maxDiff = None
+        self.assertEqual(instances, full_instances)
+        self.assertEqual(release_information, full_information)
+
+    def test_file_cache(self):
+        """Files are resolved via the bounded file cache after the warm-up, the release does not depend on the cache size."""
+        self._load_fixture('rename_tracking')
+
+        release = "hash4"
+        url = "http://www.github.com/smartshark/visualSHARK"
+        project_name = "Testproject"
+
+        c = Commit.objects.get(revision_hash=release)
+        c.code_entity_states = [CodeEntityState.objects.get(s_key="CESFILEARELEASE").id, CodeEntityState.objects.get(s_key="CESFILEBRELEASE").id]
+        c.save()
+
+        vcs = VCSSystem.objects.get(url=url)
+        files = list(File.objects.filter(vcs_system_id=vcs.id))
+
+        cache = FileCache(2)
+        self.assertEqual(cache.warm_up(vcs.id), len(files))
+        self.assertEqual(cache.stats()['size'], 2)
+
+        # the least recently used files are evicted
+        self.assertIsNone(cache.path(files[0].id))
+        self.assertEqual(cache.path(files[-1].id), files[-1].path)
+        self.assertEqual(cache.file_id(vcs.id, files[-1].path), files[-1].id)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+        repository = MongoRepository(vcs, file_cache=cache)
+        self.assertEqual(repository.file(files[0].id).path, files[0].path)
+        self.assertEqual(cache.path(files[0].id), files[0].path)
+        self.assertEqual({f.path for f in repository.files_by_paths([f.path for f in files])}, {f.path for f in files})
+        self.assertEqual({file_id: f.path for file_id, f in repository.files_by_ids([f.id for f in files]).items()}, {f.id: f.path for f in files})
+
+        small = Mynbou(vcs, project_name, release, repository=MongoRepository(vcs, file_cache=FileCache(2))).release("False")
+        disabled = Mynbou(vcs, project_name, release, repository=MongoRepository(vcs, file_cache=FileCache(0))).release("False")
+        shared = Mynbou(vcs, project_name, release).release("False")
+        self.assertEqual(small, disabled)
+        self.assertEqual(shared, disabled)
+        self.assertGreater(shared_file_cache().stats()['hit_rate'], 0)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import types
+import shutil
+import tempfile
+import unittest
+
+from mynbou import instrumentation
+from mynbou.instrumentation import CommandCounter, Report
+
+
+def _event(request_id, command_name, command=None, reply=None):
+    return types.SimpleNamespace(request_id=request_id, command_name=command_name, command=command or {}, reply=reply or {})
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self._command_counter = instrumentation._command_counter
+        instrumentation._command_counter = CommandCounter()
+
+    def tearDown(self):
+        instrumentation._command_counter = self._command_counter
+
+    def test_command_counter(self):
+        counter = instrumentation._command_counter
+        counter.started(_event(1, 'find', {'find': 'commit'}))
+        counter.succeeded(_event(1, 'find', reply={'cursor': {'firstBatch': [{}, {}, {}]}}))
+        counter.started(_event(2, 'getMore', {'getMore': 5, 'collection': 'commit'}))
+        counter.succeeded(_event(2, 'getMore', reply={'cursor': {'nextBatch': [{}]}}))
+        counter.started(_event(3, 'count', {'count': 'file'}))
+        counter.succeeded(_event(3, 'count', reply={'n': 7}))
+        counter.started(_event(4, 'find', {'find': 'file'}))
+        counter.failed(_event(4, 'find'))
+
+        self.assertEqual(counter.snapshot(), {'commit': (2, 4), 'file': (2, 7)})
+
+    def test_report(self):
+        counter = instrumentation._command_counter
+        tmp = tempfile.mkdtemp()
+        try:
+            # without an active report stages do nothing
+            with instrumentation.stage('ignored') as entry:
+                self.assertIsNone(entry)
+
+            report = Report().start()
+            with instrumentation.stage('release'):
+                counter.started(_event(1, 'find', {'find': 'commit'}))
+                counter.succeeded(_event(1, 'find', reply={'cursor': {'firstBatch': [{}, {}]}}))
+                with instrumentation.stage('issues'):
+                    counter.started(_event(2, 'find', {'find': 'issue'}))
+                    counter.succeeded(_event(2, 'find', reply={'cursor': {'firstBatch': [{}]}}))
+            with instrumentation.stage('write'):
+                pass
+            report.stop()
+
+            with instrumentation.stage('ignored') as entry:
+                self.assertIsNone(entry)
+
+            filename = os.path.join(tmp, 'instrumentation.json')
+            report.save(filename)
+            with open(filename, 'r') as f:
+                stages = json.load(f)['stages']
+
+            self.assertEqual([(s['name'], s['path'], s['depth']) for s in stages], [('release', 'release', 0), ('issues', 'release/issues', 1), ('write', 'write', 0)])
+            self.assertEqual(stages[0]['mongo'], {'commit': {'queries': 1, 'documents': 2}, 'issue': {'queries': 1, 'documents': 1}})
+            self.assertEqual(stages[1]['mongo'], {'issue': {'queries': 1, 'documents': 1}})
+            self.assertEqual(stages[2]['mongo'], {})
+            for s in stages:
+                self.assertGreaterEqual(s['wall_time'], 0)
+                self.assertGreaterEqual(s['cpu_time'], 0)
+                self.assertGreaterEqual(s['peak_rss_delta_kb'], 0)
+            self.assertGreaterEqual(stages[0]['wall_time'], stages[1]['wall_time'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from mynbou.output import column_types, write_table, read_table, write_csr, read_csr, write_jsonl, read_jsonl
+
+try:
+    import pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import scipy.sparse
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+except ImportError:
+    HAS_ZSTANDARD = False
+
+
+class TestOutput(unittest.TestCase):
+    """Test columnar binary output formats."""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.columns = ['file', 'AST_assignment', 'SM_method_mi_avg', 'imports', 'BUGFIX_count']
+        # sparse rows, missing keys are 0
+        self.rows = [{'file': 'a/A.java', 'AST_assignment': 3, 'imports': 'java.util.List,java.util.Map', 'BUGFIX_count': 1},
+                     {'file': 'b/B.java', 'SM_method_mi_avg': 1.5, 'imports': ''},
+                     {'file': 'c/C.java', 'AST_assignment': np.int64(7), 'SM_method_mi_avg': math.nan, 'imports': 'java.io.File', 'BUGFIX_count': 2}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _assert_roundtrip(self, output_format):
+        filename = os.path.join(self.tmp, 'release_aggregated.{}'.format(output_format))
+        write_table(filename, output_format, self.columns, self.rows)
+        columns, table = read_table(filename)
+
+        self.assertEqual(self.columns, columns)
+        self.assertEqual(np.int64, table['AST_assignment'].dtype)
+        self.assertEqual(np.float64, table['SM_method_mi_avg'].dtype)
+        self.assertEqual([3, 0, 7], table['AST_assignment'].tolist())
+        self.assertEqual([0, 1.5], table['SM_method_mi_avg'][:2].tolist())
+        self.assertTrue(math.isnan(table['SM_method_mi_avg'][2]))
+        self.assertEqual([1, 0, 2], table['BUGFIX_count'].tolist())
+        self.assertEqual(['a/A.java', 'b/B.java', 'c/C.java'], [str(f) for f in table['file']])
+        self.assertEqual(['java.util.List,java.util.Map', '', 'java.io.File'], [str(i) for i in table['imports']])
+
+    def test_column_types(self):
+        rows = [{'a': 1, 'b': 1, 'c': 1}, {'a': np.int64(2), 'b': 0.5, 'c': 'a'}, {'a': True, 'b': np.float64(2)}, {'d': 1}]
+        self.assertEqual({'a': 'int', 'b': 'float', 'c': 'str', 'e': 'int'}, column_types(['a', 'b', 'c', 'e'], rows))
+
+    def test_npz(self):
+        self._assert_roundtrip('npz')
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_parquet(self):
+        self._assert_roundtrip('parquet')
+
+    @unittest.skipUnless(HAS_PYARROW, 'pyarrow is not installed')
+    def test_arrow(self):
+        self._assert_roundtrip('arrow')
+
+    def test_unknown_format(self):
+        with self.assertRaises(Exception):
+            write_table(os.path.join(self.tmp, 'release.xlsx'), 'xlsx', self.columns, self.rows)
+
+    def test_csr(self):
+        rows = [{'file': 'a/A.java', 'AST_assignment': 3, 'imports': 'java.util.List', 'REFACTOR_Move_Method': 1, 'BUGFIX_issues': []},
+                {'file': 'b/B.java', 'SM_method_mi_avg': 1.5, 'BUGFIX_count': 0},
+                {'file': 'c/C.java', 'SM_method_mi_avg': math.nan, 'BUGFIX_count': 2}]
+        columns = ['file', 'AST_assignment', 'SM_method_mi_avg', 'imports', 'REFACTOR_Move_Method', 'BUGFIX_count']
+        filename = os.path.join(self.tmp, 'release_aggregated.csr.npz')
+        index_filename = os.path.join(self.tmp, 'release_aggregated.columns.txt')
+        write_csr(filename, index_filename, columns, rows)
+
+        data = read_csr(filename, index_filename)
+        self.assertEqual(['AST_assignment', 'SM_method_mi_avg', 'REFACTOR_Move_Method', 'BUGFIX_count'], data['columns'])
+        self.assertEqual((3, 4), data['shape'])
+        self.assertEqual([0, 2, 3, 5], data['indptr'].tolist())
+        self.assertEqual([0, 2, 1, 1, 3], data['indices'].tolist())
+        self.assertEqual([3, 1, 1.5], data['data'][:3].tolist())
+        self.assertTrue(math.isnan(data['data'][3]))
+        self.assertEqual(['a/A.java', 'b/B.java', 'c/C.java'], data['strings']['file'].tolist())
+        self.assertEqual(['java.util.List', '0', '0'], data['strings']['imports'].tolist())
+
+    @unittest.skipUnless(HAS_SCIPY, 'scipy is not installed')
+    def test_csr_scipy(self):
+        rows = [{'file': 'a/A.java', 'AST_assignment': 3}, {'file': 'b/B.java', 'BUGFIX_count': 2}]
+        filename = os.path.join(self.tmp, 'release_aggregated.csr.npz')
+        write_csr(filename, os.path.join(self.tmp, 'release_aggregated.columns.txt'), ['file', 'AST_assignment', 'BUGFIX_count'], rows)
+        self.assertEqual([[3, 0], [0, 2]], scipy.sparse.load_npz(filename).toarray().tolist())
+
+    def _assert_jsonl(self, extension):
+        instances = [{'file': 'a/A.java', 'bug_fixes': [['ISSUE-1', '2019-01-01 00:00:00']], 'SM_method_mi': [1.5, 2]}, {'file': 'b/B.java', 'bug_fixes': []}]
+        filename = os.path.join(self.tmp, 'release.jsonl' + extension)
+
+        write_jsonl(filename, (instance for instance in instances), {'release_date': '2019-02-01 00:00:00'})
+        with read_jsonl(filename, metadata=True) as reader:
+            self.assertEqual({'release_date': '2019-02-01 00:00:00'}, reader.metadata)
+            it = iter(reader)
+            self.assertEqual(instances[0], next(it))
+            self.assertEqual(instances[1:], list(it))
+            self.assertTrue(reader.closed)
+
+        write_jsonl(filename, instances)
+        self.assertEqual(instances, list(read_jsonl(filename)))
+
+        # the file is closed when the context is left before all objects are read
+        with read_jsonl(filename) as reader:
+            it = iter(reader)
+            self.assertEqual(instances[0], next(it))
+            self.assertFalse(reader.closed)
+        self.assertTrue(reader.closed)
+
+    def test_jsonl(self):
+        self._assert_jsonl('')
+
+    def test_jsonl_gzip(self):
+        self._assert_jsonl('.gz')
+
+    @unittest.skipUnless(HAS_ZSTANDARD, 'zstandard is not installed')
+    def test_jsonl_zstd(self):
+        self._assert_jsonl('.zst')
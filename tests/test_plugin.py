@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import copy
+import argparse
+import tempfile
+import unittest
+
+from mynbou.constants import *
+from smartshark_plugin import SmartsharkPlugin, STATIC_COLUMNS
+
+
+def _args(**kwargs):
+    args = dict(release_name='rel', aggregation_cache_size='100000', aggregation_precision='exact', harmonize_processes='1')
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def _cleaned_instances():
+    """Cleaned instances of a small release, IS-1 is fixed in two files and twice in A.java, C.java has no bug fixes."""
+    instances = []
+    for i, name in enumerate(['A.java', 'B.java', 'C.java', 'D.java', 'E.java']):
+        instances.append({'file': name,
+                          'SM_file_loc': 10 * i,
+                          'SM_method_loc': [i, i + 1, 2 * i],
+                          'PMD_ABSALIL': i,
+                          'refactorings': ['rename_method'] * i,
+                          'change_types': [{'computation': i, 'data': 1}],
+                          'linked_issues': [{'priority': 'Major', 'issue_type': 'Bug', 'external_id': 'IS-{}'.format(i)}],
+                          'imports': ['java.util.List', 'java.io.File'],
+                          'bug_fixes': []})
+    instances[0]['bug_fixes'] = [('IS-1', '2018-01-02 00:00:00', 'hash7', 'major', 'bug', '2017-12-01 00:00:00'),
+                                 ('IS-1', '2018-01-05 00:00:00', 'hash9', 'major', 'bug', '2017-12-01 00:00:00')]
+    instances[1]['bug_fixes'] = [('IS-1', '2018-01-02 00:00:00', 'hash7', 'major', 'bug', '2017-12-01 00:00:00'),
+                                 ('IS-2', '2018-01-03 00:00:00', 'hash8', 'minor', 'bug', '2017-12-02 00:00:00')]
+    instances[3]['bug_fixes'] = [('IS-3', '2018-01-04 00:00:00', 'hash8', 'critical', 'bug', '2017-12-03 00:00:00')]
+    return instances
+
+
+class TestPlugin(unittest.TestCase):
+    """Tests the harmonization and the CSV output of the plugin without database."""
+
+    def _harmonize(self, processes):
+        plugin = SmartsharkPlugin(_args(harmonize_processes=str(processes)))
+        aggregated_instances, bug_fixes, keys = plugin._harmonize_instances(copy.deepcopy(_cleaned_instances()))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'rel_aggregated.csv')
+            header = plugin._csv_header(keys, bug_fixes)
+            plugin._write_csv(filename, header, aggregated_instances)
+            with open(filename, 'rb') as f:
+                csv = f.read()
+        return aggregated_instances, bug_fixes, keys, csv
+
+    def test_harmonize_processes(self):
+        """A process pool yields the same harmonized instances and CSV file as a single process."""
+        aggregated_instances, bug_fixes, keys, csv = self._harmonize(1)
+        pool_instances, pool_bug_fixes, pool_keys, pool_csv = self._harmonize(3)
+
+        self.assertEqual(len(aggregated_instances), 5)
+        self.assertEqual(bug_fixes['A.java'], {'IS-1_major_2018-01-05 00:00:00'})
+        self.assertEqual(pool_instances, aggregated_instances)
+        self.assertEqual(pool_bug_fixes, bug_fixes)
+        self.assertEqual(pool_keys, keys)
+        self.assertEqual(pool_csv, csv)
+
+    def test_static_columns(self):
+        """The precomputed columns are the keys which were built for every release before, in the same order."""
+        keys = []
+        for key in SM_METRICS + CLONE_METRICS:
+            if key in ['SM_method_hcpl', 'SM_method_heff', 'SM_method_htrp', 'SM_method_hvol', 'SM_method_hndb']:
+                continue
+            if key.startswith(('SM_method', 'SM_interface', 'SM_enum', 'SM_class', 'SM_annotation')):
+                for name in ['sum', 'min', 'max', 'avg', 'median', 'stdev', 'coefficient_of_variation', 'gini', 'hoover', 'atkinson', 'shannon_entropy', 'generalized_entropy', 'theil']:
+                    keys.append(key + '_' + name)
+            else:
+                keys.append(key)
+        for key in PMD_RMATCH.keys():
+            tmp = key.split('_')
+            keys.append('_'.join(tmp[:-1]) + '_' + tmp[-1].lower())
+        for key in list(set(PMD_RMATCH.values())):
+            keys.append('PMD_severity_' + key.lower())
+        for key in PMD_RULE_TYPES:
+            keys.append('PMD_rule_type_' + key.lower())
+        for change_type in CHANGE_TYPES:
+            keys.append('CHANGE_TYPE_{}'.format(change_type.lower()))
+        for key in REFACTORING_TYPES:
+            keys.append('REFACTOR_{}'.format(key))
+        for key in TICKET_SEVERITIES + ['other']:
+            for key2 in set(TICKET_TYPE_MAPPING.values()):
+                keys.append('ISSUE_{}_{}'.format(key.lower(), key2.lower()))
+        for key in JAVA_NODE_TYPES:
+            keys.append('AST_{}'.format(key.lower()))
+
+        self.assertEqual(STATIC_COLUMNS, list(dict.fromkeys(keys)))
+        self.assertEqual(len(STATIC_COLUMNS), len(set(STATIC_COLUMNS)))
+
+        # every method metric is aggregated to 13 columns in a fixed order
+        loc = [key for key in STATIC_COLUMNS if key.startswith('SM_method_loc_')]
+        self.assertEqual(loc, ['SM_method_loc_sum', 'SM_method_loc_min', 'SM_method_loc_max', 'SM_method_loc_avg', 'SM_method_loc_median', 'SM_method_loc_stdev',
+                               'SM_method_loc_coefficient_of_variation', 'SM_method_loc_gini', 'SM_method_loc_hoover', 'SM_method_loc_atkinson',
+                               'SM_method_loc_shannon_entropy', 'SM_method_loc_generalized_entropy', 'SM_method_loc_theil'])
+        self.assertIn('PMD_absalil', STATIC_COLUMNS)
+        self.assertIn('CHANGE_TYPE_computation', STATIC_COLUMNS)
+        self.assertIn('REFACTOR_rename_method', STATIC_COLUMNS)
+        self.assertIn('AST_compilationunit', STATIC_COLUMNS)
+
+    def test_sparse_rows(self):
+        """The harmonized instances stay sparse, the CSV rows are filled with 0 for missing keys while they are written."""
+        plugin = SmartsharkPlugin(_args())
+        aggregated_instances, bug_fixes, keys = plugin._harmonize_instances(copy.deepcopy(_cleaned_instances()))
+        self.assertEqual(keys[:len(STATIC_COLUMNS)], STATIC_COLUMNS)
+        self.assertNotIn('REFACTOR_move_method', aggregated_instances[0])
+
+        header = plugin._csv_header(keys, bug_fixes)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'rel_aggregated.csv')
+            plugin._write_csv(filename, header, aggregated_instances)
+            with open(filename, 'r') as f:
+                lines = f.read().splitlines()
+
+        columns = lines[0].split(';')
+        rows = [line.split(';') for line in lines[1:]]
+        self.assertEqual([row[columns.index('REFACTOR_rename_method')] for row in rows], ['0', '1', '2', '3', '4'])
+        self.assertEqual([row[columns.index('REFACTOR_move_method')] for row in rows], ['0', '0', '0', '0', '0'])
+
+    def test_csv_header(self):
+        """File first, the other keys sorted, then BUGFIX_count and the issue columns in the order of the files, every issue once."""
+        plugin = SmartsharkPlugin(_args())
+
+        # IS-1 is fixed in A.java and B.java, C.java has no bug fixes
+        bug_fixes = {'A.java': {'IS-1_major_2018-01-05'}, 'B.java': {'IS-1_major_2018-01-05'}, 'D.java': {'IS-3_critical_2018-01-04'}}
+        keys = ['file', 'SM_file_loc', 'BUGFIX_count', 'CHANGE_TYPE_data', 'IS-1_major_2018-01-05', 'IS-3_critical_2018-01-04', 'IS-1_major_2018-01-05']
+        header = plugin._csv_header(keys, bug_fixes)
+        self.assertEqual(header, ['file', 'CHANGE_TYPE_data', 'SM_file_loc', 'BUGFIX_count', 'IS-1_major_2018-01-05', 'IS-3_critical_2018-01-04'])
+
+        instances = [{'file': 'A.java', 'SM_file_loc': 10, 'CHANGE_TYPE_data': 1, 'BUGFIX_count': 1, 'IS-1_major_2018-01-05': 1},
+                     {'file': 'B.java', 'SM_file_loc': 2.5, 'BUGFIX_count': 1, 'IS-1_major_2018-01-05': 1},
+                     {'file': 'C.java', 'SM_file_loc': 0, 'CHANGE_TYPE_data': 3, 'BUGFIX_count': 0},
+                     {'file': 'D.java', 'SM_file_loc': 7, 'BUGFIX_count': 1, 'IS-3_critical_2018-01-04': 1}]
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'rel_aggregated.csv')
+            plugin._write_csv(filename, header, instances)
+            with open(filename, 'rb') as f:
+                csv = f.read()
+
+        self.assertEqual(csv, b'file;CHANGE_TYPE_data;SM_file_loc;BUGFIX_count;IS-1_major_2018-01-05;IS-3_critical_2018-01-04\n'
+                              b'A.java;1;10;1;1;0\n'
+                              b'B.java;0;2.5;1;1;0\n'
+                              b'C.java;3;0;0;0;0\n'
+                              b'D.java;0;7;1;0;1\n')
+
+    def test_csv_header_harmonized(self):
+        """The header of harmonized instances is the same as with the removal and append based construction it replaced."""
+        plugin = SmartsharkPlugin(_args())
+        aggregated_instances, bug_fixes, keys = plugin._harmonize_instances(copy.deepcopy(_cleaned_instances()))
+
+        expected = sorted(list(set(keys)))
+        expected.remove('file')
+        expected.remove('BUGFIX_count')
+        for issues in bug_fixes.values():
+            for i in issues:
+                if i in expected:
+                    expected.remove(i)
+        expected = ['file'] + expected + ['BUGFIX_count']
+        for issues in bug_fixes.values():
+            for i in issues:
+                if i not in expected:
+                    expected.append(i)
+
+        header = plugin._csv_header(keys, bug_fixes)
+        self.assertEqual(header, expected)
+        self.assertEqual(header[-4:], ['BUGFIX_count', 'IS-1_major_2018-01-05 00:00:00', 'IS-2_minor_2018-01-03 00:00:00', 'IS-3_critical_2018-01-04 00:00:00'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from mynbou import core, instrumentation
+from mynbou.path import Volg
+from mynbou.metrics import change
+from mynbou.profiling import Profiler
+
+
+class Worker(object):
+
+    def run(self, n):
+        return self._step(n) + 1
+
+    def _step(self, n):
+        return sum(range(n))
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_trace(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            profiler = Profiler(stats_dir=os.path.join(tmp, 'stats'), targets=[Worker]).start()
+            with instrumentation.stage('release'):
+                with instrumentation.stage('inner') as info:
+                    info['checkpoint'] = True
+                    self.assertEqual(Worker().run(10), 46)
+            with instrumentation.stage('write'):
+                pass
+            profiler.stop()
+
+            # methods are restored and stages are not recorded anymore
+            self.assertFalse(hasattr(Worker.run, '__wrapped__'))
+            self.assertNotIn(profiler, instrumentation._recorders)
+            Worker().run(10)
+
+            filename = os.path.join(tmp, 'trace.json')
+            profiler.save(filename)
+            with open(filename, 'r') as f:
+                events = json.load(f)['traceEvents']
+
+            self.assertEqual([(e['name'], e['cat']) for e in events], [('release', 'stage'), ('inner', 'stage'), ('Worker.run', 'function'), ('Worker._step', 'function'), ('write', 'stage')])
+            self.assertEqual(events[1]['args'], {'checkpoint': True})
+            for e in events:
+                self.assertEqual(e['ph'], 'X')
+                self.assertGreaterEqual(e['dur'], 0)
+
+            # spans are nested within their parents
+            for parent, child in zip(events[:3], events[1:4]):
+                self.assertLessEqual(parent['ts'], child['ts'])
+                self.assertGreaterEqual(parent['ts'] + parent['dur'], child['ts'] + child['dur'])
+
+            # only top level stages are profiled
+            self.assertEqual([os.path.basename(f) for f in profiler.stats_files], ['00_release.pstats', '01_write.pstats'])
+            stats = pstats.Stats(profiler.stats_files[0])
+            self.assertTrue(any(func[2] == '_step' for func in stats.stats.keys()))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_default_targets(self):
+        originals = (core.hassan, change.hassan, change._hassan, Volg.change_metrics, core.Mynbou.release)
+
+        profiler = Profiler().start()
+        self.assertIsNot(core.hassan, originals[0])
+        self.assertIsNot(change.hassan, originals[1])
+        self.assertIsNot(change._hassan, originals[2])
+        self.assertIsNot(Volg.change_metrics, originals[3])
+        profiler.stop()
+
+        self.assertEqual((core.hassan, change.hassan, change._hassan, Volg.change_metrics, core.Mynbou.release), originals)
+
+
+if __name__ == '__main__':
+    unittest.main()
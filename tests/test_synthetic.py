@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mongoengine
+import networkx as nx
+from dateutil.relativedelta import relativedelta
+
+from pycoshark.mongomodels import Commit, File, FileAction
+from mynbou.core import Mynbou
+from mynbou.state import VolgState
+from mynbou.snapshot import export_snapshot, load_snapshot
+from mynbou.repository import MongoRepository, shared_file_cache
+from benchmarks.synthetic import generate_project
+
+
+class RecordingRepository(MongoRepository):
+    """Records which commits are loaded."""
+
+    def __init__(self, vcs):
+        super().__init__(vcs)
+        self.commits_by_date_calls = 0
+        self.loaded = set()
+
+    def commits_by_date(self):
+        self.commits_by_date_calls += 1
+        return super().commits_by_date()
+
+    def commits_by_hashes(self, revision_hashes, fields=None):
+        ret = super().commits_by_hashes(revision_hashes, fields)
+        self.loaded.update(ret.keys())
+        return ret
+
+    def file_actions_for_commits(self, commit_ids, modes=None):
+        ret = super().file_actions_for_commits(commit_ids, modes)
+        self.loaded.update(c.revision_hash for c in Commit.objects.filter(id__in=list(ret.keys())).only('revision_hash'))
+        return ret
+
+
+class TestSynthetic(unittest.TestCase):
+    """Mines a release of a small synthetic project in mongomock."""
+
+    def setUp(self):
+        mongoengine.connection.disconnect()
+        mongoengine.connect('synthetic', host='mongomock://localhost')
+        mongoengine.connection.get_db().client.drop_database('synthetic')
+        shared_file_cache().clear()
+
+    def tearDown(self):
+        mongoengine.connection.disconnect()
+
+    def test_generate_project(self):
+        project = generate_project(commits=60, merge_rate=0.2, files=15, rename_rate=0.2, issues=8, inducing_rate=1.0, seed=3)
+
+        commits = list(Commit.objects.filter(vcs_system_id=project['vcs'].id))
+        self.assertEqual(project['counts']['commit'], len(commits))
+        self.assertTrue(any(len(c.parents) > 1 for c in commits))
+        self.assertTrue(FileAction.objects.filter(mode='R').count() > 0)
+        self.assertEqual(len([c for c in commits if c.fixed_issue_ids]), 8)
+
+        # every file which is not renamed away is a release file
+        renamed = set(fa.old_file_id for fa in FileAction.objects.filter(mode='R'))
+        live = set(f.path for f in File.objects.filter(vcs_system_id=project['vcs'].id) if f.id not in renamed)
+
+        instances, release_information = Mynbou(project['vcs'], project['project_name'], project['release_hash']).release('False')
+        self.assertEqual(set(instances.keys()), live)
+        self.assertTrue(any(instance['bug_fixes'] for instance in instances.values()))
+        self.assertTrue(all(instance['SM_file_loc'] >= 0 for instance in instances.values()))
+        self.assertEqual(release_information['release_revision'], project['release_hash'])
+
+    def test_snapshot(self):
+        """Every type of bug-fixing commits yields the same release from the database and from a snapshot."""
+        project = generate_project(commits=60, merge_rate=0.2, files=15, rename_rate=0.2, issues=8, inducing_rate=1.0, seed=3)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'snapshot.pickle.gz')
+            export_snapshot(project['vcs'], [project['release_hash']], filename)
+            repository = load_snapshot(filename)
+
+        for limit_type in ['False', 'JL+R', 'SZZ']:
+            want = Mynbou(project['vcs'], project['project_name'], project['release_hash']).release(limit_type)
+            have = Mynbou(repository.vcs, project['project_name'], project['release_hash'], repository=repository).release(limit_type)
+            self.assertTrue(any(instance['bug_fixes'] for instance in want[0].values()))
+            self.assertEqual(have, want)
+
+    def test_batch_sizes(self):
+        """The release does not depend on how many commits and files are loaded at once."""
+        project = generate_project(commits=60, merge_rate=0.2, files=15, rename_rate=0.2, issues=8, inducing_rate=1.0, seed=3)
+
+        want = Mynbou(project['vcs'], project['project_name'], project['release_hash']).release('False')
+        with mock.patch('mynbou.path.COMMIT_BATCH_SIZE', 7), mock.patch('mynbou.core.FILE_BATCH_SIZE', 4):
+            have = Mynbou(project['vcs'], project['project_name'], project['release_hash']).release('False')
+        self.assertEqual(have, want)
+
+    def test_incremental_releases(self):
+        """The next release mined with the state of the previous release yields the same results and only loads the commits since the previous release."""
+        project = generate_project(commits=80, merge_rate=0.2, files=15, rename_rate=0.2, issues=8, inducing_rate=1.0, seed=3, releases=2)
+        first, second = project['release_hashes']
+        vcs = project['vcs']
+
+        state = VolgState(vcs.id)
+        for limit_type, release in [('False', first), ('SZZ', first), ('False', second)]:
+            repository = RecordingRepository(vcs)
+            have = Mynbou(vcs, project['project_name'], release, repository=repository).release(limit_type, state=state)
+            want = Mynbou(vcs, project['project_name'], release).release(limit_type)
+            self.assertEqual(have, want)
+
+        graph = nx.DiGraph([(p, c.revision_hash) for c in Commit.objects.filter(vcs_system_id=vcs.id) for p in c.parents])
+        ancestors = nx.ancestors(graph, second)
+        new_commits = ancestors - nx.ancestors(graph, first) - {first}
+
+        # the commits before the first release are neither replayed nor loaded again, except the first release as parent of the new commits
+        self.assertEqual(repository.commits_by_date_calls, 0)
+        self.assertTrue(repository.loaded & new_commits)
+        self.assertLessEqual(repository.loaded & ancestors, new_commits | {first})
+
+        # commits which dropped out of the window of the second release are removed from the state
+        cutoff = Commit.objects.get(revision_hash=second).committer_date - relativedelta(months=6)
+        dates = {c.revision_hash: c.committer_date for c in Commit.objects.filter(vcs_system_id=vcs.id)}
+        self.assertTrue(any(dates[revision_hash] < cutoff for revision_hash in nx.ancestors(graph, first)))
+        for commits in [state.changes, state.dambros, state.renames]:
+            self.assertTrue(commits)
+            self.assertTrue(all(dates[revision_hash] >= cutoff for revision_hash in commits.keys()))
+
+    def _generate(self):
+        project = generate_project(commits=30, files=10, issues=3, seed=5)
+        commits = [(c.revision_hash, c.parents, c.committer_date, c.fixed_issue_ids != []) for c in Commit.objects.filter(vcs_system_id=project['vcs'].id)]
+        files = sorted(f.path for f in File.objects.filter(vcs_system_id=project['vcs'].id))
+        mongoengine.connection.get_db().client.drop_database('synthetic')
+        return project['counts'], commits, files
+
+    def test_deterministic(self):
+        self.assertEqual(self._generate(), self._generate())
+
+
+if __name__ == '__main__':
+    unittest.main()